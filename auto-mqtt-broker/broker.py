@@ -1,50 +1,56 @@
 import argparse
+import multiprocessing
 import os
+import socket
 import threading
 import time
 
 from broker.client_manager import ClientManager
+from broker.listener.event_loop import EventLoop
 from broker.listener.listener import Listener
+from broker.listener.publish_scheduler import PublishScheduler
+from broker.message_generators.message_generator import seed_message_generators
 from broker.subscription_manager import SubscriptionManager
 from util import logger
 from util.config_reader import BrokerConfigReader as ConfigReader
+from util.control_channel import start_control_server
+from util.metrics import SummaryReporter, start_metrics_server
+from util.packet_log import CAPTURE, PACKET_LOG
+from util.stats import STATS, STAT_FIELDS, format_stats
 
+THREADS_ENGINE = "threads"
+EVENT_LOOP_ENGINE = "event-loop"
+# Interval in seconds in which the workers share their stats and the parent process reports them
+STATS_INTERVAL = 5
 
-def main():
-    # Listeners
+
+def run_broker(listener_configs, hostname, engine, reuse_port=False, metrics_port=None, packet_log=None,
+               capture=None, control_port=None):
+    """
+    Create the listeners of the broker and handle client connections until the broker is shut down
+    :param listener_configs: list of @ListenerConfig objects
+    :param hostname: hostname of the broker
+    :param engine: THREADS_ENGINE or EVENT_LOOP_ENGINE
+    :param reuse_port: bind the listeners with SO_REUSEPORT to share the ports with other broker processes
+    :param metrics_port: local port of the Prometheus metrics endpoint, None to disable it
+    :param packet_log: path of the binary packet log, None to disable it
+    :param capture: path of the capture of all sent frames for the REPLAY generator, None to disable it
+    :param control_port: local port of the control channel of the monitor, None to disable it
+    """
     LISTENERS = []
     RUNNING_THREADS = []
-    HOSTNAME = "0.0.0.0"
-    # default configs
-    CONFIG_PATH = os.path.dirname(os.path.realpath(__file__)) + "/broker.config"
-    # argument parser
-    parser = argparse.ArgumentParser("broker.py", description="MQTT Broker supporting Multilateral Security",
-                                     epilog="Developed by Babbadeckl. Questions and Bug-reports can be mailed to "
-                                            "korbinian.spielvogel@uni-passau.de")
-    # argument for config file
-    parser.add_argument('-c', '--config', default=CONFIG_PATH, type=str, dest="config",
-                        metavar="PATH", help="location of the config file for the broker")
-    # argument for hostname
-    parser.add_argument('-H', '--hostname', dest="hostname", help="hostname of the broker", metavar="HOSTNAME",
-                        type=str, default=HOSTNAME)
-    # argument for debug mode
-    parser.add_argument('-d', '--debug', dest="debug", help="turn on the debug mode for the broker",
-                        action='store_true', default=0)
-    args = parser.parse_args()
-    # assign argument values
-    listener_configs = ConfigReader.read_config(args.config)
-    logger.DEBUG = args.debug
-    # assign argument hostname
-    HOSTNAME = args.hostname
     # create SubscriptionManager
     subscription_manager = SubscriptionManager()
     # create StatusManager
     client_manager = ClientManager()
+    # create the auto publish scheduler of the threaded engine, the event loop has its own
+    publish_scheduler = PublishScheduler() if engine == THREADS_ENGINE else None
     # create listeners
     try:
         for listener_config in listener_configs:
-            LISTENERS.append(Listener(listener_config, ip=HOSTNAME, debug=logger.DEBUG,
-                                      subscription_manager=subscription_manager, client_manager=client_manager))
+            LISTENERS.append(Listener(listener_config, ip=hostname, debug=logger.DEBUG,
+                                      subscription_manager=subscription_manager, client_manager=client_manager,
+                                      reuse_port=reuse_port, publish_scheduler=publish_scheduler))
     except SyntaxError:
         logger.logging.error(
             f"Listener config is invalid.")
@@ -56,28 +62,198 @@ def main():
     if logger.DEBUG:
         logger.print_listener_configs(listener_configs)
         logger.print_listeners(LISTENERS)
-    # Creating a listener thread for each initialized listener
-    for listener in LISTENERS:
-        thread = threading.Thread(target=listener.listen, daemon=True)
+    event_loop = None
+    if engine == EVENT_LOOP_ENGINE:
+        # A single thread handles all listeners and their client connections
+        event_loop = EventLoop(LISTENERS, subscription_manager, client_manager, debug=logger.DEBUG)
+        thread = threading.Thread(target=event_loop.run, daemon=True)
         RUNNING_THREADS.append(thread)
         thread.start()
+    else:
+        # Creating a listener thread for each initialized listener
+        for listener in LISTENERS:
+            thread = threading.Thread(target=listener.listen, daemon=True)
+            RUNNING_THREADS.append(thread)
+            thread.start()
+        # A single thread auto publishes to the clients of all listeners
+        threading.Thread(target=publish_scheduler.run, name="publish-scheduler", daemon=True).start()
+    if packet_log is not None:
+        PACKET_LOG.open(packet_log)
+        logger.logging.info(f"Logging packets to '{packet_log}'")
+    if capture is not None:
+        CAPTURE.open(capture, max_bytes=0)
+        logger.logging.info(f"Capturing sent frames to '{capture}'")
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
+        logger.logging.info(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+    if control_port is not None:
+        start_control_server(control_port)
+        logger.logging.info(f"Serving the control channel on 127.0.0.1:{control_port}")
     # Handling server shutdown by CTRL+C
+    summary_reporter = SummaryReporter(time.monotonic)
     try:
         while True:
-            time.sleep(5)
+            time.sleep(STATS_INTERVAL)
+            logger.logging.info(f"Metrics: {summary_reporter.line()}")
     except (Exception, KeyboardInterrupt, SystemExit):
         logger.logging.info("Broker shutdown initiated...")
-        for index, thread in enumerate(RUNNING_THREADS):
-            logger.logging.info(f"Stopping {LISTENERS[index]} ...")
-            LISTENERS[index].running = False
+        if event_loop:
+            logger.logging.info(f"Stopping event loop ...")
+            event_loop.running = False
+            for thread in RUNNING_THREADS:
+                thread.join(1)
+        else:
+            publish_scheduler.running = False
+        for index, listener in enumerate(LISTENERS):
+            logger.logging.info(f"Stopping {listener} ...")
+            listener.running = False
 
-            logger.logging.info(f"Stopping Thread ...")
-            thread.join(1)
+            if not event_loop:
+                logger.logging.info(f"Stopping Thread ...")
+                RUNNING_THREADS[index].join(1)
 
             logger.logging.info(f"Closing Sockets ...")
-            LISTENERS[index].close_sockets()
+            listener.close_sockets()
+        PACKET_LOG.close()
+        CAPTURE.close()
         logger.logging.info("Broker shutdown complete.")
 
 
+def run_worker(worker_index, worker_seed, shared_stats, listener_configs, hostname, engine, metrics_port=None,
+               packet_log=None, capture=None, control_port=None):
+    """
+    Entry point of a broker worker process. Seeds the message generators of the worker, periodically copies the stats
+    of the worker into its slot of the shared stats and runs the broker on the shared ports.
+    :param worker_index: index of the worker, determines its slot in 'shared_stats'
+    :param worker_seed: seed for the message generators of this worker
+    :param shared_stats: shared array that holds the STAT_FIELDS of every worker
+    :param metrics_port: base port of the metrics endpoints, worker i serves its metrics on metrics_port + i
+    :param packet_log: path of the packet log, worker i logs into <name>-i<extension>
+    :param capture: path of the capture, named like the packet log of the worker
+    :param control_port: base port of the control channels, worker i serves its control channel on control_port + i
+    """
+    seed_message_generators(worker_seed)
+    logger.logging.info(f"Started broker worker {worker_index} (pid {os.getpid()}) with seed {worker_seed}")
+
+    def share_stats():
+        offset = worker_index * len(STAT_FIELDS)
+        while True:
+            shared_stats[offset:offset + len(STAT_FIELDS)] = STATS.snapshot()
+            time.sleep(STATS_INTERVAL / 2)
+
+    threading.Thread(target=share_stats, daemon=True).start()
+    run_broker(listener_configs, hostname, engine, reuse_port=True,
+               metrics_port=metrics_port + worker_index if metrics_port is not None else None,
+               packet_log=worker_path(packet_log, worker_index), capture=worker_path(capture, worker_index),
+               control_port=control_port + worker_index if control_port is not None else None)
+
+
+def worker_path(path, worker_index):
+    """
+    :param path: path of a file that is written by every worker, None if it is disabled
+    :param worker_index: index of the worker
+    :return: path of the file of the worker: <name>-i<extension>
+    """
+    if path is None:
+        return None
+    root, extension = os.path.splitext(path)
+    return f"{root}-{worker_index}{extension}"
+
+
+def run_workers(workers, seed, listener_configs, hostname, engine, metrics_port=None, packet_log=None,
+                capture=None, control_port=None):
+    """
+    Fork 'workers' broker processes that bind the same listener ports and report their aggregated stats
+    :param workers: number of worker processes
+    :param seed: base seed, worker i uses seed + i
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        logger.logging.error("Multiple workers require SO_REUSEPORT, which is not supported on this platform.")
+        exit(0)
+
+    context = multiprocessing.get_context("fork")
+    shared_stats = context.Array('Q', workers * len(STAT_FIELDS), lock=False)
+    processes = []
+    for index in range(workers):
+        process = context.Process(target=run_worker, name=f"broker-worker-{index}", daemon=True,
+                                  args=(index, seed + index, shared_stats, listener_configs, hostname, engine,
+                                        metrics_port, packet_log, capture, control_port))
+        processes.append(process)
+        process.start()
+
+    try:
+        while any(process.is_alive() for process in processes):
+            time.sleep(STATS_INTERVAL)
+            totals = [sum(shared_stats[index::len(STAT_FIELDS)]) for index in range(len(STAT_FIELDS))]
+            logger.logging.info(f"Stats of {workers} workers: {format_stats(totals)}")
+    except (Exception, KeyboardInterrupt, SystemExit):
+        logger.logging.info("Waiting for the broker workers to shut down...")
+        for process in processes:
+            process.join(2)
+            if process.is_alive():
+                process.terminate()
+        logger.logging.info("All broker workers stopped.")
+
+
+def main():
+    HOSTNAME = "0.0.0.0"
+    # default configs
+    CONFIG_PATH = os.path.dirname(os.path.realpath(__file__)) + "/broker.config"
+    # argument parser
+    parser = argparse.ArgumentParser("broker.py", description="MQTT Broker supporting Multilateral Security",
+                                     epilog="Developed by Babbadeckl. Questions and Bug-reports can be mailed to "
+                                            "korbinian.spielvogel@uni-passau.de")
+    # argument for config file
+    parser.add_argument('-c', '--config', default=CONFIG_PATH, type=str, dest="config",
+                        metavar="PATH", help="location of the config file for the broker")
+    # argument for hostname
+    parser.add_argument('-H', '--hostname', dest="hostname", help="hostname of the broker", metavar="HOSTNAME",
+                        type=str, default=HOSTNAME)
+    # argument for debug mode
+    parser.add_argument('-d', '--debug', dest="debug", help="turn on the debug mode for the broker",
+                        action='store_true', default=0)
+    # argument for the I/O engine
+    parser.add_argument('-e', '--engine', dest="engine", choices=[THREADS_ENGINE, EVENT_LOOP_ENGINE],
+                        default=THREADS_ENGINE,
+                        help="'threads' runs a thread per client connection, 'event-loop' drives all connections "
+                             "from a single thread with non-blocking sockets")
+    # argument for the number of worker processes
+    parser.add_argument('-w', '--workers', dest="workers", metavar="N", type=int, default=1,
+                        help="number of broker processes that share the listener ports via SO_REUSEPORT")
+    # argument for the seed of the message generators
+    parser.add_argument('-s', '--seed', dest="seed", metavar="SEED", type=int, default=None,
+                        help="seed for the message generators, worker i is seeded with SEED + i")
+    # argument for the metrics endpoint
+    parser.add_argument('-m', '--metrics-port', dest="metrics_port", metavar="PORT", type=int, default=None,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics, worker i uses PORT + i")
+    # argument for the packet log
+    parser.add_argument('-p', '--packet-log', dest="packet_log", metavar="PATH", type=str, default=None,
+                        help="log all received and sent packets into a rotating binary file")
+    # argument for the capture of the sent frames
+    parser.add_argument('--capture', dest="capture", metavar="PATH", type=str, default=None,
+                        help="record all sent frames into a capture file that can be replayed with the REPLAY "
+                             "message generator")
+    # argument for the control channel of the monitor
+    parser.add_argument('--control-port', dest="control_port", metavar="PORT", type=int, default=None,
+                        help="serve the control channel of the monitor on 127.0.0.1:PORT, which reports the test "
+                             "cases of every lifetime of the system under test, worker i uses PORT + i")
+    args = parser.parse_args()
+    # assign argument values
+    listener_configs = ConfigReader.read_config(args.config)
+    logger.configure(args.debug)
+    # assign argument hostname
+    HOSTNAME = args.hostname
+
+    if args.workers > 1:
+        seed = args.seed if args.seed is not None else int.from_bytes(os.urandom(4), "big")
+        run_workers(args.workers, seed, listener_configs, HOSTNAME, args.engine, args.metrics_port, args.packet_log,
+                    args.capture, args.control_port)
+    else:
+        if args.seed is not None:
+            seed_message_generators(args.seed)
+        run_broker(listener_configs, HOSTNAME, args.engine, metrics_port=args.metrics_port,
+                   packet_log=args.packet_log, capture=args.capture, control_port=args.control_port)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,304 @@
+import itertools
+import time
+from abc import ABCMeta, abstractmethod
+
+from broker.listener.outbound_queue import DISCONNECT_POLICY
+from broker.message_generators.message_generator import MessageGenerator
+from packets import enums
+from packets.mqtt_frame_buffer import MQTTFrameBuffer
+from packets.mqtt_packet_manager import MQTTPacketManager
+from util import logger as logger
+from util.control_channel import TEST_CASES
+from util.metrics import ConnectionMetrics, GENERATOR_SECONDS
+from util.packet_log import CAPTURE, PACKET_LOG, RECEIVED, SENT
+from util.exceptions import IncorrectProtocolOrderException, MQTTMessageNotSupportedException
+
+RECV_BUFFER_SIZE = 4096
+
+_connection_ids = itertools.count(1)
+
+
+class ClientHandler(object, metaclass=ABCMeta):
+    """
+    Handles the MQTT protocol of a single client connection, independent of how the socket I/O is driven
+    """
+
+    def __init__(self, client_socket, client_address, listener, subscription_manager, client_manager, debug):
+        self.client_socket = client_socket
+        self.client_address = client_address
+        self._running = True
+
+        self.listener = listener
+        self._subscription_manager = subscription_manager
+        self._client_manager = client_manager
+        self.debug = debug
+        self.client_id = ''
+        self.connection_id = next(_connection_ids)
+        self._frame_buffer = MQTTFrameBuffer()
+        self.metrics = ConnectionMetrics(listener.port, client_address)
+        self._message_generator = None
+        if listener.is_auto_publish:
+            # Each connection draws from its own random stream, see MESSAGE_GENERATOR_SEED
+            self._message_generator = MessageGenerator(
+                listener.message_generator_config.for_stream(self.connection_id))
+            self._generator_seconds = GENERATOR_SECONDS.labels(self._message_generator.get_generator_type())
+
+    @property
+    def running(self):
+        return self._running
+
+    @running.setter
+    def running(self, value):
+        self._running = value
+
+    @property
+    def is_auto_publish(self):
+        return self._message_generator is not None
+
+    @property
+    def is_paced_publish(self):
+        """
+        :return: True if the message generator determines the time between the auto publish messages
+        """
+        return self._message_generator is not None and self._message_generator.is_paced
+
+    def next_publish_interval(self):
+        """
+        :return: seconds until the next message of a paced message generator
+        """
+        return self._message_generator.next_interval()
+
+    def publish(self):
+        """
+        Send the next message of the message generator to the client, called by the @PublishScheduler
+        :return: True if the message was queued
+        """
+        topic = self.listener.message_generator_config.topic
+        start = time.perf_counter()
+        try:
+            msg = self._message_generator.generate()
+        except StopIteration:
+            msg = None
+        self._generator_seconds.observe(time.perf_counter() - start)
+
+        if msg is None:
+            logger.logging.info(f"Exhausted message generator {self._message_generator.get_generator_type()}. "
+                                f"Closing connection.")
+            self.close()
+            return False
+
+        logger.logging.debug("Sent publish message %s in '%s' to Client %s", logger.PacketFormatter(msg), topic,
+                             self.client_id)
+        if not self.send(msg):
+            return False
+        if TEST_CASES.enabled:
+            TEST_CASES.record(self.connection_id, self._message_generator.message_index - 1)
+        self.metrics.published_messages.inc()
+        self.metrics.published_bytes.inc(len(msg))
+        return True
+
+    def send(self, data):
+        """
+        Send data to the client of this connection without blocking, see @_deliver
+        :param data: the packet that should be sent (bytes)
+        :return: False if the packet was not queued because of the high-water mark
+        """
+        return self._deliver(self.client_socket, data, self.client_id)
+
+    def _deliver(self, client_socket, data, client_id):
+        """
+        Queue a packet in the outbound queue of a client and try to write it right away. Remaining data is flushed in
+        the background. If the queue exceeds its high-water mark, the packet is dropped or the client is disconnected,
+        depending on the overflow policy of its listener.
+        :param client_socket: socket of the receiving client
+        :param data: the packet that should be sent (bytes-like)
+        :param client_id: ID of the receiving client, for the log output
+        :return: False if the packet was not queued
+        """
+        queue = self._get_outbound_queue(client_socket)
+        if queue is None:
+            return False
+        try:
+            if not queue.enqueue(data):
+                if queue.overflow_policy == DISCONNECT_POLICY:
+                    logger.logging.warning(f"Outbound queue of client {client_id} exceeded {queue.high_water_mark} "
+                                           f"bytes. Disconnecting.")
+                    self._disconnect(client_socket)
+                elif logger.DEBUG:
+                    logger.logging.debug("Dropped packet (%d bytes) for client %s, %d dropped in total.", len(data),
+                                         client_id, queue.dropped)
+                return False
+            if PACKET_LOG.enabled:
+                PACKET_LOG.log(SENT, queue.connection_id, data)
+            if CAPTURE.enabled:
+                CAPTURE.log(SENT, queue.connection_id, data)
+            if not queue.flush():
+                self._flush_later(queue)
+        except OSError:
+            self._disconnect(client_socket)
+            return False
+        return True
+
+    @abstractmethod
+    def _get_outbound_queue(self, client_socket):
+        """
+        :param client_socket: socket of a client
+        :return: the @OutboundQueue of the client or None if it is not connected
+        """
+
+    @abstractmethod
+    def _flush_later(self, queue):
+        """
+        Send the remaining frames of a queue as soon as the socket is writable again
+        :param queue: the @OutboundQueue
+        """
+
+    @abstractmethod
+    def _disconnect(self, client_socket):
+        """
+        Close the connection of a client whose queue overflowed or whose socket is broken
+        :param client_socket: socket of the client
+        """
+
+    def handle_connect(self, parsed_msg):
+        """
+        Handle the MQTT CONNECT message: update the status of the client to CONN_RECV, store the sent user properties
+        in the ClientManager and set the ClientID. Afterwards send a CONNACK msg back to the client.
+        :param parsed_msg: a parsed version of the received message
+        """
+        try:
+            self._client_manager.add_status(self.client_socket, self.client_address, enums.Status.CONN_RECV)
+            self._client_manager.add_user_property(self.client_socket, self.client_address, parsed_msg['properties'])
+            self._client_manager.add_user_property(self.client_socket, self.client_address,
+                                                   {enums.Properties.Version: parsed_msg['version']})
+            self.client_id = parsed_msg['client_id']
+        except (IncorrectProtocolOrderException, TypeError) as e:
+            logger.logging.error(e)
+            self.close()
+        connack_msg = MQTTPacketManager.prepare_connack(parsed_msg)
+        self.send(connack_msg)
+        logger.logging.info("Sent CONNACK to client %s.", parsed_msg['client_id'])
+
+    def handle_publish(self, parsed_msg):
+        """
+        Handle the MQTT PUBLISH message: check if the client has a valid status (CONN_RECV or PUB_RECV), then update the
+        client status to PUB_RECV.
+        :param parsed_msg: a parsed version of the received message
+        """
+        if self._client_manager.get_client_status(self.client_socket, self.client_address) in [enums.Status.CONN_RECV,
+                                                                                               enums.Status.PUB_RECV]:
+            self._client_manager.add_status(self.client_socket, self.client_address, enums.Status.PUB_RECV)
+            topic = parsed_msg['topic']
+            raw_packet = parsed_msg['raw_packet']
+            for sub in self._subscription_manager.get_topic_subscribers(topic):
+                # The payload is not decoded for the log output to keep the forwarding independent of its size
+                logger.logging.info("Sent publish message (%d bytes) in '%s' to Client %s", len(raw_packet), topic,
+                                    sub['client_id'])
+                self._send_to_subscriber(sub, raw_packet)
+        else:
+            raise IncorrectProtocolOrderException(
+                f"Received PUBLISH message from client {self.client_address} before CONNECT. Abort!")
+
+    def _send_to_subscriber(self, subscriber, packet):
+        """
+        Forward a packet to a subscriber of the SubscriptionManager. A stalled subscriber does not block the publisher,
+        see @_deliver.
+        :param subscriber: subscriber entry of the SubscriptionManager
+        :param packet: the raw packet that should be forwarded
+        """
+        self._deliver(subscriber['client_socket'], packet, subscriber['client_id'])
+
+    def handle_subscribe(self, parsed_msg):
+        """
+        Handle the MQTT SUBSCRIBE message: check if the client has a valid status (CONN_RECV or SUB_RECV), then update
+        the client status to SUB_RECV. Add the client to the subscriber list and send a PUBACK message back to the
+        client.
+        :param parsed_msg: a parsed version of the received message
+        """
+        if self._client_manager.get_client_status(self.client_socket, self.client_address) in [enums.Status.CONN_RECV,
+                                                                                               enums.Status.SUB_RECV]:
+            self._client_manager.add_status(self.client_socket, self.client_address, enums.Status.SUB_RECV)
+            topic = parsed_msg['topic']
+            self._subscription_manager.add_subscriber(self.client_socket, self.client_address, topic, self.client_id)
+            logger.logging.info(
+                f"- Client {self.client_id} subscribed successfully to topic: '{topic}' on port {self.listener.port}")
+
+            suback_msg = MQTTPacketManager.prepare_suback(parsed_msg)
+            self.send(suback_msg)
+            logger.logging.info("Sent SUBACK to client %s", self.client_id)
+        else:
+            raise IncorrectProtocolOrderException(
+                f"Received SUBSCRIBE message from client {self.client_id} before CONNECT. Abort!")
+
+    def handle_pingreq(self, parsed_msg):
+        """
+        Handle the MQTT PINGREQ message: Send a PINGRESP back to the client.
+        :param parsed_msg: a parsed version of the received message (FOR FUTURE USE)
+        :return:
+        """
+        pingresp_msg = MQTTPacketManager.prepare_pingresp()
+        self.send(pingresp_msg)
+        logger.logging.info("Sent PINGRESP to client %s.", self.client_address)
+
+    def handle_disconnect(self, parsed_msg):
+        """
+        Handle the MQTT DISCONNECT message: update the status of the client to DISCONNECTED and remove the client
+        , if necessary, from the all subscription lists. Finally close the responsible client connection.
+        :param parsed_msg: a parsed version of the received message (FOR FUTURE USE)
+        """
+        self._client_manager.add_status(self.client_socket, self.client_address, enums.Status.DISCONNECTED)
+        self._subscription_manager.remove_subscriber(self.client_socket, self.client_address, self.client_id)
+        self.close()
+
+    def _process_data(self, data):
+        """
+        Reassemble the received data into complete MQTT messages and handle each of them
+        :param data: the bytes received on the client socket
+        """
+        self.metrics.received_bytes.inc(len(data))
+        for msg in self._frame_buffer.feed(data):
+            try:
+                self._process_msg(msg)
+            except MQTTMessageNotSupportedException as e:
+                # The packet is ignored, the following packets of the same data are still handled
+                logger.logging.error(e)
+
+    def _process_msg(self, msg):
+        if PACKET_LOG.enabled:
+            PACKET_LOG.log(RECEIVED, self.connection_id, msg)
+        if logger.DEBUG:
+            logger.logging.debug("Received raw message on Port %s: %s", self.listener.port, logger.PacketFormatter(msg))
+        parsed_msg = MQTTPacketManager.parse_packet(msg, self.client_socket, self.client_address,
+                                                    self._client_manager)
+        if parsed_msg['identifier'] == enums.PacketIdentifer.CONNECT:
+            self._log_received_packet(msg, parsed_msg, parsed_msg['client_id'])
+            self.handle_connect(parsed_msg)
+        elif parsed_msg['identifier'] == enums.PacketIdentifer.PUBLISH:
+            self._log_received_packet(msg, parsed_msg, self.client_id)
+            self.handle_publish(parsed_msg)
+        elif parsed_msg['identifier'] == enums.PacketIdentifer.SUBSCRIBE:
+            self._log_received_packet(msg, parsed_msg, self.client_id)
+            self.handle_subscribe(parsed_msg)
+        elif parsed_msg['identifier'] == enums.PacketIdentifer.PINGREQ:
+            self._log_received_packet(msg, parsed_msg, self.client_id)
+            self.handle_pingreq(parsed_msg)
+        elif parsed_msg['identifier'] == enums.PacketIdentifer.DISCONNECT:
+            self._log_received_packet(msg, parsed_msg, self.client_id)
+            self.handle_disconnect(parsed_msg)
+        else:
+            raise MQTTMessageNotSupportedException(
+                f'Client {self.client_address} sent a message with identifier: '
+                f'`{parsed_msg["identifier"]}`. Not supported, therefore ignored!')
+
+    def _log_received_packet(self, msg, parsed_msg, client_id):
+        logger.logging.info("Received %s message from Client %s on Port %s: %s", parsed_msg['identifier'].name,
+                            client_id, self.listener.port, logger.PacketFormatter(msg))
+
+    def close(self):
+        """
+        Close the client connection
+        """
+        logger.logging.info(f"- Client {self.client_id} disconnected!")
+        self.metrics.close()
+        self.client_socket.close()
+        self.listener.remove_client_thread(self)
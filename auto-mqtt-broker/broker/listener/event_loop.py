@@ -0,0 +1,202 @@
+import selectors
+
+from broker.listener.client_handler import ClientHandler, RECV_BUFFER_SIZE
+from broker.listener.outbound_queue import OutboundQueue
+from broker.listener.publish_scheduler import PublishScheduler
+from packets import enums
+from util import logger
+from util.stats import STATS
+from util.exceptions import IncorrectProtocolOrderException, MQTTMessageNotSupportedException, \
+    MalformedPacketException
+
+# Upper bound for a single select call, so that a stopped event loop is noticed
+MAX_SELECT_TIMEOUT = 1.0
+
+
+class EventLoopClient(ClientHandler):
+    """
+    Handles a single non-blocking client connection that is driven by the @EventLoop
+    """
+
+    def __init__(self, client_socket, client_address, listener, subscription_manager, client_manager, event_loop,
+                 debug):
+        super().__init__(client_socket, client_address, listener, subscription_manager, client_manager, debug)
+        self._event_loop = event_loop
+        self._outbound = OutboundQueue(client_socket, listener.outbound_high_water_mark,
+                                       listener.outbound_overflow_policy, self.metrics, self.connection_id)
+        self.metrics.set_queue(self._outbound)
+
+    @property
+    def has_pending_data(self):
+        return len(self._outbound) > 0
+
+    @property
+    def outbound_queue(self):
+        return self._outbound
+
+    def flush(self):
+        """
+        Write as many of the queued frames as the socket accepts
+        """
+        if self._outbound.flush():
+            self._event_loop.update_interest(self)
+
+    def _get_outbound_queue(self, client_socket):
+        connection = self._event_loop.get_connection(client_socket)
+        return connection.outbound_queue if connection is not None else None
+
+    def _flush_later(self, queue):
+        connection = self._event_loop.get_connection(queue.client_socket)
+        if connection is not None:
+            self._event_loop.update_interest(connection)
+
+    def _disconnect(self, client_socket):
+        connection = self._event_loop.get_connection(client_socket)
+        if connection is not None:
+            connection.close()
+
+    def on_readable(self):
+        """
+        Read the available data from the socket and handle the contained MQTT messages
+        """
+        data = self.client_socket.recv(RECV_BUFFER_SIZE)
+        if not data:
+            self.close()
+            return
+        self._process_data(data)
+
+    def close(self):
+        """
+        Unregister the connection from the event loop and close it
+        """
+        if not self._running:
+            return
+        self._running = False
+        self._event_loop.unregister(self)
+        super().close()
+
+
+class EventLoop(object):
+    """
+    Single-threaded broker engine. Accepts, reads, dispatches and auto-publishes for all connections of all listeners
+    with non-blocking sockets, instead of running two threads per connection.
+    """
+
+    def __init__(self, listeners, subscription_manager, client_manager, debug=0):
+        self._listeners = listeners
+        self._subscription_manager = subscription_manager
+        self._client_manager = client_manager
+        self.debug = debug
+        self._selector = selectors.DefaultSelector()
+        self._publish_scheduler = PublishScheduler()
+        self._running = True
+
+    @property
+    def running(self):
+        return self._running
+
+    @running.setter
+    def running(self, value):
+        self._running = value
+
+    def run(self):
+        """
+        Run the event loop until it is stopped
+        """
+        for listener in self._listeners:
+            listener.sock.setblocking(False)
+            self._selector.register(listener.sock, selectors.EVENT_READ, listener)
+            logger.logging.info(f"{listener} running ...")
+
+        while self._running and all(listener.running for listener in self._listeners):
+            for key, mask in self._selector.select(self._next_timeout()):
+                if isinstance(key.data, EventLoopClient):
+                    self._handle_client_event(key.data, mask)
+                else:
+                    self._accept(key.data)
+            self._publish_scheduler.run_due_publishes()
+
+    def _accept(self, listener):
+        while True:
+            try:
+                client_socket, client_address = listener.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionAbortedError:
+                logger.logging.info("Closed socket connection of Listener.")
+                return
+
+            STATS.record_connection()
+            client_socket.setblocking(False)
+            try:
+                client = EventLoopClient(client_socket, client_address, listener, self._subscription_manager,
+                                         self._client_manager, self, self.debug)
+            except Exception:
+                # e.g. an invalid message generator configuration, only this connection is affected
+                logger.logging.exception(f"Could not set up the connection of {client_address}. Closing it.")
+                client_socket.close()
+                continue
+            self._client_manager.add_status(client_socket, client_address, enums.Status.FRESH)
+            listener.open_sockets[str(client_address) + '_LT'] = client
+            self._selector.register(client_socket, selectors.EVENT_READ, client)
+
+            if client.is_auto_publish:
+                self._publish_scheduler.schedule(client)
+
+    def _handle_client_event(self, client, mask):
+        try:
+            if mask & selectors.EVENT_WRITE:
+                client.flush()
+            if mask & selectors.EVENT_READ and client.running:
+                client.on_readable()
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            client.close()
+        except MQTTMessageNotSupportedException as e:
+            logger.logging.error(e)
+        except (IncorrectProtocolOrderException, MalformedPacketException, TypeError) as e:
+            logger.logging.error(e)
+            client.close()
+        except Exception:
+            # e.g. a packet that the parser cannot handle, only this client is affected and the loop keeps running
+            logger.logging.exception(f"Could not handle the data of Client {client.client_address}. Closing it.")
+            client.close()
+
+    def _next_timeout(self):
+        timeout = self._publish_scheduler.next_timeout()
+        return MAX_SELECT_TIMEOUT if timeout is None else min(MAX_SELECT_TIMEOUT, timeout)
+
+    def get_connection(self, client_socket):
+        """
+        Returns the client that is registered for a certain socket
+        :param client_socket: socket of the client
+        :return: @EventLoopClient or None if the socket is not registered
+        """
+        try:
+            return self._selector.get_key(client_socket).data
+        except (KeyError, ValueError):
+            return None
+
+    def update_interest(self, client):
+        """
+        Register the client for write events if it has buffered outbound data, otherwise only for read events
+        :param client: the @EventLoopClient
+        """
+        events = selectors.EVENT_READ
+        if client.has_pending_data:
+            events |= selectors.EVENT_WRITE
+        try:
+            self._selector.modify(client.client_socket, events, client)
+        except (KeyError, ValueError):
+            pass
+
+    def unregister(self, client):
+        try:
+            self._selector.unregister(client.client_socket)
+        except (KeyError, ValueError):
+            pass
+
+    def close(self):
+        self._running = False
+        self._selector.close()
@@ -1,9 +1,9 @@
 import socket
 
 import util.logger as logger
-from broker.listener.auto_publish_client_thread import AutoPublishClientThread
 from broker.listener.client_thread import ClientThread
 from util.config_reader import ListenerConfig
+from util.stats import STATS
 
 ALLOWED_CONNECTIONS = 10
 
@@ -13,20 +13,37 @@ class Listener(object):
     MQTT Listener.
     """
 
-    def __init__(self, config: ListenerConfig, subscription_manager, client_manager, ip, debug=0):
+    def __init__(self, config: ListenerConfig, subscription_manager, client_manager, ip, debug=0, reuse_port=False,
+                 publish_scheduler=None):
         """
         Constructor for the MQTT Listener
         :param config: contains the initialized config setting
         :param ip: ip of the listener
         :param debug: debug mode on/off
+        :param reuse_port: bind with SO_REUSEPORT, so that several broker processes can share the port
+        :param publish_scheduler: @PublishScheduler that auto publishes to the accepted clients of the threaded engine
         """
         self._ip = ip
         self._port = config.port
         self._is_auto_publish = config.is_auto_publish
         self._auto_publish_interval = config.auto_publish_interval
+        self._auto_publish_jitter = config.auto_publish_jitter
+        self._auto_publish_start_delay = config.auto_publish_start_delay
+        self._auto_publish_burst = config.auto_publish_burst
+        self._auto_publish_rate = config.auto_publish_rate
+        self._auto_publish_ramp_up = config.auto_publish_ramp_up
+        self._auto_publish_ramp_up_duration = config.auto_publish_ramp_up_duration
+        self._auto_publish_ramp_up_steps = config.auto_publish_ramp_up_steps
+        self._auto_publish_max_duration = config.auto_publish_max_duration
+        self._publish_scheduler = publish_scheduler
         self._message_generator_config = config.message_generator_config
+        self._outbound_high_water_mark = config.outbound_high_water_mark
+        self._outbound_overflow_policy = config.outbound_overflow_policy
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # The kernel distributes the incoming connections between all sockets bound to the port
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind((self._ip, self._port))
         self.sock.listen(ALLOWED_CONNECTIONS)
         self._running = True
@@ -41,25 +58,28 @@ class Listener(object):
     def listen(self):
         """
         Listens for incoming socket connections to the broker port and creates a @ClientThread for each unique
-        connection, that then takes over the task of listening for messages on the established socket.
+        connection, that then takes over the task of listening for messages on the established socket. If auto
+        publishing is enabled, the client is added to the @PublishScheduler.
         """
         logger.logging.info(f"{self.__str__()} running ...")
         while self._running:
             try:
                 client_socket, client_address = self.sock.accept()
                 if client_socket and client_address:
-                    client_thread = ClientThread(client_socket, client_address, self, self._subscription_manager,
-                                                 self._client_manager, self.debug)
+                    STATS.record_connection()
+                    try:
+                        client_thread = ClientThread(client_socket, client_address, self, self._subscription_manager,
+                                                     self._client_manager, self.debug)
+                    except Exception:
+                        # e.g. an invalid message generator configuration, only this connection is affected
+                        logger.logging.exception(f"Could not set up the connection of {client_address}. Closing it.")
+                        client_socket.close()
+                        continue
                     self.open_sockets[str(client_address) + '_LT'] = client_thread
                     client_thread.start()
 
                     if self._is_auto_publish:
-                        client_thread = AutoPublishClientThread(client_socket, client_address, self,
-                                                                self._subscription_manager, self._client_manager,
-                                                                self._auto_publish_interval,
-                                                                self._message_generator_config, self.debug)
-                        self.open_sockets[str(client_address) + '_APT'] = client_thread
-                        client_thread.start()
+                        self._publish_scheduler.schedule(client_thread)
             except ConnectionAbortedError:
                 logger.logging.info("Closed socket connection of Listener.")
 
@@ -83,6 +103,58 @@ class Listener(object):
     def running(self, value):
         self._running = value
 
+    @property
+    def is_auto_publish(self):
+        return self._is_auto_publish
+
+    @property
+    def auto_publish_interval(self):
+        return self._auto_publish_interval
+
+    @property
+    def auto_publish_jitter(self):
+        return self._auto_publish_jitter
+
+    @property
+    def auto_publish_start_delay(self):
+        return self._auto_publish_start_delay
+
+    @property
+    def auto_publish_burst(self):
+        return self._auto_publish_burst
+
+    @property
+    def auto_publish_rate(self):
+        return self._auto_publish_rate
+
+    @property
+    def auto_publish_ramp_up(self):
+        return self._auto_publish_ramp_up
+
+    @property
+    def auto_publish_ramp_up_duration(self):
+        return self._auto_publish_ramp_up_duration
+
+    @property
+    def auto_publish_ramp_up_steps(self):
+        return self._auto_publish_ramp_up_steps
+
+    @property
+    def auto_publish_max_duration(self):
+        return self._auto_publish_max_duration
+
+    @property
+    def message_generator_config(self):
+        return self._message_generator_config
+
+    @property
+    def outbound_high_water_mark(self):
+        return self._outbound_high_water_mark
+
+    @property
+    def outbound_overflow_policy(self):
+        return self._outbound_overflow_policy
+
     @property
     def port(self):
         return self._port
@@ -94,6 +166,4 @@ class Listener(object):
     def remove_client_thread(self, client_thread):
         if self.open_sockets.get(str(client_thread.client_address) + '_LT'):
             self.open_sockets.pop(str(client_thread.client_address) + '_LT')
-        if self.open_sockets.get(str(client_thread.client_address) + '_APT'):
-            self.open_sockets.pop(str(client_thread.client_address) + '_APT')
         logger.logging.info(f"- Successfully closed threads that managed '{client_thread.client_address}'")
@@ -0,0 +1,191 @@
+import collections
+import os
+import selectors
+import socket
+import threading
+
+# Policies for frames that would exceed the high-water mark of a queue
+DROP_POLICY = "drop"
+DISCONNECT_POLICY = "disconnect"
+OVERFLOW_POLICIES = (DROP_POLICY, DISCONNECT_POLICY)
+
+DEFAULT_HIGH_WATER_MARK = 4 * 1024 * 1024
+DEFAULT_OVERFLOW_POLICY = DROP_POLICY
+# Maximum number of frames that are passed to a single sendmsg call
+try:
+    MAX_SEND_SEGMENTS = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    MAX_SEND_SEGMENTS = 1024
+# Timeout of the flusher thread while it waits for writable sockets, so that new queues are picked up
+FLUSH_INTERVAL = 0.05
+
+# Lets sendmsg return instead of blocking, even on the blocking sockets of the threaded engine
+_SEND_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class OutboundQueue(object):
+    """
+    Queue of frames that still have to be sent to one client. Frames are written with non-blocking scatter/gather
+    sendmsg calls, so a client that does not read its socket never blocks the sender. At most 'high_water_mark'
+    bytes are queued, further frames are rejected and handled according to the overflow policy by the caller.
+    """
+
+    def __init__(self, client_socket, high_water_mark=DEFAULT_HIGH_WATER_MARK,
+                 overflow_policy=DEFAULT_OVERFLOW_POLICY, metrics=None, connection_id=None):
+        """
+        :param client_socket: socket of the client
+        :param high_water_mark: maximum number of queued bytes
+        :param overflow_policy: DROP_POLICY or DISCONNECT_POLICY
+        :param metrics: @ConnectionMetrics of the client that count the queued and dropped frames
+        :param connection_id: ID of the client connection, for the packet log
+        """
+        self.client_socket = client_socket
+        self.connection_id = connection_id
+        self.metrics = metrics
+        self.high_water_mark = high_water_mark
+        self.overflow_policy = overflow_policy
+        self.closed = False
+        self.dropped = 0
+        self._frames = collections.deque()
+        self._queued_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def queued_bytes(self):
+        return self._queued_bytes
+
+    def enqueue(self, frame):
+        """
+        Append a frame to the queue
+        :param frame: the encoded frame (bytes-like)
+        :return: False if the frame exceeds the high-water mark and was not queued
+        """
+        with self._lock:
+            if self._frames and self._queued_bytes + len(frame) > self.high_water_mark:
+                self.dropped += 1
+                if self.metrics is not None:
+                    self.metrics.dropped_messages.inc()
+                return False
+            self._frames.append(frame)
+            self._queued_bytes += len(frame)
+        if self.metrics is not None:
+            self.metrics.sent_messages.inc()
+            self.metrics.sent_bytes.inc(len(frame))
+        return True
+
+    def flush(self):
+        """
+        Write as many queued frames as the socket accepts without blocking
+        :return: True if the queue is empty afterwards
+        :raises OSError: if the connection is broken
+        """
+        with self._lock:
+            frames = self._frames
+            while frames:
+                segments = frames if len(frames) <= MAX_SEND_SEGMENTS else \
+                    [frames[index] for index in range(MAX_SEND_SEGMENTS)]
+                try:
+                    sent = self.client_socket.sendmsg(segments, (), _SEND_FLAGS)
+                except (BlockingIOError, InterruptedError):
+                    return False
+                self._queued_bytes -= sent
+                while sent:
+                    frame_length = len(frames[0])
+                    if sent < frame_length:
+                        frames[0] = memoryview(frames[0])[sent:]
+                        return False
+                    frames.popleft()
+                    sent -= frame_length
+            return True
+
+
+class OutboundFlusher(object):
+    """
+    Outbound queues of the threaded engine. A single background thread waits until the sockets with queued frames
+    are writable and flushes them, instead of blocking the threads of the publishing clients.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, client_socket, high_water_mark=DEFAULT_HIGH_WATER_MARK,
+                 overflow_policy=DEFAULT_OVERFLOW_POLICY, metrics=None, connection_id=None):
+        """
+        :return: the @OutboundQueue of a socket, see @OutboundQueue for the parameters
+        """
+        with self._lock:
+            queue = self._queues.get(client_socket)
+            if queue is None:
+                queue = OutboundQueue(client_socket, high_water_mark, overflow_policy, metrics, connection_id)
+                self._queues[client_socket] = queue
+            return queue
+
+    def unregister(self, client_socket):
+        with self._lock:
+            queue = self._queues.pop(client_socket, None)
+            if queue is not None:
+                queue.closed = True
+
+    def get_queue(self, client_socket):
+        """
+        :return: the @OutboundQueue of a socket or None if the socket is not registered
+        """
+        return self._queues.get(client_socket)
+
+    def flush_later(self, queue):
+        """
+        Let the flusher thread send the remaining frames of a queue as soon as its socket is writable
+        :param queue: the @OutboundQueue
+        """
+        with self._lock:
+            self._pending.add(queue)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="outbound-flusher", daemon=True)
+                self._thread.start()
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, set()
+                if not pending and not self._selector.get_map():
+                    self._wakeup.clear()
+            if not pending and not self._selector.get_map():
+                self._wakeup.wait()
+                continue
+
+            # Forget the sockets of closed connections before their file descriptors are reused
+            for key in list(self._selector.get_map().values()):
+                if key.data.closed:
+                    self._selector.unregister(key.fileobj)
+
+            for queue in pending:
+                if queue.closed:
+                    continue
+                try:
+                    self._selector.register(queue.client_socket, selectors.EVENT_WRITE, queue)
+                except KeyError:
+                    # already waiting for the socket
+                    self._selector.modify(queue.client_socket, selectors.EVENT_WRITE, queue)
+                except (ValueError, OSError):
+                    queue.closed = True
+
+            for key, _ in self._selector.select(FLUSH_INTERVAL):
+                queue = key.data
+                try:
+                    if not queue.flush():
+                        continue
+                except OSError:
+                    queue.closed = True
+                self._selector.unregister(key.fileobj)
+
+
+OUTBOUND_FLUSHER = OutboundFlusher()
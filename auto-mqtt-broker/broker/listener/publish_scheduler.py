@@ -0,0 +1,213 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from broker.listener.token_bucket import TokenBucket
+from util import logger
+from util.metrics import PUBLISH_LAG_SECONDS
+from util.exceptions import IncorrectProtocolOrderException
+
+# Default delay before the first auto publish message of a connection (AUTO_PUBLISH_START_DELAY)
+AUTO_PUBLISH_START_DELAY = 2
+
+
+class AutoPublishTask(object):
+    """
+    Auto publish state of a single connection: the token bucket of the target rate, the end of the maximum duration
+    and the number of published messages for the achieved rate.
+    """
+
+    def __init__(self, client, start):
+        """
+        :param client: the @ClientHandler
+        :param start: time.monotonic() timestamp of the first publish
+        """
+        listener = client.listener
+        self.client = client
+        self.start = start
+        self.published = 0
+        self.lag_seconds = PUBLISH_LAG_SECONDS.labels(str(listener.port))
+        self.end = start + listener.auto_publish_max_duration if listener.auto_publish_max_duration else None
+        self.bucket = None
+        self.is_paced = client.is_paced_publish
+        if listener.auto_publish_rate and not self.is_paced:
+            self.bucket = TokenBucket(listener.auto_publish_rate, listener.auto_publish_burst,
+                                      listener.auto_publish_ramp_up, listener.auto_publish_ramp_up_duration,
+                                      listener.auto_publish_ramp_up_steps, start)
+
+    def is_finished(self, now):
+        return not self.client.running or (self.end is not None and now >= self.end)
+
+    def message_count(self, now):
+        """
+        :param now: time.monotonic() timestamp
+        :return: number of messages that are due now
+        """
+        if self.is_paced:
+            return 1
+        if self.bucket is not None:
+            return self.bucket.consume(now)
+        return self.client.listener.auto_publish_burst
+
+    def report(self, now):
+        """
+        Log the achieved publish rate of the connection
+        :param now: time.monotonic() timestamp
+        """
+        duration = max(now - self.start, 0.0)
+        achieved_rate = self.published / duration if duration > 0 else 0.0
+        target = f" (target: {self.bucket.rate:.1f} msgs/s)" if self.bucket is not None else ""
+        logger.logging.info(f"Auto published {self.published} messages to Client {self.client.client_id} "
+                            f"{self.client.client_address} in {duration:.1f} s: {achieved_rate:.1f} msgs/s{target}")
+
+
+class PublishScheduler(object):
+    """
+    Owns the next auto publish deadline of every connection in a heap and fires the due publishes in batches.
+    The deadlines follow a fixed timeline of 'auto_publish_interval' steps per connection, so the time spent on
+    sending does not add up as drift. A random delay of up to 'auto_publish_jitter' seconds is added to each deadline
+    without shifting the timeline, and 'auto_publish_burst' messages are sent back to back per deadline.
+    If 'auto_publish_rate' is set, the interval is replaced by a @TokenBucket with the rate and 'auto_publish_burst'
+    as capacity. Paced message generators (e.g. REPLAY) determine the time between their messages themselves.
+    After 'auto_publish_max_duration' seconds, publishing stops and the achieved rate is logged.
+    The threaded engine runs the scheduler in its own thread (@run), the event loop calls @next_timeout and
+    @run_due_publishes itself.
+    """
+
+    def __init__(self, rng=None):
+        """
+        :param rng: random.Random instance for the jitter. By default, the jitter does not consume values of the
+        'random' module, so that seeded message generators stay reproducible.
+        """
+        # Heap of (deadline, sequence number, timeline slot, @AutoPublishTask)
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._rng = rng or random.Random()
+        self._running = True
+
+    @property
+    def running(self):
+        return self._running
+
+    @running.setter
+    def running(self, value):
+        with self._condition:
+            self._running = value
+            self._condition.notify()
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def schedule(self, client, delay=None):
+        """
+        Start auto publishing to a client
+        :param client: the @ClientHandler, its listener provides the auto publish settings
+        :param delay: seconds until the first publish, the AUTO_PUBLISH_START_DELAY of the listener by default
+        """
+        start = time.monotonic() + (client.listener.auto_publish_start_delay if delay is None else delay)
+        with self._condition:
+            self._push(AutoPublishTask(client, start), start)
+            self._condition.notify()
+
+    def _push(self, task, slot):
+        jitter = task.client.listener.auto_publish_jitter
+        deadline = slot + self._rng.random() * jitter if jitter else slot
+        heapq.heappush(self._schedule, (deadline, next(self._sequence), slot, task))
+
+    def next_timeout(self):
+        """
+        :return: seconds until the next deadline or None if no publish is scheduled
+        """
+        if not self._schedule:
+            return None
+        return max(0.0, self._schedule[0][0] - time.monotonic())
+
+    def run_due_publishes(self):
+        """
+        Publish to all clients whose deadline has passed and schedule their next deadline
+        """
+        now = time.monotonic()
+        with self._condition:
+            due = []
+            while self._schedule and self._schedule[0][0] <= now:
+                due.append(heapq.heappop(self._schedule))
+
+        rescheduled = []
+        for deadline, _, slot, task in due:
+            try:
+                next_slot = self._run_task(task, deadline, slot, now)
+            except Exception:
+                # A failing client must neither stop the scheduler nor the publishes of the other due clients
+                logger.logging.exception(f"Auto publishing to client {task.client.client_id} failed. Closing it.")
+                self._close(task.client)
+                continue
+            if next_slot is not None:
+                rescheduled.append((task, next_slot))
+
+        if rescheduled:
+            with self._condition:
+                for task, slot in rescheduled:
+                    self._push(task, slot)
+
+    def _run_task(self, task, deadline, slot, now):
+        """
+        Publish the due messages of a task
+        :return: the next slot of the task or None if it is finished
+        """
+        task.lag_seconds.observe(now - deadline)
+        if task.is_finished(now):
+            task.report(now)
+            return None
+        client = task.client
+        for _ in range(task.message_count(now)):
+            if self._publish(client):
+                task.published += 1
+            if not client.running:
+                break
+        if not client.running:
+            task.report(time.monotonic())
+            return None
+        if task.is_paced:
+            # Paced generators keep their own timeline, late messages are sent right away
+            return slot + client.next_publish_interval()
+        if task.bucket is not None:
+            return now + task.bucket.delay(now)
+        next_slot = slot + client.listener.auto_publish_interval
+        # Missed slots are skipped instead of being sent all at once
+        return next_slot if next_slot > now else now
+
+    @staticmethod
+    def _publish(client):
+        try:
+            return client.publish()
+        except OSError:
+            client.close()
+        except IncorrectProtocolOrderException as e:
+            logger.logging.error(e)
+            client.close()
+        except Exception:
+            # e.g. a ValueError or struct.error of a message generator, only this client is affected
+            logger.logging.exception(f"Message generator of client {client.client_id} failed. Closing connection.")
+            PublishScheduler._close(client)
+        return False
+
+    @staticmethod
+    def _close(client):
+        try:
+            client.close()
+        except Exception:
+            logger.logging.exception(f"Could not close client {client.client_id}.")
+
+    def run(self):
+        """
+        Fire the scheduled publishes until the scheduler is stopped
+        """
+        while self._running:
+            with self._condition:
+                timeout = self.next_timeout()
+                if timeout is None or timeout > 0:
+                    self._condition.wait(timeout)
+            self.run_due_publishes()
@@ -0,0 +1,125 @@
+import math
+import time
+
+LINEAR_RAMP_UP = "linear"
+STEP_RAMP_UP = "step"
+RAMP_UP_PROFILES = (LINEAR_RAMP_UP, STEP_RAMP_UP)
+DEFAULT_RAMP_UP_STEPS = 10
+# Delay until the rate is checked again if the target rate is zero
+ZERO_RATE_RETRY_DELAY = 0.01
+# Token counts this close to a whole token are rounded up, so that float errors do not cause tiny delays
+TOKEN_EPSILON = 1e-9
+
+
+class TokenBucket(object):
+    """
+    Token bucket that limits the auto publish messages of a connection to a target rate. Tokens are added with the
+    current rate and at most 'capacity' tokens are stored, so up to 'capacity' messages are sent back to back after
+    an idle period. The rate can be ramped up from zero over 'ramp_up_duration' seconds, either linearly or in
+    'ramp_up_steps' equal steps. The tokens are the integral of the rate over time, so the time until the next token
+    is exact during the ramp-up as well.
+    """
+
+    def __init__(self, rate, capacity=1, ramp_up_profile=None, ramp_up_duration=0,
+                 ramp_up_steps=DEFAULT_RAMP_UP_STEPS, start=None):
+        """
+        :param rate: target rate in tokens per second
+        :param capacity: maximum number of stored tokens (burst size)
+        :param ramp_up_profile: None, LINEAR_RAMP_UP or STEP_RAMP_UP
+        :param ramp_up_duration: seconds until the target rate is reached
+        :param ramp_up_steps: number of steps of the STEP_RAMP_UP profile
+        :param start: time.monotonic() timestamp of the start, defaults to now
+        """
+        self._rate = rate
+        self._capacity = capacity
+        self._ramp_up_profile = ramp_up_profile if ramp_up_duration > 0 else None
+        self._ramp_up_duration = ramp_up_duration
+        self._ramp_up_steps = ramp_up_steps
+        self._start = time.monotonic() if start is None else start
+        self._updated = self._start
+        # Starts with a single token, so that the first message is sent right away without a burst
+        self._tokens = 1.0
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def rate_at(self, now):
+        """
+        :param now: time.monotonic() timestamp
+        :return: the rate in tokens per second at a point in time, according to the ramp-up profile
+        """
+        elapsed = now - self._start
+        if self._ramp_up_profile is None or elapsed >= self._ramp_up_duration:
+            return self._rate
+        progress = max(0.0, elapsed) / self._ramp_up_duration
+        if self._ramp_up_profile == STEP_RAMP_UP:
+            progress = (math.floor(progress * self._ramp_up_steps) + 1) / self._ramp_up_steps
+        return self._rate * progress
+
+    def consume(self, now):
+        """
+        Refill the bucket and take all whole tokens
+        :param now: time.monotonic() timestamp
+        :return: number of messages that may be sent now
+        """
+        self._tokens = min(self._capacity, self._tokens + self._tokens_until(now) - self._tokens_until(self._updated))
+        self._updated = now
+        tokens = int(self._tokens + TOKEN_EPSILON)
+        self._tokens -= tokens
+        return tokens
+
+    def delay(self, now):
+        """
+        :param now: time.monotonic() timestamp
+        :return: seconds until the next whole token is available
+        """
+        if self._rate <= 0:
+            return ZERO_RATE_RETRY_DELAY
+        tokens = min(self._capacity, self._tokens + self._tokens_until(now) - self._tokens_until(self._updated))
+        missing = 1.0 - tokens
+        if missing <= TOKEN_EPSILON:
+            return 0.0
+        return max(0.0, self._time_of(self._tokens_until(now) + missing) - now)
+
+    def _tokens_until(self, now):
+        """
+        :return: the number of tokens that the rate has added between the start and a point in time
+        """
+        elapsed = max(0.0, now - self._start)
+        if self._ramp_up_profile is None:
+            return self._rate * elapsed
+        duration = self._ramp_up_duration
+        ramped = min(elapsed, duration)
+        if self._ramp_up_profile == LINEAR_RAMP_UP:
+            tokens = self._rate * ramped * ramped / (2 * duration)
+        else:
+            step_duration = duration / self._ramp_up_steps
+            steps = min(math.floor(ramped / step_duration), self._ramp_up_steps)
+            # Step k (from 0) runs with (k + 1) / steps of the rate
+            tokens = self._rate * step_duration / self._ramp_up_steps * steps * (steps + 1) / 2
+            if steps < self._ramp_up_steps:
+                tokens += self._rate * (steps + 1) / self._ramp_up_steps * (ramped - steps * step_duration)
+        return tokens + self._rate * max(0.0, elapsed - duration)
+
+    def _time_of(self, tokens):
+        """
+        :return: the time.monotonic() timestamp at which the rate has added a number of tokens since the start
+        """
+        if self._ramp_up_profile is None:
+            return self._start + tokens / self._rate
+        duration = self._ramp_up_duration
+        ramp_up_tokens = self._tokens_until(self._start + duration)
+        if tokens >= ramp_up_tokens:
+            return self._start + duration + (tokens - ramp_up_tokens) / self._rate
+        if self._ramp_up_profile == LINEAR_RAMP_UP:
+            return self._start + math.sqrt(2 * duration * tokens / self._rate)
+        step_duration = duration / self._ramp_up_steps
+        step_start_tokens = 0.0
+        for step in range(self._ramp_up_steps):
+            step_rate = self._rate * (step + 1) / self._ramp_up_steps
+            step_tokens = step_rate * step_duration
+            if tokens < step_start_tokens + step_tokens:
+                return self._start + step * step_duration + (tokens - step_start_tokens) / step_rate
+            step_start_tokens += step_tokens
+        return self._start + duration
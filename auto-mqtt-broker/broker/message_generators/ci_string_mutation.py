@@ -1,7 +1,7 @@
 import math
 
 from broker.message_generators.message_generator import MessageGenerator
-from packets.mqtt_packet_manager import MQTTPacketManager
+from broker.message_generators.utils.publish_cache import PUBLISH_CACHE, encode_payloads
 
 import logging
 import sys
@@ -14,10 +14,13 @@ from mutators.mutator import BasicMutator
 class CIStringMutation(MessageGenerator):
     _GENERATOR_TYPE = "CI_STRING"
     _seed_string = ""
-    _mutated_payloads = None
+    _publish_frames = None
 
     def __init__(self, generator_config):
-        self._mutated_payloads = iter(self._load_payload_data())
+        topic = self._generator_config.topic
+        # The payloads are only loaded and encoded once per process, later connections reuse the cached frames
+        self._publish_frames = PUBLISH_CACHE.get_frames(
+            self._GENERATOR_TYPE, topic, lambda: encode_payloads(topic, self._load_payload_data))
 
     def _load_payload_data(self):
         payloads = BasicMutator.get_for_string(ci=True)
@@ -26,4 +29,4 @@ class CIStringMutation(MessageGenerator):
         return payloads
 
     def __next__(self):
-        return MQTTPacketManager.prepare_publish(self._generator_config.topic, next(self._mutated_payloads))
+        return next(self._publish_frames)
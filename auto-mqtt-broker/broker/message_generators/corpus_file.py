@@ -0,0 +1,25 @@
+import logging
+
+from broker.message_generators.message_generator import MessageGenerator
+from broker.message_generators.utils.corpus_file import open_corpus_file
+
+
+class CorpusFileGenerator(MessageGenerator):
+    """
+    Streams the pre-encoded PUBLISH frames of a corpus file (see build_corpus.py).
+    The topic is part of the encoded frames, so MESSAGE_GENERATOR_TOPIC is not used.
+    """
+    _GENERATOR_TYPE = "CORPUS_FILE"
+
+    def __init__(self, generator_config):
+        self._corpus_file = open_corpus_file(generator_config.corpus_file)
+        self._index = 0
+        logging.info(f"Loaded {self._GENERATOR_TYPE} '{generator_config.corpus_file}' with "
+                     f"{len(self._corpus_file)} frames.\n")
+
+    def __next__(self):
+        if self._index >= len(self._corpus_file):
+            raise StopIteration
+        frame = self._corpus_file.frame(self._index)
+        self._index += 1
+        return frame
@@ -4,6 +4,7 @@ from packets.mqtt_packet_manager import MQTTPacketManager
 
 class HelloWorld(MessageGenerator):
     _GENERATOR_TYPE = "HELLO_WORLD"
+    _RANDOM_ACCESS = True
 
     def __next__(self):
         return MQTTPacketManager.prepare_publish(self._generator_config.topic, "hello world")
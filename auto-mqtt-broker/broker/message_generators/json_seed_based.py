@@ -1,5 +1,5 @@
 from broker.message_generators.message_generator import MessageGenerator
-from packets.mqtt_packet_manager import MQTTPacketManager
+from broker.message_generators.utils.publish_cache import PUBLISH_CACHE, encode_payloads, hash_file
 
 import logging
 import json
@@ -14,10 +14,14 @@ SEED_FILE_PATH = "seed_files/test.json"
 
 class JsonSeedBased(MessageGenerator):
     _GENERATOR_TYPE = "JSON_SEED"
-    _mutated_payloads = None
+    _publish_frames = None
 
     def __init__(self, generator_config):
-        self._mutated_payloads = iter(self._load_payload_data())
+        topic = self._generator_config.topic
+        # The mutations are only computed and encoded once per process and seed file content
+        self._publish_frames = PUBLISH_CACHE.get_frames(
+            self._GENERATOR_TYPE, topic, lambda: encode_payloads(topic, self._load_payload_data),
+            seed_file_hash=hash_file(SEED_FILE_PATH))
 
     def _load_payload_data(self):
         with open(SEED_FILE_PATH) as json_file:
@@ -25,10 +29,11 @@ class JsonSeedBased(MessageGenerator):
             json_data = json.dumps(json.load(json_file))
 
         mutator = JsonMutator(json_data)
+        # The mutations are generated on demand, so the first message does not wait for all of them
         payloads = mutator.apply(json_data)
 
-        logging.info(f"Loaded {self._GENERATOR_TYPE} with {len(payloads)} different payloads.\n")
+        logging.info(f"Loaded {self._GENERATOR_TYPE} with seed file '{SEED_FILE_PATH}'.\n")
         return payloads
 
     def __next__(self):
-        return MQTTPacketManager.prepare_publish(self._generator_config.topic, next(self._mutated_payloads))
+        return next(self._publish_frames)
@@ -1,14 +1,46 @@
+import copy
+import random
+import struct
 from abc import abstractmethod
 
+# Replay captures at the original pacing
+DEFAULT_REPLAY_SPEED = 1.0
+# With a seed, the random state of a stream is derived from (seed, stream, block) every MESSAGES_PER_BLOCK messages
+MESSAGES_PER_BLOCK = 256
+_STREAM_KEY = struct.Struct(">QQQ")
+# Seeds of any size are reduced to 64 bits, negative seeds keep the key of their two's complement
+_SEED_MASK = (1 << 64) - 1
+
+# Seed of this process (see --seed), used if MESSAGE_GENERATOR_SEED is not configured
+_process_seed = None
+
 
 class MessageGeneratorConfig:
     def __init__(self):
         self.generator_type = None
-        self.msg_topic = None
+        self.topic = None
+        self.corpus_file = None
+        self.capture_file = None
+        self.replay_connection = None
+        self.replay_speed = DEFAULT_REPLAY_SPEED
+        self.seed = None
+        self.stream = 0
+
+    def for_stream(self, stream):
+        """
+        :param stream: ID of the random stream, e.g. the connection ID
+        :return: a copy of the config for a message generator with its own random stream
+        """
+        config = copy.copy(self)
+        config.stream = stream
+        return config
 
 
 class MessageGenerator(object):
     _GENERATOR_TYPE = None
+    # True if the messages only depend on 'rng' and the state that is cleared by @reset, so that with a seed the
+    # message at any index can be generated without generating all messages before it (see @skip)
+    _RANDOM_ACCESS = False
 
     def __new__(cls, generator_config):
         # Uses a factory pattern to create a MessageGenerator of type 'generator_type'
@@ -17,13 +49,92 @@ class MessageGenerator(object):
             if generator_config.generator_type and generator_config.generator_type == subclass._GENERATOR_TYPE:
                 self = object.__new__(subclass)
                 self._generator_config = generator_config
+                seed = generator_config.seed if generator_config.seed is not None else _process_seed
+                self._seed = seed & _SEED_MASK if seed is not None else None
+                self._message_index = 0
+                # Every generator has its own random state, so connections neither share nor contend on it
+                self.rng = random.Random()
                 return self
         raise ModuleNotFoundError(f"Failed to find a valid generator of type 'f{generator_config.generator_type}'!")
 
     def get_generator_type(self):
         return self._GENERATOR_TYPE
 
+    @property
+    def message_index(self):
+        """
+        :return: index of the next message of @generate
+        """
+        return self._message_index
+
+    @property
+    def is_paced(self):
+        """
+        :return: True if the generator determines the time between its messages (@next_interval) instead of the auto
+        publish settings of the listener
+        """
+        return False
+
+    def next_interval(self):
+        """
+        Only used if @is_paced
+        :return: seconds between the last and the next message
+        """
+        return None
+
+    @classmethod
+    def seed(cls, seed):
+        """
+        Seed the random state of the generator type that is not covered by the global 'random' module
+        :param seed: the seed of this process
+        """
+        pass
+
+    def reset(self):
+        """
+        Clear the random state that is kept apart from 'rng', e.g. pre-generated batches. Called whenever 'rng' is
+        reseeded at the start of a block of a seeded stream.
+        """
+        pass
+
+    def generate(self):
+        """
+        Generate the next message. With a seed, 'rng' is reseeded at the start of each block of MESSAGES_PER_BLOCK
+        messages with a state that only depends on the seed, the stream and the block index.
+        :return: the next message (bytes-like)
+        """
+        if self._seed is not None and self._message_index % MESSAGES_PER_BLOCK == 0:
+            self.rng.seed(_STREAM_KEY.pack(self._seed, self._generator_config.stream,
+                                           self._message_index // MESSAGES_PER_BLOCK))
+            self.reset()
+        self._message_index += 1
+        return next(self)
+
+    def skip(self, count):
+        """
+        Skip messages, e.g. to regenerate a message of a seeded stream. Generators with _RANDOM_ACCESS only generate
+        the messages from the start of the block of the target index.
+        :param count: number of messages
+        """
+        target = self._message_index + count
+        if self._seed is not None and self._RANDOM_ACCESS:
+            self._message_index = max(self._message_index, target - target % MESSAGES_PER_BLOCK)
+        while self._message_index < target:
+            self.generate()
+
     @abstractmethod
     def __next__(self) -> bytes:
         pass
 
+
+def seed_message_generators(seed):
+    """
+    Seed the random state that is shared by all message generators of this process. The random streams of the
+    message generators are derived from it if MESSAGE_GENERATOR_SEED is not configured.
+    :param seed: the seed of this process
+    """
+    global _process_seed
+    _process_seed = seed
+    random.seed(seed)
+    for subclass in MessageGenerator.__subclasses__():
+        subclass.seed(seed)
@@ -1,35 +1,32 @@
-from random import Random
 from broker.message_generators.message_generator import MessageGenerator
+from broker.message_generators.utils.byte_mutator import ByteMutator
+from broker.message_generators.utils.corpus_file import open_corpus_file
 from packets.mqtt_packet_manager import MQTTPacketManager
-from bitarray import bitarray
 
-RANDOM = Random()
 BIT_FLIP_PROBABILITY = 1 / 3
+# Payloads of the PUBLISH templates if no corpus file is configured
+TEMPLATE_PAYLOADS = ("hello world", "", '{"id": 1, "value": 21.5}')
 
 
 class RandomBitFlip(MessageGenerator):
+    """
+    Mutates PUBLISH templates on byte level, see @ByteMutator. If MESSAGE_GENERATOR_CORPUS_FILE is configured, its
+    frames are used as templates.
+    """
     _GENERATOR_TYPE = "BIT_FLIP"
-
-    _message: bytes = None
-    _message_bits: list = None
+    _RANDOM_ACCESS = True
 
     def __init__(self, generator_config):
-        self._message: bytes = MQTTPacketManager.prepare_publish(self._generator_config.topic, "hello world")
-
-        ba = bitarray()
-        ba.frombytes(self._message)
-
-        self._message_bits = ba.tolist()
+        if generator_config.corpus_file:
+            # The frames stay on the shared mapping, only the template of each message is copied
+            templates = open_corpus_file(generator_config.corpus_file)
+        else:
+            templates = [MQTTPacketManager.prepare_publish(generator_config.topic, payload)
+                         for payload in TEMPLATE_PAYLOADS]
+        self._mutator = ByteMutator(templates, rng=self.rng)
 
     def __next__(self):
-        if RANDOM.random() >= BIT_FLIP_PROBABILITY:
-            return self._message
-
-        bitflip_index = RANDOM.randint(0, len(self._message_bits))
-        return flip_bit(self._message_bits, bitflip_index)
-
+        if self.rng.random() >= BIT_FLIP_PROBABILITY:
+            return self._mutator.random_template()
 
-def flip_bit(bit_array: list, index: int):
-    temp_list = bit_array.copy()
-    temp_list[index] = not bool(temp_list[index])
-    return bitarray(temp_list).tobytes()
+        return self._mutator.mutate()
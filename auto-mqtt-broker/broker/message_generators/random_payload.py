@@ -1,9 +1,17 @@
 from broker.message_generators.message_generator import MessageGenerator
 from packets.mqtt_packet_manager import MQTTPacketManager
-from .utils.generator_util import random_ascii_string
+from .utils.generator_util import random_ascii_batch
 
 class RandomPayload(MessageGenerator):
     _GENERATOR_TYPE = "RANDOM_PAYLOAD"
+    _RANDOM_ACCESS = True
+
+    def __init__(self, generator_config):
+        self._payloads = random_ascii_batch(rng=self.rng)
+        self._frame_builder = MQTTPacketManager.publish_frame_builder(generator_config.topic)
+
+    def reset(self):
+        self._payloads.reset()
 
     def __next__(self):
-        return MQTTPacketManager.prepare_publish(self._generator_config.topic, random_ascii_string())
+        return self._frame_builder.build(next(self._payloads))
@@ -1,15 +1,20 @@
-import random
-
 from broker.message_generators.message_generator import MessageGenerator
 from packets.mqtt_packet_manager import MQTTPacketManager
-from .utils.generator_util import random_unicode_string
+from .utils.generator_util import random_unicode_batch
 
 
 class RandomPayload(MessageGenerator):
     _GENERATOR_TYPE = "RANDOM_PUBLISH_LENGTH"
+    _RANDOM_ACCESS = True
+
+    def __init__(self, generator_config):
+        self._payloads = random_unicode_batch(rng=self.rng)
+        self._frame_builder = MQTTPacketManager.publish_frame_builder(generator_config.topic)
+
+    def reset(self):
+        self._payloads.reset()
 
     def __next__(self):
-        payload = random_unicode_string()
+        payload = next(self._payloads).encode('utf-8')
 
-        return MQTTPacketManager.prepare_publish(self._generator_config.topic, payload,
-                                                 remaining_length=random.randint(0, len(payload.encode('utf-8'))))
+        return self._frame_builder.build(payload, remaining_length=self.rng.randint(0, len(payload)))
@@ -0,0 +1,38 @@
+import logging
+
+from broker.message_generators.message_generator import MessageGenerator
+from util.packet_log import open_capture
+
+
+class ReplayGenerator(MessageGenerator):
+    """
+    Streams the sent PUBLISH frames of a capture (see --capture and --packet-log) back to the client.
+    With a replay speed above 0, the frames are paced like the original session, accelerated by the speed factor.
+    With a replay speed of 0, they are sent as fast as the auto publish settings of the listener allow.
+    The topic is part of the captured frames, so MESSAGE_GENERATOR_TOPIC is not used.
+    """
+    _GENERATOR_TYPE = "REPLAY"
+
+    def __init__(self, generator_config):
+        self._capture = open_capture(generator_config.capture_file, generator_config.replay_connection)
+        self._speed = generator_config.replay_speed
+        self._index = 0
+        logging.info(f"Loaded {self._GENERATOR_TYPE} '{generator_config.capture_file}' with "
+                     f"{len(self._capture)} frames.\n")
+
+    @property
+    def is_paced(self):
+        return self._speed > 0
+
+    def next_interval(self):
+        if self._index >= len(self._capture) or self._index == 0:
+            return 0.0
+        gap = self._capture.timestamp(self._index) - self._capture.timestamp(self._index - 1)
+        return max(gap, 0.0) / self._speed
+
+    def __next__(self):
+        if self._index >= len(self._capture):
+            raise StopIteration
+        frame = self._capture.frame(self._index)
+        self._index += 1
+        return frame
@@ -0,0 +1,111 @@
+import random
+import struct
+
+# Maximum number of bits that are flipped in one mutant
+MAX_BIT_FLIPS = 4
+# Maximum value that is added to or subtracted from a byte, word or double word (as in AFL)
+ARITHMETIC_MAX = 35
+
+# Values that often trigger edge cases in length, size and offset handling (as in AFL)
+INTERESTING_8 = (-128, -1, 0, 1, 16, 32, 64, 100, 127)
+INTERESTING_16 = INTERESTING_8 + (-32768, -129, 128, 255, 256, 512, 1000, 1024, 4096, 32767)
+INTERESTING_32 = INTERESTING_16 + (-2147483648, -100663046, -32769, 32768, 65535, 65536, 100663045, 2147483647)
+
+_WIDTH_BITS = {1: 8, 2: 16, 4: 32}
+_INTERESTING_VALUES = {1: INTERESTING_8, 2: INTERESTING_16, 4: INTERESTING_32}
+# Unsigned integer structs by width and endianness
+_STRUCTS = {(width, byte_order): struct.Struct(byte_order + code)
+            for width, code in ((1, "B"), (2, "H"), (4, "I")) for byte_order in "<>"}
+
+
+class ByteMutator(object):
+    """
+    AFL-style mutation stages on byte templates: flipping up to 'max_bit_flips' bits, adding or subtracting small
+    values and overwriting bytes, words or double words with interesting values.
+    Every mutant is one bytearray copy of a randomly chosen template that is mutated in place with XOR masks and
+    precompiled structs. The templates are not copied, e.g. the memoryview frames of a @CorpusFile stay on the mapped
+    file and only the chosen template is copied.
+    """
+
+    def __init__(self, templates, max_bit_flips=MAX_BIT_FLIPS, rng=random):
+        """
+        :param templates: non-empty sequence of bytes-like templates, e.g. a list or a @CorpusFile
+        :param max_bit_flips: maximum number of flipped bits per mutant
+        :param rng: source of randomness, the 'random' module or a random.Random instance
+        """
+        if not templates:
+            raise ValueError("At least one template is required.")
+        self._templates = templates
+        self._max_bit_flips = max_bit_flips
+        self._rng = rng
+        self._stages = (self.flip_bits, self.add_arithmetic, self.set_interesting)
+
+    @property
+    def templates(self):
+        return self._templates
+
+    def random_template(self):
+        """
+        :return: one of the templates as bytes
+        """
+        return bytes(self._choose_template())
+
+    def _choose_template(self):
+        if len(self._templates) == 1:
+            return self._templates[0]
+        return self._templates[int(self._rng.random() * len(self._templates))]
+
+    def mutate(self, template=None):
+        """
+        Applies one randomly chosen mutation stage to a copy of a template
+        :param template: the template to mutate, a random one if None
+        :return: bytearray - the mutant
+        """
+        mutant = bytearray(self._choose_template() if template is None else template)
+        if mutant:
+            self._stages[int(self._rng.random() * len(self._stages))](mutant)
+        return mutant
+
+    def flip_bits(self, mutant, count=None):
+        """
+        Flips between one and 'max_bit_flips' random bits in place
+        :param mutant: bytearray to mutate
+        :param count: number of flipped bits, random if None
+        """
+        uniform = self._rng.random
+        bit_count = len(mutant) * 8
+        if count is None:
+            count = 1 + int(uniform() * self._max_bit_flips)
+        for _ in range(count):
+            position = int(uniform() * bit_count)
+            mutant[position >> 3] ^= 0x80 >> (position & 7)
+
+    def add_arithmetic(self, mutant):
+        """
+        Adds or subtracts a value up to @ARITHMETIC_MAX to a random byte, word or double word in place
+        :param mutant: bytearray to mutate
+        """
+        width, offset, integer_struct = self._random_field(mutant)
+        delta = 1 + int(self._rng.random() * ARITHMETIC_MAX)
+        if self._rng.getrandbits(1):
+            delta = -delta
+        value, = integer_struct.unpack_from(mutant, offset)
+        integer_struct.pack_into(mutant, offset, (value + delta) & ((1 << _WIDTH_BITS[width]) - 1))
+
+    def set_interesting(self, mutant):
+        """
+        Overwrites a random byte, word or double word with an interesting value in place
+        :param mutant: bytearray to mutate
+        """
+        width, offset, integer_struct = self._random_field(mutant)
+        values = _INTERESTING_VALUES[width]
+        value = values[int(self._rng.random() * len(values))]
+        integer_struct.pack_into(mutant, offset, value & ((1 << _WIDTH_BITS[width]) - 1))
+
+    def _random_field(self, mutant):
+        uniform = self._rng.random
+        length = len(mutant)
+        width = (1, 2, 4)[int(uniform() * (3 if length >= 4 else 2 if length >= 2 else 1))]
+        offset = int(uniform() * (length - width + 1))
+        byte_order = ">" if self._rng.getrandbits(1) else "<"
+        return width, offset, _STRUCTS[(width, byte_order)]
@@ -0,0 +1,117 @@
+import mmap
+import struct
+import threading
+
+# File layout:
+#   header:  MAGIC, version (uint32)
+#   frames:  for every frame: length (uint32), encoded PUBLISH frame
+#   index:   for every frame: offset of its length field (uint64)
+#   trailer: offset of the index (uint64), number of frames (uint64), MAGIC
+MAGIC = b"MQTTCORP"
+VERSION = 1
+_HEADER = struct.Struct(f">{len(MAGIC)}sI")
+_FRAME_LENGTH = struct.Struct(">I")
+_INDEX_ENTRY = struct.Struct(">Q")
+_TRAILER = struct.Struct(f">QQ{len(MAGIC)}s")
+
+_open_corpus_files = {}
+_open_corpus_files_lock = threading.Lock()
+
+
+class CorpusFileWriter(object):
+    """
+    Writes pre-encoded PUBLISH frames into a corpus file
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION))
+        self._offsets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def write(self, frame):
+        """
+        Append a frame to the corpus
+        :param frame: the encoded PUBLISH frame (bytes-like)
+        """
+        self._offsets.append(self._file.tell())
+        self._file.write(_FRAME_LENGTH.pack(len(frame)))
+        self._file.write(frame)
+
+    def close(self):
+        """
+        Write the offset index and the trailer and close the file
+        """
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(b"".join(_INDEX_ENTRY.pack(offset) for offset in self._offsets))
+        self._file.write(_TRAILER.pack(index_offset, len(self._offsets), MAGIC))
+        self._file.close()
+
+
+class CorpusFile(object):
+    """
+    Read-only, memory-mapped corpus file. Opening only reads the trailer, frames are returned as memoryview slices of
+    the mapping, so all connections share the page-cached file content without copying it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        if len(self._mmap) < _HEADER.size + _TRAILER.size:
+            raise ValueError(f"'{path}' is too small to be a corpus file.")
+        magic, version = _HEADER.unpack_from(self._mmap, 0)
+        self._index_offset, self._frame_count, trailer_magic = _TRAILER.unpack_from(self._mmap,
+                                                                                     len(self._mmap) - _TRAILER.size)
+        if magic != MAGIC or trailer_magic != MAGIC:
+            raise ValueError(f"'{path}' is not a corpus file.")
+        if version != VERSION:
+            raise ValueError(f"Corpus file version {version} of '{path}' is not supported.")
+
+    def __len__(self):
+        return self._frame_count
+
+    def frame(self, index):
+        """
+        :param index: index of the frame
+        :return: the encoded PUBLISH frame as memoryview on the mapped file
+        """
+        if not 0 <= index < self._frame_count:
+            raise IndexError(f"Frame index {index} out of range.")
+        offset, = _INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + index * _INDEX_ENTRY.size)
+        length, = _FRAME_LENGTH.unpack_from(self._mmap, offset)
+        start = offset + _FRAME_LENGTH.size
+        return self._view[start:start + length]
+
+    def __getitem__(self, index):
+        return self.frame(index)
+
+    def __iter__(self):
+        for index in range(self._frame_count):
+            yield self.frame(index)
+
+
+def open_corpus_file(path):
+    """
+    Returns the @CorpusFile of a path. The file is only mapped once per process.
+    :param path: path of the corpus file
+    :return: @CorpusFile
+    """
+    with _open_corpus_files_lock:
+        corpus_file = _open_corpus_files.get(path)
+        if corpus_file is None:
+            corpus_file = CorpusFile(path)
+            _open_corpus_files[path] = corpus_file
+        return corpus_file
@@ -1,19 +1,141 @@
+import itertools
+import threading
 import unicodedata
 import random
 import string
 
 _MAX_PAYLOAD_CHARS = 1024
+_UNICODE_STRING_LENGTH = 10
+# Number of strings that are generated at once
+_BATCH_SIZE = 256
+
+ASCII_ALPHABET = string.ascii_uppercase + string.digits
 
 # only use unicode categories that don't include control codes
 unicode_glyphs = ''.join(chr(char) for char in range(65533) if unicodedata.category(chr(char))[0] in 'LMNPSZ')
 
 
+class RandomStringBatch(object):
+    """
+    Iterator over random strings of an alphabet that are generated in batches of 'batch_size' strings.
+    The characters of a whole batch are taken from one block of random bytes and mapped to the alphabet with
+    C-level table lookups, instead of calling random.choice for every single character.
+    Random values are drawn from 'rng', so the strings are reproducible by seeding it.
+    """
+
+    def __init__(self, alphabet, lower_limit=0, upper_limit=_MAX_PAYLOAD_CHARS, batch_size=_BATCH_SIZE, rng=random):
+        """
+        :param alphabet: the characters the strings consist of (at most 65536)
+        :param lower_limit: minimum length of a string
+        :param upper_limit: maximum length of a string
+        :param batch_size: number of strings per batch
+        :param rng: source of randomness, the 'random' module or a random.Random instance
+        """
+        self._alphabet = alphabet
+        self._lower_limit = lower_limit
+        self._upper_limit = upper_limit
+        self._batch_size = batch_size
+        self._rng = rng
+        self._batch = []
+        self._index = 0
+
+        alphabet_size = len(alphabet)
+        self._is_byte_alphabet = alphabet_size <= 256 and alphabet.isascii()
+        if self._is_byte_alphabet:
+            # Random bytes above the largest multiple of the alphabet size are dropped to avoid a modulo bias
+            self._limit = alphabet_size * (256 // alphabet_size)
+            self._translation_table = bytes(ord(alphabet[value % alphabet_size]) for value in range(256))
+            self._rejected_bytes = bytes(range(self._limit, 256))
+        else:
+            self._limit = alphabet_size * (65536 // alphabet_size)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._index >= len(self._batch):
+            self._fill_batch()
+        random_string = self._batch[self._index]
+        self._index += 1
+        return random_string
+
+    def reset(self):
+        """
+        Drop the rest of the current batch, e.g. after reseeding 'rng'
+        """
+        self._batch = []
+        self._index = 0
+
+    def _fill_batch(self):
+        lengths = [self._rng.randint(self._lower_limit, self._upper_limit) for _ in range(self._batch_size)]
+        characters = self.random_characters(sum(lengths))
+        offsets = list(itertools.accumulate(lengths, initial=0))
+        self._batch = [characters[start:end] for start, end in zip(offsets, offsets[1:])]
+        self._index = 0
+
+    def random_characters(self, count):
+        """
+        :param count: number of characters
+        :return: a random string of the alphabet with 'count' characters
+        """
+        if self._is_byte_alphabet:
+            return self._random_byte_characters(count)
+        return self._random_wide_characters(count)
+
+    def _random_byte_characters(self, count):
+        chunks = []
+        missing = count
+        while missing > 0:
+            # Request some extra bytes to compensate for the rejected ones
+            chunk = self._rng.randbytes(missing + missing // 4 + 16).translate(self._translation_table,
+                                                                                self._rejected_bytes)[:missing]
+            chunks.append(chunk)
+            missing -= len(chunk)
+        return b''.join(chunks).decode('ascii')
+
+    def _random_wide_characters(self, count):
+        chunks = []
+        missing = count
+        alphabet_size = len(self._alphabet)
+        while missing > 0:
+            values = memoryview(self._rng.randbytes(2 * (missing + missing // 4 + 16))).cast('H')
+            indices = map(alphabet_size.__rmod__, filter(self._limit.__gt__, values))
+            chunk = ''.join(map(self._alphabet.__getitem__, itertools.islice(indices, missing)))
+            chunks.append(chunk)
+            missing -= len(chunk)
+        return ''.join(chunks)
+
+
+def random_ascii_batch(lower_limit=0, upper_limit=_MAX_PAYLOAD_CHARS, rng=random):
+    """
+    :return: @RandomStringBatch of uppercase ASCII letters and digits with a random length between the limits
+    """
+    return RandomStringBatch(ASCII_ALPHABET, lower_limit, upper_limit, rng=rng)
+
+
+def random_unicode_batch(rng=random):
+    """
+    :return: @RandomStringBatch of printable unicode glyphs with a length of 10 characters
+    """
+    return RandomStringBatch(unicode_glyphs, _UNICODE_STRING_LENGTH, _UNICODE_STRING_LENGTH, rng=rng)
+
+
+_default_batches = {}
+_default_batches_lock = threading.Lock()
+
+
+def _next_from_default_batch(key, factory):
+    with _default_batches_lock:
+        batch = _default_batches.get(key)
+        if batch is None:
+            batch = _default_batches[key] = factory()
+        return next(batch)
+
+
 def random_unicode_string(lower_limit=0, upper_limit=_MAX_PAYLOAD_CHARS):
-    rand_length = 10
-    return ''.join([random.choice(unicode_glyphs)
-                    for _ in range(rand_length)])
+    return _next_from_default_batch('unicode', random_unicode_batch)
 
 
 def random_ascii_string(lower_limit=0, upper_limit=_MAX_PAYLOAD_CHARS):
-    rand_length = random.randint(lower_limit, upper_limit)
-    return ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(rand_length))
+    return _next_from_default_batch(('ascii', lower_limit, upper_limit),
+                                    lambda: random_ascii_batch(lower_limit, upper_limit))
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from packets.mqtt_packet_manager import MQTTPacketManager
+
+# Upper bound for the encoded PUBLISH frames that are kept in the process-wide cache
+_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class CachedCorpus(object):
+    """
+    Lazily filled list of encoded PUBLISH frames of a deterministic message generator.
+    The first connection that reaches the end of the list encodes the next frame, all other connections reuse it.
+    """
+
+    def __init__(self, key, frame_source, on_growth=None):
+        """
+        :param key: cache key of the corpus
+        :param frame_source: iterable of encoded PUBLISH frames (bytes)
+        :param on_growth: callback that is called with the corpus and the size of every newly cached frame
+        """
+        self.key = key
+        self._frame_source = iter(frame_source)
+        self._frames = []
+        self._is_complete = False
+        self._size = 0
+        self._on_growth = on_growth
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def frames(self):
+        return self._frames
+
+    def get(self, index):
+        """
+        :param index: index of the frame
+        :return: the encoded frame or None if the generator has less frames
+        """
+        if index < len(self._frames):
+            return self._frames[index]
+
+        with self._lock:
+            while index >= len(self._frames):
+                if self._is_complete:
+                    return None
+                try:
+                    frame = next(self._frame_source)
+                except StopIteration:
+                    self._is_complete = True
+                    self._frame_source = None
+                    return None
+                self._frames.append(frame)
+                self._size += len(frame)
+                if self._on_growth:
+                    self._on_growth(self, len(frame))
+            return self._frames[index]
+
+    def __iter__(self):
+        index = 0
+        while True:
+            frame = self.get(index)
+            if frame is None:
+                return
+            yield frame
+            index += 1
+
+
+class PublishFrameCache(object):
+    """
+    Process-wide LRU cache of @CachedCorpus objects, keyed by (generator type, topic, seed file hash).
+    If the cached frames exceed 'max_bytes', the least recently used corpora are evicted. Connections that already
+    iterate over an evicted corpus keep using it, new connections encode the frames again. An evicted corpus still
+    grows while it is used, so its frames are counted until it is released.
+    """
+
+    def __init__(self, max_bytes=_MAX_CACHE_BYTES):
+        self._max_bytes = max_bytes
+        self._corpora = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def get_frames(self, generator_type, topic, frame_source_factory, seed_file_hash=None):
+        """
+        Returns an iterator over the cached frames of a generator
+        :param generator_type: type of the message generator
+        :param topic: topic of the PUBLISH frames
+        :param frame_source_factory: function that returns an iterable of encoded frames, only called on a cache miss
+        :param seed_file_hash: hash of the seed file the frames are derived from, see @hash_file
+        :return: iterator over the encoded PUBLISH frames
+        """
+        key = (generator_type, topic, seed_file_hash)
+        with self._lock:
+            corpus = self._corpora.get(key)
+            if corpus is None:
+                corpus = CachedCorpus(key, frame_source_factory(), on_growth=self._on_growth)
+                self._corpora[key] = corpus
+            else:
+                self._corpora.move_to_end(key)
+        return iter(corpus)
+
+    def _on_growth(self, corpus, size):
+        with self._lock:
+            self._size += size
+            while self._size > self._max_bytes and self._corpora:
+                self._evict()
+
+    def _evict(self):
+        _, evicted = self._corpora.popitem(last=False)
+        # The frames stay in memory until the last iterator releases the corpus
+        weakref.finalize(evicted, self._release, evicted.frames)
+
+    def _release(self, frames):
+        with self._lock:
+            self._size -= sum(len(frame) for frame in frames)
+
+    def clear(self):
+        with self._lock:
+            while self._corpora:
+                self._evict()
+
+
+PUBLISH_CACHE = PublishFrameCache()
+
+
+# (path, modification time, size) -> hex digest of the file content
+_file_hashes = {}
+
+
+def hash_file(path):
+    """
+    Hashes a file once per process and file version
+    :param path: path of the file
+    :return: hex digest of the file content
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _file_hashes.get(key)
+    if digest is None:
+        with open(path, "rb") as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        _file_hashes[key] = digest
+    return digest
+
+
+def encode_payloads(topic, load_payloads):
+    """
+    Encode payloads as PUBLISH frames, one at a time. The payloads are only loaded when the first frame is requested.
+    :param topic: topic of the PUBLISH frames
+    :param load_payloads: function that returns an iterable of payload strings
+    :return: Generator - encoded PUBLISH frames
+    """
+    for payload in load_payloads():
+        yield MQTTPacketManager.prepare_publish(topic, payload)
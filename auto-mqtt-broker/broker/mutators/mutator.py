@@ -234,26 +234,31 @@ class JsonMutator:
         return self.mutator[type(data)]
 
     def apply(self, data):
+        """
+        Lazily mutate every leaf of a JSON document with all applicable mutators.
+        Each mutation is only computed when the next payload is requested.
+        :param data: the JSON document (str)
+        :return: Generator - the unmodified empty payload followed by the mutated JSON documents (str)
+        """
         data_json = json.loads(data)
         json_tree = dict2tree(data_json)
-        mutated_tree = [""]
+        serializer = TreeSerializer(json_tree)
+        yield ""
 
-        def apply_mutations(leaf, tree):
-            if leaf.data[0] not in FILTER_LIST:
-                former = leaf.data
-                for mutator in self.get_applicable_mutator(leaf.data[1]):
-                    if type(leaf.data[1]) == str and mutator != "":
-                        leaf.data = (leaf.data[0], leaf.data[1] + mutator)
-                    elif type(leaf.data[1]) == str:
-                        leaf.data = (leaf.data[0], "")
-                    elif leaf.data[1] is None:
-                        leaf.data = (leaf.data[0], mutator)
-                    elif callable(mutator):
-                        leaf.data = (leaf.data[0], mutator(leaf.data[1]))
-                    else:
-                        leaf.data = (leaf.data[0], mutator)
-                    mutated_tree.append(json.dumps(tree2dict(tree)))
-                    leaf.data = former
-
-        traverse(json_tree, json_tree, apply_mutations)
-        return mutated_tree
+        for leaf in iter_leaves(json_tree):
+            if leaf.data[0] in FILTER_LIST:
+                continue
+            value = leaf.data[1]
+            for mutator in self.get_applicable_mutator(value):
+                if type(value) == str and mutator != "":
+                    mutated_value = value + mutator
+                elif type(value) == str:
+                    mutated_value = ""
+                elif value is None:
+                    mutated_value = mutator
+                elif callable(mutator):
+                    mutated_value = mutator(value)
+                else:
+                    mutated_value = mutator
+                # Only the path from the leaf to the root is serialized again
+                yield serializer.serialize_with_value(leaf, mutated_value)
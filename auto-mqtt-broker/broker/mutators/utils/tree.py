@@ -1,3 +1,6 @@
+import json
+
+
 class TreeNode:
     def __init__(self, v=None):
         self.data = v
@@ -64,3 +67,91 @@ def traverse(node, tree, callback):
     if isinstance(node, list):
         for element in node:
             traverse(element, tree, callback)
+
+
+def iter_leaves(node):
+    """
+    Generator version of 'traverse': yields the leaves of the tree in the same order
+    :param node: @TreeNode or list of @TreeNode
+    :return: Generator - the leaf nodes
+    """
+    if not node:
+        return
+    if isinstance(node, TreeNode):
+        if isinstance(node.data, tuple):
+            yield node
+            return
+        for child in node.childs:
+            yield from iter_leaves(child)
+        return
+    if isinstance(node, list):
+        for element in node:
+            yield from iter_leaves(element)
+
+
+class TreeSerializer:
+    """
+    Serializes a tree like json.dumps(tree2dict(tree)) and caches the serialized fragment of every tree level together
+    with the position of each child value in it. Serializing the tree with a single modified leaf only re-encodes the
+    leaf value and splices it into the cached fragments on the path from the leaf to the root.
+    """
+
+    def __init__(self, tree):
+        self._tree = tree
+        # id(level) -> (serialized level, {id(node): (start, end) of the node value in the serialized level})
+        self._levels = {}
+        # id(node) -> parent node, None for nodes of the top level
+        self._parents = {}
+        self.serialized = self._serialize_level(tree, None)
+
+    def _serialize_level(self, nodes, parent):
+        if not nodes:
+            nodes = []
+        # Later nodes with the same key overwrite the value of earlier ones, but keep their position, like tree2dict
+        entries = {}
+        for node in nodes:
+            self._parents[id(node)] = parent
+            key = node.data[0] if isinstance(node.data, tuple) else node.data
+            entries[key] = node
+
+        parts = ["{"]
+        position = 1
+        spans = {}
+        for index, (key, node) in enumerate(entries.items()):
+            prefix = (", " if index else "") + json.dumps(key) + ": "
+            if isinstance(node.data, tuple):
+                value = json.dumps(node.data[1])
+            else:
+                value = self._serialize_level(node.childs, node)
+            position += len(prefix)
+            spans[id(node)] = (position, position + len(value))
+            position += len(value)
+            parts.append(prefix)
+            parts.append(value)
+        parts.append("}")
+
+        serialized = "".join(parts)
+        self._levels[id(nodes)] = (serialized, spans)
+        return serialized
+
+    def serialize_with_value(self, leaf, value):
+        """
+        Serialize the tree as if the value of a leaf was replaced, without modifying the tree
+        :param leaf: the leaf node of the tree
+        :param value: the new value of the leaf
+        :return: the serialized tree (str)
+        """
+        fragment = json.dumps(value)
+        node = leaf
+        while True:
+            parent = self._parents[id(node)]
+            level = parent.childs if parent is not None else self._tree
+            serialized, spans = self._levels[id(level)]
+            span = spans.get(id(node))
+            if span is None:
+                # The node is overwritten by a later node with the same key and not part of the output
+                return self.serialized
+            fragment = serialized[:span[0]] + fragment + serialized[span[1]:]
+            if parent is None:
+                return fragment
+            node = parent
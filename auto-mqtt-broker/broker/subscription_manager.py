@@ -1,22 +1,60 @@
+import threading
+
+TOPIC_LEVEL_SEPARATOR = "/"
+SINGLE_LEVEL_WILDCARD = "+"
+MULTI_LEVEL_WILDCARD = "#"
+# Topics starting with this character are not matched by wildcards at the first level (MQTTv5.0 Chapter 4.7.2)
+SYSTEM_TOPIC_PREFIX = "$"
+# Maximum number of published topics whose matching subscribers are cached
+MAX_CACHED_TOPICS = 10000
+
+
+class TopicNode(object):
+    """
+    Node of the topic filter trie. Each node represents one topic level of the subscribed topic filters.
+    """
+
+    def __init__(self):
+        self.children = {}
+        # Subscribers whose topic filter ends at this node, keyed by their client key
+        self.subscribers = {}
+
+    def is_empty(self):
+        return not self.children and not self.subscribers
+
+
 class SubscriptionManager(object):
     def __init__(self, max_subscribers=50):
         self._max_subscribers = max_subscribers
-        self._subscriberManagement = {}
+        self._root = TopicNode()
+        # Reverse index: client key -> topic filters of the client
+        self._client_subscriptions = {}
+        # Published topic -> matching subscribers, invalidated on every subscription change
+        self._match_cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _client_key(client_socket, client_address, client_id):
+        return client_socket, client_address, client_id
 
     def add_subscriber(self, client_socket, client_address, topic, client_id):
         """
         Adds a subscriber to the subscription list
         :param client_socket: Socket on which the client connected to the broker
         :param client_address: Client's connection address and port
-        :param topic: The topic the client subscribed to
+        :param topic: The topic (filter) the client subscribed to, may contain the wildcards '+' and '#'
         :param client_id: ID of the connected client
         """
 
         subscriber = {"client_socket": client_socket, "client_address": client_address, 'client_id': client_id}
-        if topic in self._subscriberManagement:
-            self._subscriberManagement[topic].append(subscriber)
-        else:
-            self._subscriberManagement[topic] = [subscriber]
+        client_key = self._client_key(client_socket, client_address, client_id)
+        with self._lock:
+            node = self._root
+            for level in topic.split(TOPIC_LEVEL_SEPARATOR):
+                node = node.children.setdefault(level, TopicNode())
+            node.subscribers[client_key] = subscriber
+            self._client_subscriptions.setdefault(client_key, set()).add(topic)
+            self._match_cache.clear()
 
     def remove_subscriber(self, client_socket, client_address, client_id):
         """
@@ -25,21 +63,79 @@ class SubscriptionManager(object):
         :param client_address: client's connection address and port
         :param client_id: ID of the connected client
         """
-        client = {"client_socket": client_socket, "client_address": client_address, "client_id": client_id}
-        for topic in self._subscriberManagement:
-            if client in self._subscriberManagement[topic]:
-                self._subscriberManagement[topic].remove(client)
+        client_key = self._client_key(client_socket, client_address, client_id)
+        with self._lock:
+            for topic in self._client_subscriptions.pop(client_key, ()):
+                self._remove_from_trie(topic, client_key)
+            self._match_cache.clear()
+
+    def _remove_from_trie(self, topic, client_key):
+        """
+        Remove the subscriber of a single topic filter and prune the nodes that are no longer needed
+        :param topic: the subscribed topic filter
+        :param client_key: key of the subscribed client
+        """
+        path = [self._root]
+        for level in topic.split(TOPIC_LEVEL_SEPARATOR):
+            node = path[-1].children.get(level)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].subscribers.pop(client_key, None)
+
+        levels = topic.split(TOPIC_LEVEL_SEPARATOR)
+        for index in range(len(levels), 0, -1):
+            if not path[index].is_empty():
+                break
+            del path[index - 1].children[levels[index - 1]]
 
     def get_topic_subscribers(self, topic):
         """
         Returns a list of containing all subscribers of a certain topic.
+        Topic filters with wildcards are matched according to the MQTTv5.0 specification Chapter 4.7 Topic Names and
+        Topic Filters. A client with several matching topic filters is only contained once.
         :param topic: Topic of the subscribers
         :return: All subscribers of a certain topic
         """
-        try:
-            return self._subscriberManagement[topic]
-        except KeyError:
-            return []
+        subscribers = self._match_cache.get(topic)
+        if subscribers is not None:
+            return subscribers
+
+        with self._lock:
+            matches = {}
+            self._match(self._root, topic.split(TOPIC_LEVEL_SEPARATOR), 0, matches)
+            subscribers = list(matches.values())
+            if len(self._match_cache) >= MAX_CACHED_TOPICS:
+                self._match_cache.clear()
+            self._match_cache[topic] = subscribers
+        return subscribers
+
+    def _match(self, node, levels, index, matches):
+        """
+        Collect the subscribers of all topic filters below 'node' that match the topic levels starting at 'index'
+        :param node: current @TopicNode
+        :param levels: levels of the published topic
+        :param index: index of the current topic level
+        :param matches: dictionary the matching subscribers are added to
+        """
+        is_system_topic = index == 0 and levels[0].startswith(SYSTEM_TOPIC_PREFIX)
+
+        # '#' also matches the parent level, e.g. 'sport/#' matches 'sport'
+        multi_level = node.children.get(MULTI_LEVEL_WILDCARD)
+        if multi_level is not None and not is_system_topic:
+            matches.update(multi_level.subscribers)
+
+        if index == len(levels):
+            matches.update(node.subscribers)
+            return
+
+        child = node.children.get(levels[index])
+        if child is not None:
+            self._match(child, levels, index + 1, matches)
+
+        single_level = node.children.get(SINGLE_LEVEL_WILDCARD)
+        if single_level is not None and not is_system_topic:
+            self._match(single_level, levels, index + 1, matches)
 
     @property
     def max_subscribers(self):
@@ -0,0 +1,79 @@
+import argparse
+import itertools
+import logging
+
+from broker.message_generators.message_generator import MessageGenerator, MessageGeneratorConfig, \
+    seed_message_generators
+from broker.message_generators.utils.corpus_file import CorpusFileWriter
+
+DEFAULT_TOPIC = "test"
+
+
+def main(args):
+    """
+    Write the PUBLISH frames of a message generator into a corpus file for the CORPUS_FILE generator. With a seed,
+    the frames of a connection of the broker can be regenerated from its stream (connection ID) and message index.
+    :param args: arguments provided via CLI
+    """
+    if args.seed is not None:
+        seed_message_generators(args.seed)
+
+    generator_config = MessageGeneratorConfig()
+    generator_config.generator_type = args.generator_type
+    generator_config.topic = args.topic
+    message_generator = MessageGenerator(generator_config.for_stream(args.stream))
+    message_generator.skip(args.start)
+
+    def next_frame():
+        try:
+            return message_generator.generate()
+        except StopIteration:
+            return None
+
+    frames = iter(next_frame, None)
+    if args.count is not None:
+        frames = itertools.islice(frames, args.count)
+
+    with CorpusFileWriter(args.output) as writer:
+        for frame in frames:
+            writer.write(frame)
+        logging.info(f"Wrote {len(writer)} frames of {args.generator_type} to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+    # argument parser
+    parser = argparse.ArgumentParser("build_corpus", description="Pre-encode the PUBLISH messages of a message "
+                                                                 "generator into a memory-mapped corpus file")
+    # argument for the message generator
+    parser.add_argument('-g', '--generator', required=True, type=str, dest="generator_type", metavar="TYPE",
+                        help="Type of the message generator, e.g. JSON_SEED.")
+
+    # argument for topic
+    parser.add_argument('-t', '--topic', default=DEFAULT_TOPIC, type=str, dest="topic", metavar="TOPIC",
+                        help=f"Topic of the PUBLISH messages. Defaults to {DEFAULT_TOPIC}.")
+
+    # argument for the number of frames
+    parser.add_argument('-n', '--count', default=None, type=int, dest="count", metavar="COUNT",
+                        help="Maximum number of frames. Required for endless generators.")
+
+    # argument for the seed
+    parser.add_argument('-s', '--seed', default=None, type=int, dest="seed", metavar="SEED",
+                        help="Seed for the message generator.")
+
+    # argument for the random stream
+    parser.add_argument('--stream', default=0, type=int, dest="stream", metavar="ID",
+                        help="Random stream of the message generator, the broker uses the connection ID. "
+                             "Defaults to 0.")
+
+    # argument for the first message
+    parser.add_argument('--start', default=0, type=int, dest="start", metavar="INDEX",
+                        help="Index of the first message of the stream. Defaults to 0.")
+
+    # argument for the output file
+    parser.add_argument('-o', '--output', required=True, type=str, dest="output", metavar="PATH",
+                        help="Path of the corpus file.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,56 @@
+from packets.mqtt_packet_manager import unpack_variable_byte_integer
+
+
+class MQTTFrameBuffer(object):
+    """
+    Reassembles complete MQTT control packets from the byte stream of a single connection.
+    TCP does not preserve message boundaries, so one received chunk may contain several packets or only a part of one.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # Start of the first packet in the buffer that has not been handed out yet
+        self._position = 0
+
+    def __len__(self):
+        return len(self._buffer) - self._position
+
+    def feed(self, data):
+        """
+        Append received data to the buffer and yield every packet that is complete afterwards
+        :param data: the received bytes
+        :return: Generator - complete packets including their fixed header (as bytes)
+        :raises MalformedPacketException: if the remaining length of a packet is not a valid variable byte integer
+        """
+        self._buffer += data
+        try:
+            while True:
+                frame_end = self._next_frame_end()
+                if frame_end is None:
+                    return
+                # Copy the packet only once, slicing the bytearray would copy it twice. The view is released before the
+                # buffer is resized, which is not possible while it is exported.
+                with memoryview(self._buffer)[self._position:frame_end] as frame_view:
+                    frame = bytes(frame_view)
+                self._position = frame_end
+                yield frame
+        finally:
+            # Drop all handed out packets at once instead of shifting the buffer for every packet
+            if self._position:
+                del self._buffer[:self._position]
+                self._position = 0
+
+    def _next_frame_end(self):
+        """
+        :return: the end position of the next packet in the buffer or None if the packet is not complete yet
+        """
+        # The fixed header consists of at least the packet type and one byte of remaining length
+        if len(self._buffer) - self._position < 2:
+            return None
+        header_end, remaining_length = unpack_variable_byte_integer(self._buffer, self._position + 1)
+        if remaining_length is None:
+            return None
+        frame_end = header_end + remaining_length
+        if frame_end > len(self._buffer):
+            return None
+        return frame_end
@@ -1,7 +1,13 @@
+import functools
 import struct
 
 import packets.enums as enums
 import util.logger as logger
+from util.exceptions import MalformedPacketException
+
+VARIABLE_BYTE_INTEGER_MAX_BYTES = 4
+# Number of cached @PublishFrameBuilder objects
+MAX_PUBLISH_FRAME_BUILDERS = 1024
 
 
 # source: https://github.com/wialon/gmqtt/blob/afe79bfa89990c58ca0fb638e107290745d491a8/gmqtt/mqtt/utils.py#L61
@@ -11,12 +17,32 @@ def pack_variable_byte_integer(value):
         value, b = divmod(value, 128)
         if value > 0:
             b |= 0x80
-        remaining_bytes.extend(struct.pack('!B', b))
+        remaining_bytes.append(b)
         if value <= 0:
             break
     return remaining_bytes
 
 
+def unpack_variable_byte_integer(packet, position):
+    """
+    Decode a Variable Byte Integer according to the MQTTv5.0 specification Chapter 1.5.5 Variable Byte Integer
+    :param packet: the received packet
+    :param position: position of the first byte of the integer
+    :return: updated position and the decoded value or None if the packet does not contain the complete integer yet
+    :raises MalformedPacketException: if the integer is longer than the 4 bytes allowed by the specification
+    """
+    value = 0
+    for index in range(VARIABLE_BYTE_INTEGER_MAX_BYTES):
+        if position + index >= len(packet):
+            return position, None
+        encoded_byte = packet[position + index]
+        value |= (encoded_byte & 0x7f) << (7 * index)
+        if not encoded_byte & 0x80:
+            return position + index + 1, value
+    raise MalformedPacketException(f"Variable byte integer at position {position} exceeds "
+                                   f"{VARIABLE_BYTE_INTEGER_MAX_BYTES} bytes.")
+
+
 class MQTTPacketManager(object):
     @staticmethod
     def parse_packet(packet, client_socket, client_address, client_manager):
@@ -31,19 +57,21 @@ class MQTTPacketManager(object):
         fixed_header = packet[0]
         control_packet_type = (fixed_header >> 4) & 0xf
         control_packet_flags = fixed_header & 0xf
-        remaining_length = packet[1]
+        position, remaining_length = unpack_variable_byte_integer(packet, 1)
+        if remaining_length is None:
+            raise MalformedPacketException(f"Packet is too short to contain its remaining length: {packet}")
         if logger.DEBUG:
             logger.logging.debug(
                 f"\tControl_packet_type: {enums.PacketIdentifer(control_packet_type)} with flags: "
                 f"{control_packet_flags} and remaining length: {remaining_length}")
         if enums.PacketIdentifer(control_packet_type) == enums.PacketIdentifer.CONNECT:
-            return MQTTPacketManager.parse_connect(packet[2:], remaining_length)
+            return MQTTPacketManager.parse_connect(packet[position:], remaining_length)
         elif enums.PacketIdentifer(control_packet_type) == enums.PacketIdentifer.PUBLISH:
             return MQTTPacketManager.parse_publish(packet, remaining_length, client_socket, client_address,
-                                                   client_manager)
+                                                   client_manager, position)
         elif enums.PacketIdentifer(control_packet_type) == enums.PacketIdentifer.SUBSCRIBE:
-            return MQTTPacketManager.parse_subscribe(packet[2:], remaining_length, client_socket, client_address,
-                                                     client_manager)
+            return MQTTPacketManager.parse_subscribe(packet[position:], remaining_length, client_socket,
+                                                     client_address, client_manager)
         elif enums.PacketIdentifer(control_packet_type) == enums.PacketIdentifer.PINGREQ:
             return MQTTPacketManager.parse_pingreq()
         elif enums.PacketIdentifer(control_packet_type) == enums.PacketIdentifer.DISCONNECT:
@@ -118,65 +146,18 @@ class MQTTPacketManager(object):
         We allow any payload size, even if it exceeds the MQTT specification limit.
         """
 
-        # fixed header
-        control_packet_type = control_packet_type or enums.PacketIdentifer.PUBLISH.value
-        dup = dup or 0x0
-        qos = qos or 0x0
-        retain = retain or 0x0
-        fixed_header = control_packet_type << 4 | ((dup & 0x1) << 3) | (qos << 1) | (retain & 0x1)
-
-        # variable header
-        topic_name = bytes(topic.encode('utf-8'))
-        topic_length = topic_length or len(topic_name)
-
-        packet_identifier = packet_identifier or 1
-
-        # payload
-        encoded_payload = bytes(payload.encode('utf-8'))
-        encoded_payload_length = payload_length or len(encoded_payload)
-
-        if not remaining_length:
-            remaining_length = 2
-            remaining_length += topic_length
-            # packet identifier
-            remaining_length += 1
-            remaining_length += encoded_payload_length
-
-        pkg = bytearray()
-        pkg.extend(struct.pack(f'>B', fixed_header))
-        pkg.extend(pack_variable_byte_integer(remaining_length))
-
-        pkg.extend(struct.pack(f'>H{topic_length}sB', topic_length, topic_name, packet_identifier))
-        pkg.extend(encoded_payload)
-        return bytes(pkg)
+        builder = MQTTPacketManager.publish_frame_builder(topic, control_packet_type, dup, qos, retain,
+                                                          packet_identifier, topic_length)
+        return builder.build(payload, payload_length, remaining_length)
 
     @staticmethod
-    def parse_publish(packet, remaining_length, client_socket, client_address, client_manager):
+    @functools.lru_cache(maxsize=MAX_PUBLISH_FRAME_BUILDERS)
+    def publish_frame_builder(topic, control_packet_type=None, dup=None, qos=None, retain=None,
+                              packet_identifier=None, topic_length=None):
         """
-        Parse the PUBLISH message according to the MQTTv5.0 specification Chapter 3.3 PUBLISH – Publish message. Also
-        supports MQTTv3.1.1.
-        :param client_manager: manager of the client connections (@ClientManager)
-        :param client_socket: socket of the publishing client
-        :param client_address: address of the publishing client
-        :param packet: the raw bytes packet that was received
-        :param remaining_length: remaining length of the packet
-        :return: a dictionary containing meaningful values of the received packet
-                (identifier, topic, properties, payload)
+        Returns the cached @PublishFrameBuilder of a topic and header flags, see @prepare_publish for the parameters.
         """
-        parsed_msg = {'identifier': enums.PacketIdentifer.PUBLISH, 'raw_packet': packet}
-        current_pos = 2
-        current_pos, parsed_msg['topic'] = MQTTPacketManager.extract_topic(packet, current_pos)
-        parsed_msg['properties'] = {}
-
-        if client_manager.get_user_properties(client_socket, client_address)[enums.Properties.Version] \
-                == enums.Version.MQTTv5.value:
-            current_pos, properties = MQTTPacketManager.extract_properties(packet, current_pos)
-            if len(properties) != 0:
-                for user_property in properties:
-                    parsed_msg['properties'][user_property] = properties[user_property]
-
-        current_pos, parsed_msg['payload'] = MQTTPacketManager.extract_publish_payload(packet, current_pos)
-        return parsed_msg
+        return PublishFrameBuilder(topic, control_packet_type, dup, qos, retain, packet_identifier, topic_length)
 
     @staticmethod
     def parse_disconnect():
@@ -189,32 +170,23 @@ class MQTTPacketManager(object):
         return parsed_msg
 
     @staticmethod
-    def parse_publish(packet, remaining_length, client_socket, client_address, client_manager):
+    def parse_publish(packet, remaining_length, client_socket, client_address, client_manager, position=2):
         """
         Parse the PUBLISH message according to the MQTTv5.0 specification Chapter 3.3 PUBLISH – Publish message. Also
         supports MQTTv3.1.1.
+        The fields are decoded lazily from a memoryview of the packet, see @PublishPacketView.
         :param client_manager: manager of the client connections (@ClientManager)
         :param client_socket: socket of the publishing client
         :param client_address: address of the publishing client
         :param packet: the raw bytes packet that was received
         :param remaining_length: remaining length of the packet
-        :return: a dictionary containing meaningful values of the received packet
-                (identifier, topic, properties, payload)
+        :param position: position of the variable header, after the fixed header of the packet
+        :return: a dictionary-like view containing meaningful values of the received packet
+                (identifier, raw_packet, topic, properties, payload)
         """
-        parsed_msg = {'identifier': enums.PacketIdentifer.PUBLISH, 'raw_packet': packet}
-        current_pos = 2
-        current_pos, parsed_msg['topic'] = MQTTPacketManager.extract_topic(packet, current_pos)
-        parsed_msg['properties'] = {}
-
-        if client_manager.get_user_properties(client_socket, client_address)[enums.Properties.Version] \
-                == enums.Version.MQTTv5.value:
-            current_pos, properties = MQTTPacketManager.extract_properties(packet, current_pos)
-            if len(properties) != 0:
-                for user_property in properties:
-                    parsed_msg['properties'][user_property] = properties[user_property]
-
-        current_pos, parsed_msg['payload'] = MQTTPacketManager.extract_publish_payload(packet, current_pos)
-        return parsed_msg
+        is_mqtt_v5 = client_manager.get_user_properties(client_socket, client_address)[enums.Properties.Version] \
+            == enums.Version.MQTTv5.value
+        return PublishPacketView(packet, position, is_mqtt_v5)
 
     @staticmethod
     def parse_subscribe(packet, remaining_length, client_socket, client_address, client_manager):
@@ -384,7 +356,7 @@ class MQTTPacketManager(object):
         length_lsb = packet[position]
         position += 1
         length = (length_msb << 8) | length_lsb
-        topic = packet[position: position + length].decode('utf-8', errors='ignore')
+        topic = str(packet[position: position + length], 'utf-8', errors='ignore')
         position += length
         if logger.DEBUG:
             logger.logging.debug(f"\tTopic: {topic}")
@@ -398,10 +370,11 @@ class MQTTPacketManager(object):
         :param position: current byte position in the packet
         :return: updated position and the payload of the PUBLISH packet
         """
-        payload = packet[position:].decode("utf-8", errors='ignore')
+        raw_payload = packet[position:]
+        payload = str(raw_payload, "utf-8", errors='ignore')
         position = position + len(payload)
         if logger.DEBUG:
-            logger.logging.debug(f"\tPayload: {payload}")
+            logger.logging.debug("\tPayload: %s", logger.PacketFormatter(raw_payload))
         return position, payload
 
     @staticmethod
@@ -511,14 +484,15 @@ class MQTTPacketManager(object):
             current_pos += 1
             length_first_user_property = packet[current_pos]
             current_pos += 1
-            first_user_property = packet[current_pos: current_pos + length_first_user_property].decode('utf-8', errors='ignore').lower()
+            first_user_property = str(packet[current_pos: current_pos + length_first_user_property], 'utf-8',
+                                      errors='ignore').lower()
             current_pos += length_first_user_property
             # unused_field = packet[current_pos]
             current_pos += 1
             length_second_user_property = packet[current_pos]
             current_pos += 1
-            second_user_property = packet[current_pos: current_pos + length_second_user_property].decode(
-                'utf-8').lower()
+            second_user_property = str(packet[current_pos: current_pos + length_second_user_property],
+                                       'utf-8').lower()
             current_pos += length_second_user_property
             properties[identifier] = {first_user_property: second_user_property}
 
@@ -552,3 +526,138 @@ class MQTTPacketManager(object):
         if logger.DEBUG:
             logger.logging.debug(f"\tClientID: {client_id}")
         return position, client_id
+
+
+class PublishPacketView(object):
+    """
+    Zero-copy representation of a received PUBLISH packet.
+    Only the offsets of the packet are stored. The topic, properties and payload are decoded from a memoryview of the
+    packet when they are accessed for the first time, while 'raw_packet' returns the original packet object, so that
+    forwarding it to subscribers does not depend on the payload size.
+    Supports the same keys as the dictionaries of the other parse_* methods.
+    """
+    _KEYS = ('identifier', 'raw_packet', 'topic', 'properties', 'payload')
+
+    def __init__(self, packet, position, is_mqtt_v5):
+        """
+        :param packet: the complete received packet including its fixed header
+        :param position: position of the variable header in the packet
+        :param is_mqtt_v5: whether the variable header contains properties (MQTTv5.0)
+        """
+        self._packet = packet
+        self._view = memoryview(packet)
+        self._is_mqtt_v5 = is_mqtt_v5
+        self._topic_position = position
+        self._properties_position = position + 2 + ((packet[position] << 8) | packet[position + 1])
+        self._payload_position = None
+        self._topic = None
+        self._properties = None
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._KEYS
+
+    @property
+    def identifier(self):
+        return enums.PacketIdentifer.PUBLISH
+
+    @property
+    def raw_packet(self):
+        return self._packet
+
+    @property
+    def topic(self):
+        if self._topic is None:
+            _, self._topic = MQTTPacketManager.extract_topic(self._view, self._topic_position)
+        return self._topic
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            self._parse_properties()
+        return self._properties
+
+    @property
+    def payload_view(self):
+        """
+        :return: the payload as memoryview on the received packet, without copying it
+        """
+        if self._payload_position is None:
+            self._parse_properties()
+        return self._view[self._payload_position:]
+
+    @property
+    def payload_length(self):
+        return len(self.payload_view)
+
+    @property
+    def payload(self):
+        _, payload = MQTTPacketManager.extract_publish_payload(self.payload_view, 0)
+        return payload
+
+    def _parse_properties(self):
+        self._properties = {}
+        self._payload_position = self._properties_position
+        if self._is_mqtt_v5:
+            self._payload_position, properties = MQTTPacketManager.extract_properties(self._view,
+                                                                                      self._properties_position)
+            self._properties.update(properties)
+
+
+class PublishFrameBuilder(object):
+    """
+    Builds PUBLISH frames of one topic and one set of header flags (see @MQTTPacketManager.prepare_publish).
+    The fixed header byte and the variable header are encoded once, so a frame only needs the remaining length and
+    the encoded payload. @segments returns the parts of a frame without joining them, e.g. for socket.sendmsg.
+    """
+    _FIXED_HEADER = struct.Struct('>BB')
+
+    def __init__(self, topic, control_packet_type=None, dup=None, qos=None, retain=None, packet_identifier=None,
+                 topic_length=None):
+        """
+        :param topic: topic of the frames
+        :param topic_length: overrides the encoded topic length, the topic is truncated or padded with zero bytes
+        """
+        # fixed header
+        control_packet_type = control_packet_type or enums.PacketIdentifer.PUBLISH.value
+        dup = dup or 0x0
+        qos = qos or 0x0
+        retain = retain or 0x0
+        self._fixed_header = control_packet_type << 4 | ((dup & 0x1) << 3) | (qos << 1) | (retain & 0x1)
+
+        # variable header
+        topic_name = topic.encode('utf-8')
+        topic_length = topic_length or len(topic_name)
+        packet_identifier = packet_identifier or 1
+        self._variable_header = struct.Struct(f'>H{topic_length}sB').pack(topic_length, topic_name,
+                                                                          packet_identifier)
+        # the packet identifier is counted as one byte
+        self._variable_header_length = 2 + topic_length + 1
+
+    def segments(self, payload, payload_length=None, remaining_length=None):
+        """
+        :param payload: the payload as str or bytes-like object
+        :param payload_length: overrides the payload length that is used to calculate the remaining length
+        :param remaining_length: overrides the remaining length of the fixed header
+        :return: list of the fixed header, the variable header and the encoded payload
+        """
+        encoded_payload = payload.encode('utf-8') if isinstance(payload, str) else payload
+
+        if not remaining_length:
+            remaining_length = self._variable_header_length + (payload_length or len(encoded_payload))
+
+        if remaining_length < 128:
+            fixed_header = self._FIXED_HEADER.pack(self._fixed_header, remaining_length)
+        else:
+            fixed_header = bytes((self._fixed_header,)) + pack_variable_byte_integer(remaining_length)
+        return [fixed_header, self._variable_header, encoded_payload]
+
+    def build(self, payload, payload_length=None, remaining_length=None):
+        """
+        :return: the encoded PUBLISH frame, see @segments for the parameters
+        """
+        return b''.join(self.segments(payload, payload_length, remaining_length))
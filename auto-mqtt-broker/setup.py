@@ -3,5 +3,5 @@ import setuptools
 setuptools.setup(
     name="auto-mqtt-broker",
     version="1.0",
-    packages=['auto-mqtt-broker', 'uvloop', 'gmqtt', 'bitarray']
+    packages=['auto-mqtt-broker', 'uvloop', 'gmqtt']
 )
@@ -1,3 +1,8 @@
+import os
+
+from broker.listener.outbound_queue import DEFAULT_HIGH_WATER_MARK, DEFAULT_OVERFLOW_POLICY, OVERFLOW_POLICIES
+from broker.listener.publish_scheduler import AUTO_PUBLISH_START_DELAY
+from broker.listener.token_bucket import DEFAULT_RAMP_UP_STEPS, RAMP_UP_PROFILES
 from broker.message_generators.message_generator import MessageGeneratorConfig
 
 LISTENER_IDENTIFIER = "[LISTENER]"
@@ -80,10 +85,40 @@ class BrokerConfigReader(object):
                     listenerconfig.is_auto_publish = value
                 elif identifier == "AUTO_PUBLISH_INTERVAL":
                     listenerconfig.auto_publish_interval = value
+                elif identifier == "AUTO_PUBLISH_JITTER":
+                    listenerconfig.auto_publish_jitter = value
+                elif identifier == "AUTO_PUBLISH_START_DELAY":
+                    listenerconfig.auto_publish_start_delay = value
+                elif identifier == "AUTO_PUBLISH_BURST":
+                    listenerconfig.auto_publish_burst = value
+                elif identifier == "AUTO_PUBLISH_RATE":
+                    listenerconfig.auto_publish_rate = value
+                elif identifier == "AUTO_PUBLISH_RAMP_UP":
+                    listenerconfig.auto_publish_ramp_up = value
+                elif identifier == "AUTO_PUBLISH_RAMP_UP_DURATION":
+                    listenerconfig.auto_publish_ramp_up_duration = value
+                elif identifier == "AUTO_PUBLISH_RAMP_UP_STEPS":
+                    listenerconfig.auto_publish_ramp_up_steps = value
+                elif identifier == "AUTO_PUBLISH_MAX_DURATION":
+                    listenerconfig.auto_publish_max_duration = value
                 elif identifier == "MESSAGE_GENERATOR_TYPE":
                     listenerconfig.message_generator_config.generator_type = value
                 elif identifier == "MESSAGE_GENERATOR_TOPIC":
                     listenerconfig.message_generator_config.topic = value
+                elif identifier == "MESSAGE_GENERATOR_CORPUS_FILE":
+                    listenerconfig.message_generator_config.corpus_file = value
+                elif identifier == "MESSAGE_GENERATOR_CAPTURE_FILE":
+                    listenerconfig.message_generator_config.capture_file = value
+                elif identifier == "MESSAGE_GENERATOR_REPLAY_CONNECTION":
+                    listenerconfig.message_generator_config.replay_connection = value
+                elif identifier == "MESSAGE_GENERATOR_REPLAY_SPEED":
+                    listenerconfig.message_generator_config.replay_speed = value
+                elif identifier == "MESSAGE_GENERATOR_SEED":
+                    listenerconfig.message_generator_config.seed = value
+                elif identifier == "OUTBOUND_HIGH_WATER_MARK":
+                    listenerconfig.outbound_high_water_mark = value
+                elif identifier == "OUTBOUND_OVERFLOW_POLICY":
+                    listenerconfig.outbound_overflow_policy = value
             except FileNotFoundError:
                 print(
                     f"An error has occurred at the value of your setting '{identifier}'. "
@@ -127,8 +162,74 @@ class BrokerConfigReader(object):
         elif identifier == "AUTO_PUBLISH_INTERVAL":
             # Raises a ValueError if cast is not possible
             return float(value)
+        elif identifier == "AUTO_PUBLISH_JITTER" or identifier == "AUTO_PUBLISH_START_DELAY":
+            # Raises a ValueError if cast is not possible
+            value = float(value)
+            if value < 0:
+                raise ValueError
+            return value
+        elif identifier == "AUTO_PUBLISH_BURST":
+            # Raises a ValueError if cast is not possible
+            value = int(value)
+            if value < 1:
+                raise ValueError
+            return value
+        elif identifier == "AUTO_PUBLISH_RATE" or identifier == "AUTO_PUBLISH_MAX_DURATION":
+            # Raises a ValueError if cast is not possible
+            value = float(value)
+            if value <= 0:
+                raise ValueError
+            return value
+        elif identifier == "AUTO_PUBLISH_RAMP_UP":
+            if value.lower() not in RAMP_UP_PROFILES:
+                raise ValueError
+            return value.lower()
+        elif identifier == "AUTO_PUBLISH_RAMP_UP_DURATION":
+            # Raises a ValueError if cast is not possible
+            value = float(value)
+            if value < 0:
+                raise ValueError
+            return value
+        elif identifier == "AUTO_PUBLISH_RAMP_UP_STEPS":
+            # Raises a ValueError if cast is not possible
+            value = int(value)
+            if value < 1:
+                raise ValueError
+            return value
         elif identifier == "MESSAGE_GENERATOR_TYPE" or identifier == "MESSAGE_GENERATOR_TOPIC":
             return value
+        elif identifier == "MESSAGE_GENERATOR_CORPUS_FILE" or identifier == "MESSAGE_GENERATOR_CAPTURE_FILE":
+            if not os.path.isfile(value):
+                raise FileNotFoundError
+            return value
+        elif identifier == "MESSAGE_GENERATOR_REPLAY_CONNECTION":
+            # Raises a ValueError if cast is not possible
+            value = int(value)
+            if value < 1:
+                raise ValueError
+            return value
+        elif identifier == "MESSAGE_GENERATOR_REPLAY_SPEED":
+            # Raises a ValueError if cast is not possible
+            value = float(value)
+            if value < 0:
+                raise ValueError
+            return value
+        elif identifier == "MESSAGE_GENERATOR_SEED":
+            # Raises a ValueError if cast is not possible
+            value = int(value)
+            if not 0 <= value < 2 ** 63:
+                raise ValueError
+            return value
+        elif identifier == "OUTBOUND_HIGH_WATER_MARK":
+            # Raises a ValueError if cast is not possible
+            value = int(value)
+            if value <= 0:
+                raise ValueError
+            return value
+        elif identifier == "OUTBOUND_OVERFLOW_POLICY":
+            if value.lower() not in OVERFLOW_POLICIES:
+                raise ValueError
+            return value.lower()
         else:
             raise SyntaxError
 
@@ -142,7 +243,17 @@ class ListenerConfig(object):
         self._port = 1883
         self._is_auto_publish = False
         self._auto_publish_interval = 5
+        self._auto_publish_jitter = 0
+        self._auto_publish_start_delay = AUTO_PUBLISH_START_DELAY
+        self._auto_publish_burst = 1
+        self._auto_publish_rate = None
+        self._auto_publish_ramp_up = None
+        self._auto_publish_ramp_up_duration = 0
+        self._auto_publish_ramp_up_steps = DEFAULT_RAMP_UP_STEPS
+        self._auto_publish_max_duration = None
         self._message_generator_config: MessageGeneratorConfig = MessageGeneratorConfig()
+        self._outbound_high_water_mark = DEFAULT_HIGH_WATER_MARK
+        self._outbound_overflow_policy = DEFAULT_OVERFLOW_POLICY
 
     def __str__(self):
         """
@@ -175,6 +286,86 @@ class ListenerConfig(object):
     def auto_publish_interval(self, value):
         self._auto_publish_interval = value
 
+    @property
+    def auto_publish_jitter(self):
+        return self._auto_publish_jitter
+
+    @auto_publish_jitter.setter
+    def auto_publish_jitter(self, value):
+        self._auto_publish_jitter = value
+
+    @property
+    def auto_publish_start_delay(self):
+        return self._auto_publish_start_delay
+
+    @auto_publish_start_delay.setter
+    def auto_publish_start_delay(self, value):
+        self._auto_publish_start_delay = value
+
+    @property
+    def auto_publish_burst(self):
+        return self._auto_publish_burst
+
+    @auto_publish_burst.setter
+    def auto_publish_burst(self, value):
+        self._auto_publish_burst = value
+
+    @property
+    def auto_publish_rate(self):
+        return self._auto_publish_rate
+
+    @auto_publish_rate.setter
+    def auto_publish_rate(self, value):
+        self._auto_publish_rate = value
+
+    @property
+    def auto_publish_ramp_up(self):
+        return self._auto_publish_ramp_up
+
+    @auto_publish_ramp_up.setter
+    def auto_publish_ramp_up(self, value):
+        self._auto_publish_ramp_up = value
+
+    @property
+    def auto_publish_ramp_up_duration(self):
+        return self._auto_publish_ramp_up_duration
+
+    @auto_publish_ramp_up_duration.setter
+    def auto_publish_ramp_up_duration(self, value):
+        self._auto_publish_ramp_up_duration = value
+
+    @property
+    def auto_publish_ramp_up_steps(self):
+        return self._auto_publish_ramp_up_steps
+
+    @auto_publish_ramp_up_steps.setter
+    def auto_publish_ramp_up_steps(self, value):
+        self._auto_publish_ramp_up_steps = value
+
+    @property
+    def auto_publish_max_duration(self):
+        return self._auto_publish_max_duration
+
+    @auto_publish_max_duration.setter
+    def auto_publish_max_duration(self, value):
+        self._auto_publish_max_duration = value
+
     @property
     def message_generator_config(self):
         return self._message_generator_config
+
+    @property
+    def outbound_high_water_mark(self):
+        return self._outbound_high_water_mark
+
+    @outbound_high_water_mark.setter
+    def outbound_high_water_mark(self, value):
+        self._outbound_high_water_mark = value
+
+    @property
+    def outbound_overflow_policy(self):
+        return self._outbound_overflow_policy
+
+    @outbound_overflow_policy.setter
+    def outbound_overflow_policy(self, value):
+        self._outbound_overflow_policy = value
@@ -0,0 +1,115 @@
+import json
+import threading
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+from util import logger
+
+END_LIFETIME_COMMAND = "end_lifetime"
+STATUS_COMMAND = "status"
+
+
+class TestCaseTracker(object):
+    """
+    Records the auto published messages (test cases) that were sent during a lifetime of the system under test.
+    A test case is identified by its connection, whose ID is also the random stream of its message generator (see
+    MESSAGE_GENERATOR_SEED), and the index of the message in that stream. A lifetime covers all test cases since the
+    end of the previous lifetime, so the monitor only has to report the end of a lifetime before it restarts the
+    system under test.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # connection ID -> [first message index, last message index, number of messages]
+        self._ranges = {}
+        self._lock = threading.Lock()
+
+    def record(self, connection_id, message_index):
+        """
+        :param connection_id: ID of the connection that the message was sent to
+        :param message_index: index of the message in the stream of the connection
+        """
+        with self._lock:
+            test_cases = self._ranges.get(connection_id)
+            if test_cases is None:
+                self._ranges[connection_id] = [message_index, message_index, 1]
+            else:
+                test_cases[1] = message_index
+                test_cases[2] += 1
+
+    def status(self):
+        """
+        :return: the test cases of the current lifetime
+        """
+        with self._lock:
+            return self._summary(self._ranges)
+
+    def end_lifetime(self, lifetime, reason):
+        """
+        End the current lifetime of the system under test
+        :param lifetime: number of the lifetime, assigned by the monitor
+        :param reason: why the lifetime ended, e.g. 'exit' or 'hang'
+        :return: the test cases that the lifetime covered
+        """
+        with self._lock:
+            ranges, self._ranges = self._ranges, {}
+        summary = self._summary(ranges)
+        summary.update(lifetime=lifetime, reason=reason)
+        logger.logging.info(f"Lifetime {lifetime} of the system under test ended ({reason}) after "
+                            f"{summary['test_cases']} test cases: " +
+                            (", ".join(f"connection {connection['connection_id']} messages "
+                                       f"{connection['first']}-{connection['last']}"
+                                       for connection in summary["connections"]) or "none"))
+        return summary
+
+    @staticmethod
+    def _summary(ranges):
+        return {
+            "test_cases": sum(count for _, _, count in ranges.values()),
+            "connections": [{"connection_id": connection_id, "first": first, "last": last, "count": count}
+                            for connection_id, (first, last, count) in sorted(ranges.items())],
+        }
+
+
+TEST_CASES = TestCaseTracker()
+
+
+class _ControlRequestHandler(StreamRequestHandler):
+    """
+    Handles one connection of the control channel: every line is a JSON command, every reply a JSON line
+    """
+    tracker = TEST_CASES
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = self._execute(json.loads(line))
+            except (ValueError, TypeError, KeyError) as e:
+                reply = {"error": f"invalid command: {e}"}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+    def _execute(self, command):
+        if command["command"] == END_LIFETIME_COMMAND:
+            return self.tracker.end_lifetime(int(command["lifetime"]), str(command.get("reason", "")))
+        if command["command"] == STATUS_COMMAND:
+            return self.tracker.status()
+        return {"error": f"unknown command '{command['command']}'"}
+
+
+class _ControlServer(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def start_control_server(port, host="127.0.0.1"):
+    """
+    Serve the control channel of the monitor on host:port in a daemon thread and start recording the test cases
+    :param port: TCP port of the control channel
+    :param host: interface of the control channel, only local by default
+    :return: the running ThreadingTCPServer
+    """
+    server = _ControlServer((host, port), _ControlRequestHandler)
+    TEST_CASES.enabled = True
+    threading.Thread(target=server.serve_forever, name="control-server", daemon=True).start()
+    return server
@@ -4,3 +4,7 @@ class IncorrectProtocolOrderException(Exception):
 
 class MQTTMessageNotSupportedException(Exception):
     pass
+
+
+class MalformedPacketException(Exception):
+    pass
@@ -1,13 +1,81 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 import warnings
 
-logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.DEBUG, stream=sys.stdout)
+LOG_FORMAT = '%(asctime)s : %(levelname)s : %(message)s'
+# Number of bytes of a packet that are rendered in log messages
+MAX_LOGGED_PACKET_BYTES = 64
+
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 
 DEBUG = 0
 
 
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands the unformatted log records to the @QueueListener thread, which formats and writes them, so that logging
+    never blocks on stdout and messages with arguments are only formatted there
+    """
+
+    def prepare(self, record):
+        return record
+
+
+_queue_handler = _LazyQueueHandler(queue.SimpleQueue())
+_console_handler = logging.StreamHandler(sys.stdout)
+_console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+_queue_listener = None
+
+
+def _start_queue_listener():
+    global _queue_listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _queue_listener = logging.handlers.QueueListener(_queue_handler.queue, _console_handler)
+    _queue_listener.start()
+
+
+def _stop_queue_listener():
+    if _queue_listener is not None:
+        _queue_listener.stop()
+
+
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_start_queue_listener()
+atexit.register(_stop_queue_listener)
+# The listener thread does not exist in forked broker workers
+os.register_at_fork(after_in_child=_start_queue_listener)
+
+
+def configure(debug):
+    """
+    Set the debug mode, debug messages are only logged in debug mode
+    :param debug: debug mode on/off
+    """
+    global DEBUG
+    DEBUG = debug
+    logging.getLogger().setLevel(logging.DEBUG if debug else logging.INFO)
+
+
+class PacketFormatter(object):
+    """
+    Renders a packet for a log message when the message is formatted, truncated to 'limit' bytes
+    """
+    __slots__ = ('_packet', '_limit')
+
+    def __init__(self, packet, limit=MAX_LOGGED_PACKET_BYTES):
+        self._packet = packet
+        self._limit = limit
+
+    def __str__(self):
+        if len(self._packet) <= self._limit:
+            return repr(bytes(self._packet))
+        return f"{bytes(self._packet[:self._limit])!r}... ({len(self._packet)} bytes)"
+
+
 def print_listener_configs(listener_configs):
     """
     Print the initialized @ListenerConfig objects
@@ -0,0 +1,415 @@
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COUNTER = "counter"
+GAUGE = "gauge"
+SUMMARY = "summary"
+
+# Histogram buckets: values below 2^SUB_BUCKET_BITS microseconds are counted exactly, larger values in
+# 2^(SUB_BUCKET_BITS - 1) logarithmic sub-buckets per power of two (about 6 % relative error)
+SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << (SUB_BUCKET_BITS - 1)
+_LINEAR_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_HISTOGRAM_BITS = 40
+HISTOGRAM_BUCKETS = _LINEAR_BUCKETS + MAX_HISTOGRAM_BITS * _SUB_BUCKETS
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _ThreadCells(object):
+    """
+    Per-thread cells of a metric. Every thread only updates its own cell, so updates need no lock and readers sum up
+    the cells of all threads. When a thread exits, its cell is merged into a base cell, so that the number of cells
+    stays bounded by the number of live threads.
+    """
+
+    def __init__(self, new_cell, merge):
+        """
+        :param new_cell: function that returns an empty cell
+        :param merge: function(target, cell) that adds a cell to the target cell
+        """
+        self._new_cell = new_cell
+        self._merge = merge
+        self._local = threading.local()
+        self._base = new_cell()
+        # id(cell) -> cell of a live thread
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+            with self._lock:
+                self._cells[id(cell)] = cell
+            # The thread-local values of a thread are released when it exits
+            owner = _CellOwner()
+            weakref.finalize(owner, _ThreadCells._retire, self._lock, self._cells, self._base, self._merge, cell)
+            self._local.owner = owner
+            self._local.cell = cell
+            return cell
+
+    @staticmethod
+    def _retire(lock, cells, base, merge, cell):
+        with lock:
+            merge(base, cell)
+            del cells[id(cell)]
+
+    def __iter__(self):
+        with self._lock:
+            return iter([self._base] + list(self._cells.values()))
+
+
+class _CellOwner(object):
+    pass
+
+
+def _merge_counter(target, cell):
+    target[0] += cell[0]
+
+
+def _merge_histogram(target, cell):
+    target_counts = target[0]
+    for index, count in enumerate(cell[0]):
+        if count:
+            target_counts[index] += count
+    target[1] += cell[1]
+
+
+class Counter(object):
+    def __init__(self):
+        self._cells = _ThreadCells(lambda: [0], _merge_counter)
+
+    def inc(self, amount=1):
+        self._cells.get()[0] += amount
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in self._cells)
+
+
+class Gauge(object):
+    """
+    Gauge that is either set explicitly or read from a function when the metrics are collected
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._function = None
+
+    def set(self, value):
+        self._value = value
+
+    def set_function(self, function):
+        self._function = function
+
+    @property
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+def histogram_bucket(value):
+    """
+    :param value: non-negative integer value
+    :return: index of the HDR-style bucket of the value
+    """
+    if value < _LINEAR_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return min(_LINEAR_BUCKETS + (shift - 1) * _SUB_BUCKETS + (value >> shift) - _SUB_BUCKETS,
+               HISTOGRAM_BUCKETS - 1)
+
+
+def histogram_bucket_value(index):
+    """
+    :param index: index of a bucket
+    :return: the middle of the value range of the bucket
+    """
+    if index < _LINEAR_BUCKETS:
+        return index
+    shift = (index - _LINEAR_BUCKETS) // _SUB_BUCKETS + 1
+    mantissa = (index - _LINEAR_BUCKETS) % _SUB_BUCKETS + _SUB_BUCKETS
+    return ((mantissa << shift) + ((mantissa + 1) << shift)) / 2
+
+
+class Histogram(object):
+    """
+    Histogram of durations in seconds with logarithmic buckets of microseconds, see @histogram_bucket
+    """
+
+    def __init__(self):
+        # cell: [bucket counts, sum of the observed values]
+        self._cells = _ThreadCells(lambda: [[0] * HISTOGRAM_BUCKETS, 0.0], _merge_histogram)
+
+    def observe(self, seconds):
+        cell = self._cells.get()
+        cell[0][histogram_bucket(max(int(seconds * 1000000), 0))] += 1
+        cell[1] += seconds
+
+    def snapshot(self):
+        """
+        :return: merged bucket counts and the sum of all observed values
+        """
+        counts = [0] * HISTOGRAM_BUCKETS
+        total = 0.0
+        for cell_counts, cell_sum in self._cells:
+            counts = [a + b for a, b in zip(counts, cell_counts)]
+            total += cell_sum
+        return counts, total
+
+    @staticmethod
+    def quantiles(counts, quantiles=QUANTILES):
+        """
+        :param counts: bucket counts of @snapshot
+        :param quantiles: the requested quantiles
+        :return: list of the quantile values in seconds
+        """
+        count = sum(counts)
+        values = []
+        index = 0
+        seen = counts[0] if counts else 0
+        for quantile in quantiles:
+            rank = quantile * count
+            while seen < rank and index < len(counts) - 1:
+                index += 1
+                seen += counts[index]
+            values.append(histogram_bucket_value(index) / 1000000 if count else 0.0)
+        return values
+
+
+_METRIC_TYPES = {COUNTER: Counter, GAUGE: Gauge, SUMMARY: Histogram}
+
+
+class MetricFamily(object):
+    """
+    All time series of a metric name, one per combination of label values
+    """
+
+    def __init__(self, name, help_text, metric_type, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self._metrics = {}
+        # Sum of the counters of removed label values, so that totals do not decrease
+        self._removed_total = 0
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        :param values: one value per label name
+        :return: the metric of the label values, created on first use
+        """
+        metric = self._metrics.get(values)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(values)
+                if metric is None:
+                    metric = _METRIC_TYPES[self.metric_type]()
+                    self._metrics[values] = metric
+        return metric
+
+    def remove(self, *values):
+        """
+        Remove the metric of label values, e.g. of a closed connection
+        """
+        with self._lock:
+            metric = self._metrics.pop(values, None)
+            if metric is not None and self.metric_type == COUNTER:
+                self._removed_total += metric.value
+
+    def items(self):
+        with self._lock:
+            return list(self._metrics.items())
+
+    def total(self):
+        """
+        :return: sum of all counters or gauges of the family, including removed counters
+        """
+        return self._removed_total + sum(metric.value for _, metric in self.items())
+
+    def render(self):
+        """
+        :return: the family in the Prometheus text exposition format
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for values, metric in self.items():
+            labels = list(zip(self.label_names, values))
+            if self.metric_type == SUMMARY:
+                counts, total = metric.snapshot()
+                for quantile, value in zip(QUANTILES, Histogram.quantiles(counts)):
+                    lines.append(f"{self.name}{_format_labels(labels + [('quantile', quantile)])} {value}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {sum(counts)}")
+            else:
+                lines.append(f"{self.name}{_format_labels(labels)} {metric.value}")
+        return "\n".join(lines)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class MetricsRegistry(object):
+    """
+    Process-wide registry of the metric families
+    """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _family(self, name, help_text, metric_type, label_names):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = MetricFamily(name, help_text, metric_type, label_names)
+                self._families[name] = family
+            return family
+
+    def counter(self, name, help_text, label_names=()):
+        return self._family(name, help_text, COUNTER, label_names)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._family(name, help_text, GAUGE, label_names)
+
+    def summary(self, name, help_text, label_names=()):
+        return self._family(name, help_text, SUMMARY, label_names)
+
+    def render(self):
+        """
+        :return: all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            families = list(self._families.values())
+        return "\n".join(family.render() for family in families) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+CONNECTIONS = METRICS.counter("mqtt_broker_connections_total", "Accepted client connections")
+CLOSED_CONNECTIONS = METRICS.counter("mqtt_broker_closed_connections_total", "Closed client connections")
+OPEN_CONNECTIONS = METRICS.gauge("mqtt_broker_open_connections", "Currently open client connections")
+OPEN_CONNECTIONS.labels().set_function(lambda: CONNECTIONS.total() - CLOSED_CONNECTIONS.total())
+SENT_MESSAGES = METRICS.counter("mqtt_broker_sent_messages_total", "Packets queued for a client",
+                                ("listener", "client"))
+SENT_BYTES = METRICS.counter("mqtt_broker_sent_bytes_total", "Bytes queued for a client", ("listener", "client"))
+DROPPED_MESSAGES = METRICS.counter("mqtt_broker_dropped_messages_total",
+                                   "Packets dropped because of the outbound high-water mark", ("listener", "client"))
+RECEIVED_BYTES = METRICS.counter("mqtt_broker_received_bytes_total", "Bytes received from a client",
+                                 ("listener", "client"))
+PUBLISHED_MESSAGES = METRICS.counter("mqtt_broker_auto_published_messages_total",
+                                     "Auto published PUBLISH messages", ("listener", "client"))
+PUBLISHED_BYTES = METRICS.counter("mqtt_broker_auto_published_bytes_total", "Bytes of auto published messages",
+                                  ("listener", "client"))
+QUEUED_BYTES = METRICS.gauge("mqtt_broker_outbound_queue_bytes", "Bytes in the outbound queue of a client",
+                             ("listener", "client"))
+GENERATOR_SECONDS = METRICS.summary("mqtt_broker_generator_seconds",
+                                    "Time to generate the next message of a message generator", ("generator",))
+PUBLISH_LAG_SECONDS = METRICS.summary("mqtt_broker_publish_lag_seconds",
+                                      "Delay of auto publishes behind their scheduled deadline", ("listener",))
+
+
+class ConnectionMetrics(object):
+    """
+    Metrics of a single client connection, labeled with the listener port and the client address
+    """
+
+    def __init__(self, listener_port, client_address):
+        self._labels = (str(listener_port), ":".join(str(part) for part in client_address))
+        self.sent_messages = SENT_MESSAGES.labels(*self._labels)
+        self.sent_bytes = SENT_BYTES.labels(*self._labels)
+        self.dropped_messages = DROPPED_MESSAGES.labels(*self._labels)
+        self.received_bytes = RECEIVED_BYTES.labels(*self._labels)
+        self.published_messages = PUBLISHED_MESSAGES.labels(*self._labels)
+        self.published_bytes = PUBLISHED_BYTES.labels(*self._labels)
+        self._is_open = True
+
+    def set_queue(self, queue):
+        """
+        Report the queued bytes of the outbound queue of the connection
+        :param queue: the @OutboundQueue
+        """
+        QUEUED_BYTES.labels(*self._labels).set_function(lambda: queue.queued_bytes)
+
+    def close(self):
+        """
+        Remove the time series of the connection
+        """
+        if not self._is_open:
+            return
+        self._is_open = False
+        CLOSED_CONNECTIONS.labels().inc()
+        for family in (SENT_MESSAGES, SENT_BYTES, DROPPED_MESSAGES, RECEIVED_BYTES, PUBLISHED_MESSAGES,
+                       PUBLISHED_BYTES, QUEUED_BYTES):
+            family.remove(*self._labels)
+
+
+class SummaryReporter(object):
+    """
+    Formats a periodic one-line summary of the broker metrics with the rates since the previous line
+    """
+
+    def __init__(self, clock):
+        """
+        :param clock: function that returns the current time in seconds, e.g. time.monotonic
+        """
+        self._clock = clock
+        self._previous_time = clock()
+        self._previous_messages = 0
+        self._previous_bytes = 0
+
+    def line(self):
+        now = self._clock()
+        elapsed = max(now - self._previous_time, 1e-9)
+        messages = SENT_MESSAGES.total()
+        sent_bytes = SENT_BYTES.total()
+        message_rate = (messages - self._previous_messages) / elapsed
+        byte_rate = (sent_bytes - self._previous_bytes) / elapsed
+        self._previous_time, self._previous_messages, self._previous_bytes = now, messages, sent_bytes
+
+        generator_p99 = max((Histogram.quantiles(metric.snapshot()[0], (0.99,))[0]
+                             for _, metric in GENERATOR_SECONDS.items()), default=0.0)
+        return (f"connections: {OPEN_CONNECTIONS.total()} open / {CONNECTIONS.total()} total, "
+                f"sent: {messages} msgs ({message_rate:.1f}/s), {sent_bytes} bytes ({byte_rate:.1f} B/s), "
+                f"dropped: {DROPPED_MESSAGES.total()}, queued: {QUEUED_BYTES.total()} bytes, "
+                f"generator p99: {generator_p99 * 1000:.3f} ms")
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serve the metrics in the Prometheus text format on http://host:port/metrics in a daemon thread
+    :param port: TCP port of the endpoint
+    :param host: interface of the endpoint, only local by default
+    :return: the running ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,229 @@
+import array
+import logging
+import logging.handlers
+import mmap
+import queue
+import struct
+import threading
+import time
+
+# File layout:
+#   header:  MAGIC, version (uint32)
+#   records: timestamp (float64, seconds since the epoch), connection id (uint32), direction (uint8),
+#            length (uint32), packet
+MAGIC = b"MQTTPLOG"
+VERSION = 1
+_HEADER = struct.Struct(f">{len(MAGIC)}sI")
+_RECORD = struct.Struct(">dIBI")
+
+RECEIVED = 0
+SENT = 1
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+_PUBLISH_PACKET_TYPE = 3
+
+_open_captures = {}
+_open_captures_lock = threading.Lock()
+
+
+class PacketLogHandler(logging.handlers.RotatingFileHandler):
+    """
+    Writes the packets of @PacketLog records into a binary file that is rotated after 'max_bytes' bytes
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count)
+
+    def _open(self):
+        file = open(self.baseFilename, "ab")
+        if file.tell() == 0:
+            file.write(_HEADER.pack(MAGIC, VERSION))
+            file.flush()
+        return file
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        position = self.stream.tell()
+        return 0 < self.maxBytes < position + _RECORD.size + len(record.packet) and position > _HEADER.size
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            self.stream.write(_RECORD.pack(record.created, record.connection_id, record.direction,
+                                           len(record.packet)))
+            self.stream.write(record.packet)
+        except Exception:
+            self.handleError(record)
+
+
+class _PacketLogListener(logging.handlers.QueueListener):
+    """
+    Flushes the packet log whenever the queue runs empty, so the file is current while the broker is idle without
+    flushing it for every single packet under load
+    """
+
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+class PacketLog(object):
+    """
+    Optional binary log of all received and sent packets. Packets are handed to a background thread through a queue,
+    so logging a packet costs the same for any packet size and never waits for the disk.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._queue = None
+        self._listener = None
+
+    def open(self, path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        """
+        Start logging packets
+        :param path: path of the packet log, rotated files get the suffixes .1, .2, ...
+        :param max_bytes: size after which the file is rotated, 0 to never rotate
+        :param backup_count: number of rotated files that are kept
+        """
+        self.close()
+        self._queue = queue.SimpleQueue()
+        self._listener = _PacketLogListener(self._queue, PacketLogHandler(path, max_bytes, backup_count))
+        self._listener.start()
+        self.enabled = True
+
+    def log(self, direction, connection_id, packet):
+        """
+        :param direction: RECEIVED or SENT
+        :param connection_id: ID of the client connection
+        :param packet: the packet (bytes-like), it must not be modified afterwards
+        """
+        record = logging.LogRecord("mqtt.packets", logging.INFO, "", 0, "", None, None)
+        record.created = time.time()
+        record.connection_id = connection_id
+        record.direction = direction
+        record.packet = packet
+        self._queue.put_nowait(record)
+
+    def close(self):
+        """
+        Write the queued packets and close the file
+        """
+        self.enabled = False
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+
+def read_packet_log(path):
+    """
+    Read the records of a packet log file
+    :param path: path of the file
+    :return: Generator - (timestamp, connection id, direction, packet) tuples
+    """
+    with open(path, "rb") as file:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"'{path}' is not a packet log.")
+        while True:
+            record_header = file.read(_RECORD.size)
+            if len(record_header) < _RECORD.size:
+                return
+            timestamp, connection_id, direction, length = _RECORD.unpack(record_header)
+            packet = file.read(length)
+            if len(packet) < length:
+                return
+            yield timestamp, connection_id, direction, packet
+
+
+class Capture(object):
+    """
+    Read-only, memory-mapped view of the sent PUBLISH frames in a packet log, e.g. recorded with --capture.
+    Opening scans the record headers once and keeps the offsets and timestamps of the frames in compact arrays,
+    frames are returned as memoryview slices of the mapping without copying them.
+    """
+
+    def __init__(self, path, connection_id=None):
+        """
+        :param path: path of the packet log
+        :param connection_id: only use the frames sent to this connection, None for all connections
+        """
+        self.path = path
+        self.connection_id = connection_id
+        self._offsets = array.array('Q')
+        self._lengths = array.array('I')
+        self._timestamps = array.array('d')
+        with open(path, "rb") as file:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != MAGIC:
+                raise ValueError(f"'{path}' is not a packet log.")
+            if _HEADER.unpack(header)[1] != VERSION:
+                raise ValueError(f"Packet log version {_HEADER.unpack(header)[1]} of '{path}' is not supported.")
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._scan()
+
+    def _scan(self):
+        unpack_from = _RECORD.unpack_from
+        data = self._mmap
+        size = len(data)
+        position = _HEADER.size
+        while position + _RECORD.size <= size:
+            timestamp, connection_id, direction, length = unpack_from(data, position)
+            start = position + _RECORD.size
+            position = start + length
+            if position > size:
+                # The last record of a log that is still written or was cut off
+                break
+            if direction != SENT or length == 0 or data[start] >> 4 != _PUBLISH_PACKET_TYPE:
+                continue
+            if self.connection_id is not None and connection_id != self.connection_id:
+                continue
+            self._offsets.append(start)
+            self._lengths.append(length)
+            self._timestamps.append(timestamp)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def frame(self, index):
+        """
+        :param index: index of the frame
+        :return: the PUBLISH frame as memoryview on the mapped file
+        """
+        start = self._offsets[index]
+        return self._view[start:start + self._lengths[index]]
+
+    def timestamp(self, index):
+        """
+        :param index: index of the frame
+        :return: time.time() timestamp at which the frame was sent
+        """
+        return self._timestamps[index]
+
+
+def open_capture(path, connection_id=None):
+    """
+    Returns the @Capture of a path. The file is only mapped and scanned once per process.
+    :param path: path of the packet log
+    :param connection_id: only use the frames sent to this connection, None for all connections
+    :return: @Capture
+    """
+    with _open_captures_lock:
+        capture = _open_captures.get((path, connection_id))
+        if capture is None:
+            capture = Capture(path, connection_id)
+            _open_captures[(path, connection_id)] = capture
+        return capture
+
+
+PACKET_LOG = PacketLog()
+# Sent frames only, not rotated, see --capture
+CAPTURE = PacketLog()
@@ -0,0 +1,34 @@
+from util.metrics import CONNECTIONS, PUBLISHED_BYTES, PUBLISHED_MESSAGES
+
+# Order of the counters in snapshots and in the shared memory of the broker workers
+STAT_FIELDS = ('connections', 'messages', 'bytes')
+
+
+class BrokerStats(object):
+    """
+    Process-wide totals of the accepted connections and the auto published messages, read from the metrics registry
+    (see util/metrics.py)
+    """
+
+    @staticmethod
+    def record_connection():
+        CONNECTIONS.labels().inc()
+
+    @staticmethod
+    def snapshot():
+        """
+        :return: the current counters in the order of STAT_FIELDS
+        """
+        return CONNECTIONS.total(), PUBLISHED_MESSAGES.total(), PUBLISHED_BYTES.total()
+
+
+STATS = BrokerStats()
+
+
+def format_stats(values):
+    """
+    Format counters in the order of STAT_FIELDS as a single log line
+    :param values: the counter values
+    :return: printable string
+    """
+    return ", ".join(f"{field}: {value}" for field, value in zip(STAT_FIELDS, values))
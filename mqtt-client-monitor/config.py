@@ -23,8 +23,10 @@ class Config:
 
     # Command to instantiate the test system. This can be an arbitrary complex shell command.
     # STDOUT and STDERR buffers are monitored for output.
-    TEST_COMMAND: str = f"../fuzzing-target/cmake-build-debug/" \
-                        f"fuzzing-target -a {LOCAL_ADDRESS} -p {LOCAL_PORT} -t {TOPIC} -q 0"
+    # {address}, {port} and {topic} are replaced with the broker address the test system connects to.
+    TEST_COMMAND_TEMPLATE: str = "../fuzzing-target/cmake-build-debug/" \
+                                 "fuzzing-target -a {address} -p {port} -t {topic} -q 0"
+    TEST_COMMAND: str = TEST_COMMAND_TEMPLATE.format(address=LOCAL_ADDRESS, port=LOCAL_PORT, topic=TOPIC)
 
     # Monitoring conditions
     #############################################
@@ -32,12 +34,20 @@ class Config:
     # The time in seconds that the monitor waits for new data on STDOUT/STDERR buffers before closing.
     MONITOR_BUFFER_READ_TIMEOUT_SECS: int = 5
 
-    # Matches the following regex pattern on the output STDOUT/STDERR buffers.
-    REGEX_BUFFER_FILTER_PATTERN: str = "uid"
+    # Matches the following regex patterns on the output STDOUT/STDERR buffers.
+    # The patterns are searched in the raw bytes of the output, a match reports the pattern and its offset.
+    REGEX_BUFFER_FILTER_PATTERNS: list[str] = ["uid"]
+
+    # Matches that are split across two reads of a buffer are only found if they are at most this long.
+    REGEX_MAX_MATCH_BYTES: int = 4096
 
     # Exit on REGEX match
     EXIT_ON_FIRST_REGEX_MATCH: bool = True
 
+    # The number of bytes at the end of the STDOUT/STDERR buffers that are kept in memory and logged after the run.
+    # The full output is written to stdout.log and stderr.log in the logs directory.
+    OUTPUT_TAIL_BYTES: int = 64 * 1024
+
     # Add matching buffer output to log output only if it matches the pattern
     ONLY_LOG_ON_REGEX_MATCH: bool = False
 
@@ -45,12 +55,60 @@ class Config:
     # Archives all logs in a new directory only if the code is returned.
     RETURN_CODES_VALUE_FILTER: list[int] = []
 
-    # The time in seconds that the monitor waits for new TCP data from the system under test before closing.
+    # The time in seconds that the monitor waits for new TCP data from the system under test before closing the connection.
     # (-1 = no limit)
     MAX_LOCAL_TCP_TIMEOUT_SECS = -1
 
-    # The time in seconds that the monitor waits for new TCP data from the broker before closing.
+    # The time in seconds that the monitor waits for new TCP data from the broker before closing the connection.
     # (-1 = no limit)
     MAX_REMOTE_TCP_TIMEOUT_SECS = 50
 
     AUTO_RESTART = False
+
+    # Brokers started by the monitor (minimize.py, fleet mode)
+    #############################################
+
+    # Command that starts an auto-mqtt-broker, the generated config is passed with '-c'.
+    BROKER_COMMAND: str = "python ../auto-mqtt-broker/broker.py"
+
+    # The time in seconds that a broker gets to start before the test system is started.
+    BROKER_STARTUP_SECS: float = 1
+
+    # Persistent mode (monitor.py --persistent)
+    #############################################
+
+    # The system under test is kept running across test cases. It is only restarted when it exits, matches a regex
+    # pattern or writes no output within MONITOR_BUFFER_READ_TIMEOUT_SECS (hang).
+    # The number of lifetimes of the system under test after which the monitor stops (0 = no limit).
+    PERSISTENT_MAX_LIFETIMES: int = 100
+
+    # The time in seconds after which the monitor stops, also during a lifetime (-1 = no limit).
+    PERSISTENT_DURATION_SECS: float = -1
+
+    # Control channel of the broker (broker.py --control-port), which reports the test cases of every lifetime.
+    # (None = the broker has no control channel)
+    BROKER_CONTROL_ADDRESS: str = "localhost"
+    BROKER_CONTROL_PORT: int | None = None
+
+    # Crash input minimization (minimize.py)
+    #############################################
+
+    # Broker port of the first parallel trial, further trials use the following ports.
+    MINIMIZER_BASE_PORT: int = 18830
+
+    # Number of trials that run in parallel, each with its own broker and test system instance.
+    MINIMIZER_JOBS: int = 4
+
+    # Interval of the replayed messages and the replay speed of the REPLAY message generator
+    # (0 = use the interval, 1 = original pacing of the capture).
+    MINIMIZER_PUBLISH_INTERVAL_SECS: float = 0.01
+    MINIMIZER_REPLAY_SPEED: float = 0
+
+    # Fleet mode (monitor.py --fleet N --campaign PATH)
+    #############################################
+
+    # Proxy port of the first fleet instance, instance i uses FLEET_BASE_PROXY_PORT + i.
+    FLEET_BASE_PROXY_PORT: int = 9080
+
+    # Broker port of the first fleet instance, instance i uses FLEET_BASE_BROKER_PORT + i.
+    FLEET_BASE_BROKER_PORT: int = 19830
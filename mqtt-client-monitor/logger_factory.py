@@ -28,6 +28,15 @@ fh.setLevel(Config.FILE_LOG_LEVEL)
 fh.setFormatter(formatter)
 
 
+def set_log_file(path: str):
+    """
+    Writes the archived log output of this process into another file, e.g. for an instance of the fleet mode
+    """
+    old_stream = fh.setStream(open(path, "a"))
+    if old_stream is not None:
+        old_stream.close()
+
+
 def construct_logger(name: str):
 
     logger = logging.getLogger(f"{name}")
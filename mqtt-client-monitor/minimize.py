@@ -0,0 +1,42 @@
+import argparse
+
+import logger_factory
+from config import Config
+from monitor.capture import read_capture, write_capture
+from monitor.minimizer import Minimizer
+
+logger = logger_factory.construct_logger("monitor")
+
+
+def main():
+    parser = argparse.ArgumentParser("minimize.py", description="Shrinks the PUBLISH messages of a broker capture "
+                                                                "that make the test system fail")
+    parser.add_argument("capture", metavar="CAPTURE",
+                        help="capture or packet log of the auto-mqtt-broker (--capture / --packet-log)")
+    parser.add_argument("-o", "--output", dest="output", metavar="PATH", default="minimized.capture",
+                        help="path of the minimized capture, which can be replayed with the REPLAY generator")
+    parser.add_argument("-c", "--connection", dest="connection", metavar="ID", type=int, default=None,
+                        help="only use the messages that were sent to this connection")
+    parser.add_argument("-j", "--jobs", dest="jobs", metavar="N", type=int, default=Config.MINIMIZER_JOBS,
+                        help="number of parallel trials")
+    args = parser.parse_args()
+
+    records = [record for record in read_capture(args.capture)
+               if record.is_sent_publish and (args.connection is None or record.connection_id == args.connection)]
+    if not records:
+        logger.error(f"No sent PUBLISH messages found in '{args.capture}'.")
+        return
+
+    minimizer = Minimizer(args.jobs)
+    minimized = minimizer.minimize(records)
+    if minimized is None:
+        return
+
+    write_capture(args.output, minimized)
+    logger.info(f"Minimized {len(records)} messages ({sum(len(record.packet) for record in records)} bytes) to "
+                f"{len(minimized)} messages ({sum(len(record.packet) for record in minimized)} bytes) in "
+                f"{minimizer.trials} trials: '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
+import argparse
+import json
 import shutil
 import threading
+import time
+from dataclasses import asdict
 from datetime import datetime
 
 import logger_factory
 from config import Config
-from monitor.process_monitor import ProcessMonitor
+from monitor.broker_control import BrokerControl
+from monitor.fleet import FLEET_LOGS_DIR, log_campaign_summary, read_campaign, run_fleet
+from monitor.process_monitor import PersistentProcessMonitor, ProcessMonitor
 from monitor.process_monitor import ProcessResult
 from monitor.tcp_proxy import TcpProxy
 
@@ -15,28 +21,97 @@ def _log_final_output(result):
     if not result:
         return
 
-    logger.info(f"STDOUT: {result.stdout}")
-    logger.info(f"STDERR: {result.stderr}")
+    for name, output in (("STDOUT", result.stdout), ("STDERR", result.stderr)):
+        if output.is_truncated:
+            logger.info(f"{name} ({len(output)} bytes, full output in {output.spill_path}): ...{output}")
+        else:
+            logger.info(f"{name}: {output}")
     logger.info(f"RETURN: {result.return_code}")
     logger.info(result.buffer_handler_result)
 
-    if (result.return_code in Config.RETURN_CODES_VALUE_FILTER) \
-            or result.buffer_handler_exit:
-        now = datetime.now()
-        timestamp = now.strftime("%Y-%m-%dT%H:%M:%S")
-        try:
-            shutil.move(f"{Config.BASE_LOGS_DIR}/latest", f"{Config.BASE_LOGS_DIR}/{timestamp}")
-        except:
-            pass
+    if result.is_failure:
+        _archive_logs()
 
 
-def main():
+def _archive_logs():
+    now = datetime.now()
+    timestamp = now.strftime("%Y-%m-%dT%H:%M:%S")
+    try:
+        shutil.move(f"{Config.BASE_LOGS_DIR}/latest", f"{Config.BASE_LOGS_DIR}/{timestamp}")
+    except:
+        pass
+
+
+def run_campaign(campaign_path, instances):
+    tasks = read_campaign(campaign_path)
+    logger.info(f"Starting campaign '{campaign_path}' with {len(tasks)} tasks on {instances} instances")
+    start = time.monotonic()
+    results = run_fleet(tasks, instances)
+    log_campaign_summary(results, time.monotonic() - start)
+
+    with open(f"{FLEET_LOGS_DIR}/campaign.json", "w") as summary_file:
+        json.dump([asdict(result) for result in results], summary_file, indent=2)
+
+    if any(result.is_failure for result in results):
+        _archive_logs()
+
+
+def _start_proxy():
     logger.info(f"Starting proxy: {Config.LOCAL_ADDRESS}:{Config.LOCAL_PORT} -> {Config.TARGET_ADDRESS}:{Config.TARGET_PORT}")
-    threading.Thread(target=TcpProxy, args=(Config.LOCAL_ADDRESS, Config.LOCAL_PORT, Config.TARGET_ADDRESS, Config.TARGET_PORT),
-                     daemon=True).start()
+    proxy = TcpProxy(Config.LOCAL_ADDRESS, Config.LOCAL_PORT, Config.TARGET_ADDRESS, Config.TARGET_PORT, autostart=False)
+    threading.Thread(target=proxy.start, daemon=True).start()
+
+
+def run_persistent():
+    _start_proxy()
+    control = BrokerControl(Config.BROKER_CONTROL_ADDRESS, Config.BROKER_CONTROL_PORT) \
+        if Config.BROKER_CONTROL_PORT is not None else None
+    start = time.monotonic()
+    results = PersistentProcessMonitor(Config.TEST_COMMAND, logger_factory.LATEST_LOGS_DIR, control).run()
+    duration_secs = time.monotonic() - start
+
+    failures = [result for result in results if result.is_failure]
+    test_cases = sum(result.test_cases["test_cases"] for result in results if result.test_cases)
+    logger.info(f"Finished monitoring: {len(results)} lifetimes in {duration_secs:.1f} s, {len(failures)} failures" +
+                (f", {test_cases} test cases ({test_cases / max(duration_secs, 1e-9):.1f}/s)" if control else ""))
+    for result in failures:
+        logger.info(f"  Lifetime {result.lifetime} ({result.end_reason}): RETURN: {result.return_code} "
+                    f"{result.buffer_handler_result}" +
+                    (f", test cases: {result.test_cases['connections']}" if result.test_cases else ""))
+
+    with open(f"{logger_factory.LATEST_LOGS_DIR}/lifetimes.json", "w") as summary_file:
+        json.dump([asdict(result) for result in results], summary_file, indent=2)
+
+    if failures:
+        _archive_logs()
+
+
+def main():
+    parser = argparse.ArgumentParser("monitor.py", description="Monitors the system under test")
+    parser.add_argument("-f", "--fleet", dest="fleet", metavar="N", type=int, default=None,
+                        help="run the tasks of a campaign on N monitored instances of the system under test in "
+                             "parallel, each with its own broker and TCP proxy")
+    parser.add_argument("-c", "--campaign", dest="campaign", metavar="PATH", default=None,
+                        help="campaign of the fleet mode: a broker config whose [LISTENER] sections are the tasks")
+    parser.add_argument("-p", "--persistent", dest="persistent", action="store_true",
+                        help="keep the system under test running across test cases and only restart it when it "
+                             "crashes or hangs")
+    args = parser.parse_args()
+    if args.fleet is not None:
+        if args.fleet < 1:
+            parser.error("the fleet mode requires at least one instance")
+        if args.campaign is None:
+            parser.error("the fleet mode requires a --campaign")
+        run_campaign(args.campaign, args.fleet)
+        return
+    if args.persistent:
+        run_persistent()
+        return
+
+    _start_proxy()
 
     # Run the subprocess which should be monitored
-    monitor = ProcessMonitor(Config.TEST_COMMAND)
+    monitor = ProcessMonitor(Config.TEST_COMMAND, logger_factory.LATEST_LOGS_DIR)
     result: ProcessResult = monitor.run_to_completion()
     logger.info("Finished monitoring")
 
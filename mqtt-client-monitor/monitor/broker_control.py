@@ -0,0 +1,50 @@
+import json
+import socket
+from typing import Optional
+
+import logger_factory
+
+LOGGER = logger_factory.get_logger("monitor")
+
+# Time in seconds to wait for a reply of the broker
+CONTROL_TIMEOUT_SECS = 5
+
+
+class BrokerControl:
+    """
+    Client of the control channel of an auto-mqtt-broker that runs with '--control-port'. The broker records the
+    auto published messages (test cases) and reports the test cases of a lifetime of the system under test when the
+    monitor ends it. Every command is a JSON line, the broker replies with a JSON line.
+    """
+
+    def __init__(self, address: str, port: int):
+        self._address = address
+        self._port = port
+
+    def end_lifetime(self, lifetime: int, reason: str) -> Optional[dict]:
+        """
+        :return: the test cases that the broker sent since the end of the previous lifetime, None if the broker
+        cannot be reached
+        """
+        return self._send({"command": "end_lifetime", "lifetime": lifetime, "reason": reason})
+
+    def status(self) -> Optional[dict]:
+        """
+        :return: the test cases of the current lifetime
+        """
+        return self._send({"command": "status"})
+
+    def _send(self, command: dict) -> Optional[dict]:
+        try:
+            with socket.create_connection((self._address, self._port), timeout=CONTROL_TIMEOUT_SECS) as control_socket:
+                control_socket.sendall(json.dumps(command).encode("utf-8") + b"\n")
+                with control_socket.makefile("rb") as reply_file:
+                    reply = json.loads(reply_file.readline())
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f"Control channel of the broker at {self._address}:{self._port} failed: {e}")
+            return None
+
+        if "error" in reply:
+            LOGGER.warning(f"Broker rejected the command {command['command']}: {reply['error']}")
+            return None
+        return reply
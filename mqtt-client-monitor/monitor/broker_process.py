@@ -0,0 +1,46 @@
+import os
+import shlex
+import subprocess
+import time
+
+from config import Config
+
+# Address of the brokers started by the monitor, which run on the same host
+BROKER_ADDRESS = "127.0.0.1"
+# Time in seconds to wait for a broker to stop before it is killed
+BROKER_STOP_TIMEOUT_SECS = 5
+
+
+class BrokerProcess:
+    """
+    Runs an auto-mqtt-broker (Config.BROKER_COMMAND) with a single listener, e.g. for a minimizer trial or a fleet
+    instance. The config file and the output of the broker are written into 'work_dir'.
+    """
+
+    def __init__(self, listener_settings: str, port: int, work_dir: str, name: str = "broker"):
+        """
+        :param listener_settings: settings of the [LISTENER] section of the broker config, without the PORT
+        """
+        self.port = port
+        config_path = os.path.join(work_dir, f"{name}.config")
+        with open(config_path, "w") as config_file:
+            config_file.write(f"[LISTENER]\nPORT {port}\n{listener_settings}")
+
+        with open(os.path.join(work_dir, f"{name}.log"), "wb") as broker_log:
+            self._process = subprocess.Popen(shlex.split(Config.BROKER_COMMAND) + ["-c", config_path],
+                                             stdout=broker_log, stderr=subprocess.STDOUT)
+        time.sleep(Config.BROKER_STARTUP_SECS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def stop(self):
+        self._process.terminate()
+        try:
+            self._process.wait(BROKER_STOP_TIMEOUT_SECS)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
@@ -0,0 +1,62 @@
+import struct
+from dataclasses import dataclass
+
+# Packet log / capture format of the auto-mqtt-broker (see auto-mqtt-broker/util/packet_log.py):
+#   header:  MAGIC, version (uint32)
+#   records: timestamp (float64), connection id (uint32), direction (uint8), length (uint32), packet
+MAGIC = b"MQTTPLOG"
+VERSION = 1
+_HEADER = struct.Struct(f">{len(MAGIC)}sI")
+_RECORD = struct.Struct(">dIBI")
+
+RECEIVED = 0
+SENT = 1
+
+PUBLISH_PACKET_TYPE = 3
+
+
+@dataclass
+class CaptureRecord:
+    timestamp: float
+    connection_id: int
+    direction: int
+    packet: bytes
+
+    @property
+    def is_sent_publish(self) -> bool:
+        return self.direction == SENT and len(self.packet) > 0 and self.packet[0] >> 4 == PUBLISH_PACKET_TYPE
+
+
+def read_capture(path: str) -> list[CaptureRecord]:
+    """
+    Reads all complete records of a capture or packet log of the broker
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if len(data) < _HEADER.size or _HEADER.unpack_from(data)[0] != MAGIC:
+        raise ValueError(f"'{path}' is not a capture file.")
+    if _HEADER.unpack_from(data)[1] != VERSION:
+        raise ValueError(f"Capture version {_HEADER.unpack_from(data)[1]} of '{path}' is not supported.")
+
+    records = []
+    position = _HEADER.size
+    while position + _RECORD.size <= len(data):
+        timestamp, connection_id, direction, length = _RECORD.unpack_from(data, position)
+        start = position + _RECORD.size
+        position = start + length
+        if position > len(data):
+            break
+        records.append(CaptureRecord(timestamp, connection_id, direction, data[start:position]))
+    return records
+
+
+def write_capture(path: str, records: list[CaptureRecord]):
+    """
+    Writes records in the capture format, which the REPLAY message generator of the broker streams back
+    """
+    with open(path, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, VERSION))
+        for record in records:
+            file.write(_RECORD.pack(record.timestamp, record.connection_id, record.direction, len(record.packet)))
+            file.write(record.packet)
@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import logger_factory
+from config import Config
+from monitor.broker_process import BROKER_ADDRESS, BrokerProcess
+from monitor.process_monitor import ProcessMonitor
+from monitor.tcp_proxy import TcpProxy
+
+LOGGER = logger_factory.get_logger("monitor")
+
+FLEET_LOGS_DIR = f"{logger_factory.LATEST_LOGS_DIR}/fleet"
+LISTENER_IDENTIFIER = "[LISTENER]"
+
+# Queue of the free slots of the fleet, a slot determines the ports of the instance that runs a task
+_slots: Optional[multiprocessing.Queue] = None
+
+
+@dataclass
+class FleetTask:
+    index: int
+    name: str
+    # Settings of the [LISTENER] section of the broker config, without the PORT
+    listener_settings: str
+
+
+@dataclass
+class FleetResult:
+    index: int
+    name: str
+    slot: int
+    return_code: Optional[int]
+    buffer_handler_result: Optional[str]
+    is_failure: bool
+    duration_secs: float
+    log_dir: str
+
+
+def read_campaign(path: str) -> list[FleetTask]:
+    """
+    Reads the generator configurations of a campaign. A campaign file has the format of the broker config, every
+    [LISTENER] section is a task that runs against its own broker. The PORT of the sections is replaced by the port of
+    the fleet instance that runs the task.
+    """
+    with open(path) as campaign_file:
+        sections = campaign_file.read().split(LISTENER_IDENTIFIER)[1:]
+
+    tasks = []
+    for index, section in enumerate(sections):
+        settings = [line.strip() for line in section.splitlines()
+                    if line.strip() and not line.strip().startswith("#") and line.split()[0] != "PORT"]
+        generator_types = [line.split()[1] for line in settings
+                           if line.split()[0] == "MESSAGE_GENERATOR_TYPE" and len(line.split()) > 1]
+        name = re.sub(r"[^\w.-]", "_", generator_types[0] if generator_types else "task")
+        tasks.append(FleetTask(index, name, "".join(f"{line}\n" for line in settings)))
+    return tasks
+
+
+def _init_worker(slots):
+    global _slots
+    _slots = slots
+
+
+def run_task(task: FleetTask) -> FleetResult:
+    """
+    Runs a task on the fleet instance of this worker process: a broker with the generator configuration of the task,
+    a TCP proxy to it and the monitored system under test, which connects to the proxy
+    """
+    # The slot is returned after every task, so a worker that the pool respawns finds a free slot as well
+    slot = _slots.get()
+    try:
+        return _run_task_on_slot(task, slot)
+    finally:
+        _slots.put(slot)
+
+
+def _run_task_on_slot(task: FleetTask, slot: int) -> FleetResult:
+    log_dir = os.path.join(FLEET_LOGS_DIR, f"{task.index:04d}-{task.name}")
+    os.makedirs(log_dir, exist_ok=True)
+    logger_factory.set_log_file(f"{log_dir}/monitor.log")
+
+    broker_port = Config.FLEET_BASE_BROKER_PORT + slot
+    proxy_port = Config.FLEET_BASE_PROXY_PORT + slot
+    start = time.monotonic()
+    LOGGER.info(f"Instance {slot}: starting task {task.index} ({task.name})")
+    with BrokerProcess(task.listener_settings, broker_port, log_dir):
+        # The proxy listens before the system under test is started
+        proxy = TcpProxy(Config.LOCAL_ADDRESS, proxy_port, BROKER_ADDRESS, broker_port, autostart=False)
+        threading.Thread(target=proxy.start, daemon=True).start()
+        command = Config.TEST_COMMAND_TEMPLATE.format(address=Config.LOCAL_ADDRESS, port=proxy_port,
+                                                      topic=Config.TOPIC)
+        result = ProcessMonitor(command, log_dir).run_to_completion()
+        proxy.close()
+
+    return FleetResult(task.index, task.name, slot, result.return_code, result.buffer_handler_result,
+                       result.is_failure, time.monotonic() - start, log_dir)
+
+
+def run_fleet(tasks: list[FleetTask], instances: int) -> list[FleetResult]:
+    """
+    Runs the tasks on 'instances' monitored systems under test in parallel. Every instance is a worker process that
+    takes the next task from the shared queue of the pool as soon as its last task is finished.
+    """
+    context = multiprocessing.get_context("fork")
+    slots = context.Queue()
+    for slot in range(instances):
+        slots.put(slot)
+
+    results = []
+    with context.Pool(instances, initializer=_init_worker, initargs=(slots,)) as pool:
+        for result in pool.imap_unordered(run_task, tasks):
+            results.append(result)
+            LOGGER.info(f"Finished task {result.index} ({result.name}) on instance {result.slot} in "
+                        f"{result.duration_secs:.1f} s: {'FAILURE' if result.is_failure else 'ok'} "
+                        f"[{len(results)}/{len(tasks)}]")
+    return sorted(results, key=lambda result: result.index)
+
+
+def log_campaign_summary(results: list[FleetResult], duration_secs: float):
+    failures = [result for result in results if result.is_failure]
+    LOGGER.info(f"Campaign finished: {len(results)} tasks in {duration_secs:.1f} s, {len(failures)} failures")
+    for result in results:
+        LOGGER.info(f"  {result.index:4d} {result.name:24s} {'FAILURE' if result.is_failure else 'ok':7s} "
+                    f"RETURN: {result.return_code} {result.buffer_handler_result} ({result.log_dir})")
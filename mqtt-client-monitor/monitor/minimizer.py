@@ -0,0 +1,199 @@
+import os
+import queue
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Sequence
+
+import logger_factory
+from config import Config
+from monitor.broker_process import BROKER_ADDRESS, BrokerProcess
+from monitor.capture import CaptureRecord, write_capture
+from monitor.process_monitor import ProcessMonitor
+
+LOGGER = logger_factory.get_logger("monitor")
+
+
+class PublishFrame:
+    """
+    Splits a PUBLISH frame into its headers and payload, so that the payload can be reduced.
+    The remaining length is only re-encoded if it matched the original frame, malformed lengths are kept.
+    """
+
+    def __init__(self, frame: bytes):
+        self.frame = frame
+        self.payload_start = None
+        self._remaining_length_matches = False
+
+        remaining_length, position = _decode_variable_byte_integer(frame, 1)
+        if position is None or position + 2 > len(frame):
+            return
+        qos = (frame[0] >> 1) & 0x03
+        topic_length = int.from_bytes(frame[position:position + 2], "big")
+        properties_start = position + 2 + topic_length + (2 if qos > 0 else 0)
+        properties_length, payload_start = _decode_variable_byte_integer(frame, properties_start)
+        if payload_start is None or payload_start + properties_length > len(frame):
+            return
+        self.payload_start = payload_start + properties_length
+        self._variable_header_start = position
+        self._remaining_length_matches = remaining_length == len(frame) - position
+
+    @property
+    def payload(self) -> bytes:
+        return self.frame[self.payload_start:] if self.payload_start is not None else b""
+
+    def with_payload(self, payload: bytes) -> bytes:
+        if self.payload_start is None:
+            return self.frame
+        if not self._remaining_length_matches:
+            return self.frame[:self.payload_start] + payload
+        variable_header = self.frame[self._variable_header_start:self.payload_start]
+        return bytes(self.frame[:1]) + _encode_variable_byte_integer(len(variable_header) + len(payload)) + \
+            variable_header + payload
+
+
+def _decode_variable_byte_integer(data: bytes, position: int) -> tuple[int, Optional[int]]:
+    value = 0
+    for shift in range(0, 28, 7):
+        if position >= len(data):
+            return value, None
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+    return value, None
+
+
+def _encode_variable_byte_integer(value: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = value % 128
+        value //= 128
+        encoded.append(byte | 0x80 if value > 0 else byte)
+        if value == 0:
+            return bytes(encoded)
+
+
+class TrialRunner:
+    """
+    Runs the test system against a broker that replays candidate PUBLISH frames and reports whether it still fails.
+    Every parallel trial uses its own broker port: MINIMIZER_BASE_PORT, MINIMIZER_BASE_PORT + 1, ...
+    """
+
+    def __init__(self, jobs: int, work_dir: str):
+        self._work_dir = work_dir
+        self._ports = queue.Queue()
+        for index in range(jobs):
+            self._ports.put(Config.MINIMIZER_BASE_PORT + index)
+        self.trials = 0
+
+    def run(self, records: Sequence[CaptureRecord]) -> bool:
+        port = self._ports.get()
+        try:
+            self.trials += 1
+            return self._run_on_port(records, port)
+        finally:
+            self._ports.put(port)
+
+    def _run_on_port(self, records: Sequence[CaptureRecord], port: int) -> bool:
+        capture_path = os.path.join(self._work_dir, f"trial-{port}.capture")
+        write_capture(capture_path, list(records))
+        listener_settings = (f"AUTO_PUBLISH true\n"
+                             f"AUTO_PUBLISH_INTERVAL {Config.MINIMIZER_PUBLISH_INTERVAL_SECS}\n"
+                             f"MESSAGE_GENERATOR_TYPE REPLAY\n"
+                             f"MESSAGE_GENERATOR_CAPTURE_FILE {os.path.abspath(capture_path)}\n"
+                             f"MESSAGE_GENERATOR_REPLAY_SPEED {Config.MINIMIZER_REPLAY_SPEED}\n")
+
+        with BrokerProcess(listener_settings, port, self._work_dir, f"broker-{port}"):
+            command = Config.TEST_COMMAND_TEMPLATE.format(address=BROKER_ADDRESS, port=port, topic=Config.TOPIC)
+            return ProcessMonitor(command).run_to_completion().is_failure
+
+
+def ddmin(items: list, test: Callable[[list], bool], jobs: int = 1) -> list:
+    """
+    Delta debugging (Zeller, Hildebrandt): reduces 'items' to a 1-minimal list for which 'test' still fails.
+    The subsets and complements of a round are tested in parallel batches of 'jobs' candidates, the first failing
+    candidate in the order of the sequential algorithm is taken, so the result does not depend on 'jobs'.
+    """
+    results = {}
+
+    def fails(candidate):
+        key = tuple(candidate)
+        if key not in results:
+            results[key] = test(candidate)
+        return results[key]
+
+    granularity = 2
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while len(items) >= 2:
+            chunk_size = len(items) / granularity
+            chunks = [items[round(index * chunk_size):round((index + 1) * chunk_size)]
+                      for index in range(granularity)]
+            candidates = [(chunk, 2) for chunk in chunks]
+            if granularity > 2:
+                candidates += [(items[:round(index * chunk_size)] + items[round((index + 1) * chunk_size):],
+                                max(granularity - 1, 2)) for index in range(granularity)]
+
+            reduced = None
+            for start in range(0, len(candidates), jobs):
+                batch = candidates[start:start + jobs]
+                outcomes = list(executor.map(lambda candidate: fails(candidate[0]), batch))
+                if any(outcomes):
+                    reduced = batch[outcomes.index(True)]
+                    break
+
+            if reduced is not None:
+                items, granularity = reduced
+                LOGGER.info(f"Reduced to {len(items)} items")
+            elif granularity >= len(items):
+                break
+            else:
+                granularity = min(len(items), granularity * 2)
+    return items
+
+
+class Minimizer:
+    """
+    Shrinks the sent PUBLISH frames of a capture that make the test system fail: first the set of messages, then
+    the payload bytes of every remaining message.
+    """
+
+    def __init__(self, jobs: int = Config.MINIMIZER_JOBS):
+        self._jobs = jobs
+        self._work_dir = tempfile.mkdtemp(prefix="minimizer-", dir=logger_factory.LATEST_LOGS_DIR)
+        self._runner = TrialRunner(jobs, self._work_dir)
+
+    @property
+    def trials(self) -> int:
+        return self._runner.trials
+
+    def minimize(self, records: list[CaptureRecord]) -> Optional[list[CaptureRecord]]:
+        """
+        :return: the minimized records or None if the original records do not make the test system fail
+        """
+        LOGGER.info(f"Verifying that the {len(records)} captured messages make the test system fail...")
+        if not self._runner.run(records):
+            LOGGER.error("The test system does not fail with the captured messages.")
+            return None
+
+        LOGGER.info("Minimizing messages...")
+        indices = ddmin(list(range(len(records))), lambda candidate: self._runner.run([records[i] for i in candidate]),
+                        self._jobs)
+        records = [records[index] for index in indices]
+
+        for position, record in enumerate(records):
+            frame = PublishFrame(record.packet)
+            payload = frame.payload
+            if len(payload) < 2:
+                continue
+            LOGGER.info(f"Minimizing the {len(payload)} payload bytes of message {position + 1}/{len(records)}...")
+
+            def with_payload(candidate):
+                packet = frame.with_payload(bytes(payload[index] for index in candidate))
+                return records[:position] + [CaptureRecord(record.timestamp, record.connection_id, record.direction,
+                                                           packet)] + records[position + 1:]
+
+            kept = ddmin(list(range(len(payload))), lambda candidate: self._runner.run(with_payload(candidate)),
+                         self._jobs)
+            records = with_payload(kept)
+        return records
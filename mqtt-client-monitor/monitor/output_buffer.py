@@ -0,0 +1,58 @@
+import collections
+from typing import Optional
+
+from config import Config
+
+
+class OutputBuffer:
+    """
+    Output stream of a monitored process. Only the last 'tail_bytes' are kept in memory, the full stream is written
+    to 'spill_path' as it arrives, so the memory stays bounded and every chunk is handled in constant time.
+    """
+
+    def __init__(self, tail_bytes: int = Config.OUTPUT_TAIL_BYTES, spill_path: Optional[str] = None):
+        self._tail_bytes = tail_bytes
+        self._chunks = collections.deque()
+        self._retained_bytes = 0
+        self.total_bytes = 0
+        self.spill_path = spill_path
+        self._spill_file = open(spill_path, "wb") if spill_path else None
+
+    def __del__(self):
+        self.close()
+
+    def __str__(self):
+        return self.tail.decode("utf-8", errors="replace")
+
+    def __len__(self):
+        return self.total_bytes
+
+    def append(self, data: bytes):
+        self.total_bytes += len(data)
+        if self._spill_file:
+            self._spill_file.write(data)
+            self._spill_file.flush()
+
+        self._chunks.append(data)
+        self._retained_bytes += len(data)
+        # Drop whole chunks from the front, as long as the remaining chunks still contain the tail
+        while self._chunks and self._retained_bytes - len(self._chunks[0]) >= self._tail_bytes:
+            self._retained_bytes -= len(self._chunks.popleft())
+
+    @property
+    def tail(self) -> bytes:
+        """
+        :return: the last 'tail_bytes' of the output
+        """
+        if self._tail_bytes <= 0:
+            return b""
+        return b"".join(self._chunks)[-self._tail_bytes:]
+
+    @property
+    def is_truncated(self) -> bool:
+        return self.total_bytes > self._tail_bytes
+
+    def close(self):
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
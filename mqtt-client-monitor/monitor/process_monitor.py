@@ -1,21 +1,66 @@
-import re
+import os
 import selectors
 import shlex
 import subprocess
+import time
 from abc import abstractmethod
+from dataclasses import dataclass
+from typing import Optional
 
 import logger_factory
 from config import Config
+from monitor.broker_control import BrokerControl
+from monitor.output_buffer import OutputBuffer
+from monitor.stream_matcher import StreamMatch, StreamMatcher
 
 main_logger = logger_factory.get_logger("monitor")
 
+# Maximum number of bytes that are read from a buffer at once, the capacity of a pipe on Linux
+READ_CHUNK_SIZE = 65536
+
 
 class ProcessResult:
-    stdout = ""
-    stderr = ""
+    stdout: Optional[OutputBuffer] = None
+    stderr: Optional[OutputBuffer] = None
     return_code = None
     buffer_handler_result = None
     buffer_handler_exit = False
+    reached_buffer_result_timeout = False
+    reached_deadline = False
+
+    @property
+    def is_failure(self) -> bool:
+        """
+        The run found a bug: the buffer handler reached its exit condition or the process returned a filtered code
+        """
+        return self.return_code in Config.RETURN_CODES_VALUE_FILTER or self.buffer_handler_exit
+
+    @property
+    def end_reason(self) -> str:
+        """
+        Why the monitoring ended: the buffer handler reached its exit condition ("match"), the process did not write
+        any output within the timeout ("hang"), the monitor stopped at its deadline ("deadline") or the process exited
+        ("exit")
+        """
+        if self.buffer_handler_exit:
+            return "match"
+        if self.reached_buffer_result_timeout:
+            return "hang"
+        if self.reached_deadline:
+            return "deadline"
+        return "exit"
+
+
+@dataclass
+class LifetimeResult:
+    lifetime: int
+    end_reason: str
+    return_code: Optional[int]
+    buffer_handler_result: Optional[str]
+    is_failure: bool
+    duration_secs: float
+    # Test cases that the broker sent during the lifetime, None without a control channel
+    test_cases: Optional[dict]
 
 
 class BufferHandler:
@@ -40,32 +85,44 @@ class BufferHandler:
 
 class RegexBufferHandler(BufferHandler):
     """
-    Matches the buffer data against a regex pattern from the Config and counts the amount of matches.
+    Matches the buffer data against the regex patterns from the Config and counts the amount of matches.
+    Matches that are split across two reads of a buffer are found as well, see @StreamMatcher.
     Sets the BufferHandler 'exit' flag if the Config.EXIT_ON_FIRST_REGEX_MATCH is set and a match is found.
     """
     _regex_match_count = 0
-    # Pre-compile the regex pattern for better loop performance
-    _regex_buffer_filter = re.compile(Config.REGEX_BUFFER_FILTER_PATTERN)
+    _first_match: Optional[StreamMatch] = None
+    _first_match_buffer: Optional[str] = None
+
+    def __init__(self, patterns: list[str] = Config.REGEX_BUFFER_FILTER_PATTERNS):
+        # Pre-compile the regex patterns for better loop performance, every buffer is a stream of its own
+        self._stdout_matcher = StreamMatcher(patterns)
+        self._stderr_matcher = StreamMatcher(patterns)
 
     def get_printable_result(self):
         output = f"REGEX: {self._regex_match_count} matches."
+        if self._first_match:
+            output += f" First match: '{self._first_match.pattern}' at offset {self._first_match.offset} of " \
+                      f"{self._first_match_buffer}."
         if Config.EXIT_ON_FIRST_REGEX_MATCH and self._regex_match_count > 0:
             output += " Max configured matches reached."
         return output
 
     def stdout_handler(self, data: bytes) -> bytes:
-        return self._regex_matcher_on_buffer(data)
+        return self._regex_matcher_on_buffer(data, self._stdout_matcher, "STDOUT")
 
     def stderr_handler(self, data: bytes) -> bytes:
-        return self._regex_matcher_on_buffer(data)
+        return self._regex_matcher_on_buffer(data, self._stderr_matcher, "STDERR")
 
-    def _regex_matcher_on_buffer(self, data: bytes) -> bytes:
-        if Config.REGEX_BUFFER_FILTER_PATTERN is None or Config.REGEX_BUFFER_FILTER_PATTERN == "":
+    def _regex_matcher_on_buffer(self, data: bytes, matcher: StreamMatcher, buffer_name: str) -> bytes:
+        if matcher.is_empty or self._exit:
             return data
 
-        decoded_data = data.decode("utf-8", errors='ignore')
-        if decoded_data and self._regex_buffer_filter.search(decoded_data):
+        for match in matcher.feed(data, first_only=Config.EXIT_ON_FIRST_REGEX_MATCH):
+            main_logger.debug(f"{buffer_name} matches '{match.pattern}' at offset {match.offset}: {match.data}")
             self._regex_match_count += 1
+            if self._first_match is None:
+                self._first_match = match
+                self._first_match_buffer = buffer_name
 
             if Config.EXIT_ON_FIRST_REGEX_MATCH:
                 self._exit = True
@@ -102,25 +159,56 @@ class ProcessMonitor:
     _selector = selectors.DefaultSelector()
     _process_handle: subprocess.Popen = None
 
-    def __init__(self, command):
-        main_logger.info(f"Starting subprocess: \"{command}\"")
-        self._process_handle = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    def __init__(self, command, output_dir: Optional[str] = None):
+        """
+        :param output_dir: directory to which the full output is written (stdout.log, stderr.log), only the tail of
+        the output is kept in memory
+        """
+        self._command = command
+        self._output_dir = output_dir
+        self._start_process()
+
+    def _process_output_dir(self) -> Optional[str]:
+        return self._output_dir
+
+    def _start_process(self):
+        output_dir = self._process_output_dir()
+        # Every monitor has its own result and selector, so that several processes can be monitored in parallel
+        self._result = ProcessResult()
+        self._result.stdout = OutputBuffer(spill_path=os.path.join(output_dir, "stdout.log") if output_dir else None)
+        self._result.stderr = OutputBuffer(spill_path=os.path.join(output_dir, "stderr.log") if output_dir else None)
+        self._selector = selectors.DefaultSelector()
+        main_logger.info(f"Starting subprocess: \"{self._command}\"")
+        self._process_handle = subprocess.Popen(shlex.split(self._command), stdout=subprocess.PIPE,
+                                                stderr=subprocess.PIPE)
 
         # Register IO event handler on stdout and stderr buffers
         self._selector.register(self._process_handle.stdout, selectors.EVENT_READ)
         self._selector.register(self._process_handle.stderr, selectors.EVENT_READ)
 
+    def _restart_process(self):
+        self._process_handle.kill()
+        self._process_handle.wait()
+        self._selector.close()
+        self._process_handle.stdout.close()
+        self._process_handle.stderr.close()
+        self._start_process()
+
     def __del__(self):
         if self._process_handle:
             self._process_handle.kill()
 
-    def run_to_completion(self) -> ProcessResult:
-        return self._monitor_process_output(self._process_handle, RegexBufferHandler())
+    def run_to_completion(self, deadline: Optional[float] = None) -> ProcessResult:
+        """
+        :param deadline: time.monotonic() at which the monitoring stops, even if the process is still running
+        """
+        return self._monitor_process_output(self._process_handle, RegexBufferHandler(), deadline=deadline)
 
     def _monitor_process_output(self, process_handle: subprocess.Popen,
                                 buffer_handler: BufferHandler = BufferHandler(),
                                 monitor_frequency_secs: float = 0.1,
-                                monitor_timeout_secs: float = Config.MONITOR_BUFFER_READ_TIMEOUT_SECS) -> ProcessResult:
+                                monitor_timeout_secs: float = Config.MONITOR_BUFFER_READ_TIMEOUT_SECS,
+                                deadline: Optional[float] = None) -> ProcessResult:
         main_logger.info("Monitoring STDOUT and STDERR buffers...")
 
         buffer_status = BufferStatus(monitor_timeout_secs, monitor_frequency_secs)
@@ -130,12 +218,13 @@ class ProcessMonitor:
                                                                   buffer_handler.stdout_handler)
 
             buffer_status.record(stderr_buffer, stdout_buffer)
-            self._result.stdout += str(stdout_buffer or "")
-            self._result.stderr += str(stderr_buffer or "")
 
-            # End loop if the process has stopped
-            if process_handle.poll():
+            # End loop if the process has stopped, after the output that it left in the buffers has been handled
+            if process_handle.poll() is not None:
                 main_logger.debug(f"Subprocess exited with code: {process_handle.returncode}")
+                self._drain_buffer_data(process_handle, buffer_handler, monitor_frequency_secs)
+                if buffer_handler.exit:
+                    self._result.buffer_handler_exit = True
                 break
 
             # End loop if the buffer handler exit condition is reached
@@ -150,8 +239,18 @@ class ProcessMonitor:
                 self._result.reached_buffer_result_timeout = True
                 break
 
+            # End loop if the monitor has reached its deadline
+            if deadline is not None and time.monotonic() >= deadline:
+                main_logger.debug("Process monitor reached its deadline")
+                self._result.reached_deadline = True
+                break
+
         process_handle.kill()
-        self._result.return_code = process_handle.poll()
+        # The return code is only set once the process has been reaped
+        process_handle.wait()
+        self._result.stdout.close()
+        self._result.stderr.close()
+        self._result.return_code = process_handle.returncode
         self._result.buffer_handler_result = buffer_handler.get_printable_result()
         return self._result
 
@@ -161,15 +260,90 @@ class ProcessMonitor:
 
         try:
             for key, _ in self._selector.select(timeout=monitor_frequency_secs):
-                data = key.fileobj.read1()
+                data = key.fileobj.read1(READ_CHUNK_SIZE)
                 if not data:
                     continue
 
-                # Pass data to the relevant handler and add the result to the respective buffer
                 if key.fileobj is process_handle.stdout:
-                    stdout_buffer = data if stdout_handler is None else stdout_handler(data)
+                    stdout_buffer = self._handle_buffer_data(key.fileobj, data, stderr_handler, stdout_handler)
                 else:
-                    stderr_buffer = data if stderr_handler is None else stderr_handler(data)
+                    stderr_buffer = self._handle_buffer_data(key.fileobj, data, stderr_handler, stdout_handler)
         except KeyboardInterrupt:
             main_logger.info("Stopped subprocess monitor")
         return stderr_buffer, stdout_buffer
+
+    def _drain_buffer_data(self, process_handle, buffer_handler: BufferHandler, monitor_frequency_secs=0.1):
+        """
+        Reads the buffers of the exited process until EOF. A buffer that is still held open, e.g. by a child of the
+        process, is read until it has no new data within 'monitor_frequency_secs'.
+        """
+        while self._selector.get_map():
+            events = self._selector.select(timeout=monitor_frequency_secs)
+            if not events:
+                return
+            for key, _ in events:
+                data = key.fileobj.read1(READ_CHUNK_SIZE)
+                if data:
+                    self._handle_buffer_data(key.fileobj, data, buffer_handler.stderr_handler,
+                                             buffer_handler.stdout_handler)
+                else:
+                    self._selector.unregister(key.fileobj)
+
+    def _handle_buffer_data(self, fileobj, data: bytes, stderr_handler, stdout_handler) -> Optional[bytes]:
+        # Pass data to the relevant handler and add the result to the respective buffer
+        if fileobj is self._process_handle.stdout:
+            handled = data if stdout_handler is None else stdout_handler(data)
+            output = self._result.stdout
+        else:
+            handled = data if stderr_handler is None else stderr_handler(data)
+            output = self._result.stderr
+        if handled is not None:
+            output.append(handled)
+        return handled
+
+
+class PersistentProcessMonitor(ProcessMonitor):
+    """
+    Keeps the process alive across test cases and only restarts it at the end of a lifetime: the process exited, the
+    buffer handler reached its exit condition (crash) or the process did not write any output within the timeout
+    (hang). The output of lifetime n is written to 'output_dir'/lifetime-n. With a control channel, the broker reports
+    which test cases every lifetime covered.
+    """
+
+    def __init__(self, command, output_dir: Optional[str] = None, control: Optional[BrokerControl] = None):
+        self.lifetime = 1
+        self._control = control
+        super().__init__(command, output_dir)
+
+    def _process_output_dir(self) -> Optional[str]:
+        if self._output_dir is None:
+            return None
+        output_dir = os.path.join(self._output_dir, f"lifetime-{self.lifetime:04d}")
+        os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+
+    def run(self, max_lifetimes: int = Config.PERSISTENT_MAX_LIFETIMES,
+            duration_secs: float = Config.PERSISTENT_DURATION_SECS) -> list[LifetimeResult]:
+        """
+        :param max_lifetimes: the number of lifetimes after which the monitor stops (0 = no limit)
+        :param duration_secs: the time after which the monitor stops, also during a lifetime (-1 = no limit)
+        """
+        results = []
+        deadline = time.monotonic() + duration_secs if duration_secs > -1 else None
+        while True:
+            lifetime_start = time.monotonic()
+            result = self.run_to_completion(deadline)
+            # The test cases of the lifetime are complete, the process is dead and its successor is not started yet
+            test_cases = self._control.end_lifetime(self.lifetime, result.end_reason) if self._control else None
+            results.append(LifetimeResult(self.lifetime, result.end_reason, result.return_code,
+                                          result.buffer_handler_result, result.is_failure,
+                                          time.monotonic() - lifetime_start, test_cases))
+            main_logger.info(f"Lifetime {self.lifetime} ended ({result.end_reason}) after "
+                             f"{results[-1].duration_secs:.1f} s: {'FAILURE' if result.is_failure else 'ok'}, "
+                             f"RETURN: {result.return_code} {result.buffer_handler_result}" +
+                             (f", {test_cases['test_cases']} test cases" if test_cases else ""))
+
+            if 0 < max_lifetimes <= self.lifetime or result.reached_deadline:
+                return results
+            self.lifetime += 1
+            self._restart_process()
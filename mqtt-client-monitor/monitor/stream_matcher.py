@@ -0,0 +1,77 @@
+import re
+from dataclasses import dataclass
+from typing import Sequence
+
+from config import Config
+
+
+@dataclass
+class StreamMatch:
+    pattern: str
+    # Offset of the match from the start of the stream
+    offset: int
+    data: bytes
+
+
+class StreamMatcher:
+    """
+    Searches a byte stream chunk by chunk for a set of regex patterns without decoding it. The matches are reported
+    like the matches of one alternation of all patterns: leftmost first, the first pattern wins at the same offset and
+    matches do not overlap. The patterns are compiled and searched one by one though, an alternation would disable the
+    fast literal search of the regex engine and is about ten times slower.
+    The last 'overlap' bytes of the stream are searched again together with the next chunk, so that matches of up to
+    'overlap' bytes that are split across two chunks are found as well. Every match is reported once.
+    """
+
+    def __init__(self, patterns: Sequence[str], overlap: int = Config.REGEX_MAX_MATCH_BYTES):
+        self._patterns = list(patterns)
+        self._regexes = [re.compile(pattern.encode()) for pattern in self._patterns]
+        self._overlap = overlap
+        self._window = b""
+        # Stream offset of the first byte of the window
+        self._window_offset = 0
+        # Stream offset after the last reported match
+        self._reported_end = 0
+
+    @property
+    def is_empty(self) -> bool:
+        return not self._regexes
+
+    def feed(self, data: bytes, first_only: bool = False) -> list[StreamMatch]:
+        """
+        :param first_only: stop the search of the chunk at the first match
+        :return: the new matches, which end in the given chunk
+        """
+        if not self._regexes or not data:
+            return []
+
+        buffer = self._window + data if self._window else data
+        window_length = len(self._window)
+        position = max(0, self._reported_end - self._window_offset)
+
+        matches = []
+        # The next match of every pattern at or after the position
+        candidates = [regex.search(buffer, position) for regex in self._regexes]
+        while True:
+            index = min((index for index, match in enumerate(candidates) if match),
+                        key=lambda index: candidates[index].start(), default=None)
+            if index is None:
+                break
+            match = candidates[index]
+            position = max(match.end(), match.start() + 1)
+
+            # Matches that end in the window have been reported with the last chunk
+            if match.end() > window_length:
+                matches.append(StreamMatch(self._patterns[index], self._window_offset + match.start(), match.group()))
+                self._reported_end = self._window_offset + match.end()
+                if first_only:
+                    break
+
+            for other, candidate in enumerate(candidates):
+                if candidate and candidate.start() < position:
+                    candidates[other] = self._regexes[other].search(buffer, position)
+
+        keep = min(self._overlap, len(buffer))
+        self._window_offset += len(buffer) - keep
+        self._window = buffer[len(buffer) - keep:] if keep else b""
+        return matches
@@ -1,159 +1,324 @@
-# The core of the TCP receive / send loop is adapted from:
-# J. Seitz and T. Arnold,
-# “Chapter 2. The Network: Basics,” in Black Hat Python: Python programming for hackers and Pentesters,
-# San Francisco: No Starch Press, 2021.
-
+import collections
+import errno
+import os
+import selectors
 import socket
+import time
 from enum import Enum
 
 import logger_factory
 from config import Config
 
-READ_TIMEOUT_PER_BUFFER = 0.1
+# Maximum time in seconds the proxy waits for socket events before it checks the timeouts and the stop flag
+SELECT_TIMEOUT_SECS = 0.1
+RECV_BUFFER_SIZE = 65536
+# Maximum time in seconds to establish the connection to the remote host, independent of the TCP data timeouts
+CONNECT_TIMEOUT_SECS = 5
+# A side is not read while more than this number of bytes wait to be sent to the other side
+MAX_PENDING_BYTES = 4 * 1024 * 1024
+# Maximum number of chunks that are passed to a single sendmsg call
+try:
+    MAX_SEND_SEGMENTS = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    MAX_SEND_SEGMENTS = 1024
 
 LOGGER = logger_factory.get_logger("monitor")
 TCP_FROM_LOCAL_LOGGER = logger_factory.construct_logger("TCP_FROM_LOCAL")
 TCP_FROM_REMOTE_LOGGER = logger_factory.construct_logger("TCP_FROM_REMOTE")
 
 
-class TcpBufferStatus:
-    _iterations_without_new_remote_data = 0
-    _iterations_without_new_local_data = 0
-    isStop = False
+class SocketType(Enum):
+    LOCAL = "local",
+    REMOTE = "remote"
 
-    def record(self, local_buffer, remote_buffer):
-        if len(remote_buffer) == 0:
-            self._iterations_without_new_remote_data += 1
-        else:
-            _iterations_without_new_remote_data = 0
 
-        if len(local_buffer) == 0:
-            self._iterations_without_new_local_data += 1
+class _Pipe:
+    """
+    Forwards the bytes of one direction of a proxied connection. Received chunks are queued as they are and written
+    with scatter/gather sendmsg calls, so the cost per chunk does not depend on the amount of pending data.
+    """
+
+    def __init__(self, source: socket.socket, target: socket.socket, socket_type: SocketType):
+        self.source = source
+        self.target = target
+        self.socket_type = socket_type
+        self._pending = collections.deque()
+        self.pending_bytes = 0
+        # The source has closed its sending side
+        self.source_eof = False
+        # The end of the stream has been forwarded to the target
+        self.closed = False
+        self.last_data = time.monotonic()
+
+    @property
+    def wants_read(self) -> bool:
+        return not self.source_eof and self.pending_bytes < MAX_PENDING_BYTES
+
+    @property
+    def wants_write(self) -> bool:
+        return self.pending_bytes > 0
+
+    def receive(self) -> bool:
+        """
+        Reads the available data of the source and tries to forward it right away
+        :return: False if the connection is broken
+        """
+        try:
+            data = self.source.recv(RECV_BUFFER_SIZE)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+        if not data:
+            self.source_eof = True
         else:
-            _iterations_without_new_local_data = 0
-
+            self.last_data = time.monotonic()
+            match self.socket_type:
+                case SocketType.LOCAL:
+                    data = TcpProxy.default_request_interceptor(data, self.socket_type)
+                case SocketType.REMOTE:
+                    data = TcpProxy.default_response_interceptor(data, self.socket_type)
+            if data:
+                self._pending.append(data)
+                self.pending_bytes += len(data)
+        return self.flush()
+
+    def flush(self) -> bool:
+        """
+        Sends the pending data without blocking and forwards the end of the stream once everything has been sent
+        :return: False if the connection is broken
+        """
+        pending = self._pending
+        try:
+            while pending:
+                segments = pending if len(pending) <= MAX_SEND_SEGMENTS else \
+                    [pending[index] for index in range(MAX_SEND_SEGMENTS)]
+                sent = self.target.sendmsg(segments)
+                self.pending_bytes -= sent
+                while sent:
+                    chunk_length = len(pending[0])
+                    if sent < chunk_length:
+                        pending[0] = memoryview(pending[0])[sent:]
+                        break
+                    sent -= chunk_length
+                    pending.popleft()
+            if self.source_eof and not pending and not self.closed:
+                # Half-close: the other direction keeps working until its source closes as well
+                self.target.shutdown(socket.SHUT_WR)
+                self.closed = True
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            LOGGER.debug(f"Could not send data to target socket: {e.__class__}")
+            return False
+        return True
+
+
+class ProxyConnection:
+    """
+    Proxied connection between the system under test (local) and the broker (remote)
+    """
+
+    def __init__(self, local_socket: socket.socket, remote_socket: socket.socket, address: str,
+                 connecting: bool = False):
+        self.local_socket = local_socket
+        self.remote_socket = remote_socket
+        self.address = address
+        self.upstream = _Pipe(local_socket, remote_socket, SocketType.LOCAL)
+        self.downstream = _Pipe(remote_socket, local_socket, SocketType.REMOTE)
+        # The non-blocking connect to the remote host is in progress, the local side is not read until it completes
+        self.connecting = connecting
+        self.connect_deadline = time.monotonic() + CONNECT_TIMEOUT_SECS
+
+    @property
+    def is_finished(self) -> bool:
+        return self.upstream.closed and self.downstream.closed
+
+    def events(self, sock: socket.socket) -> int:
+        if self.connecting:
+            return selectors.EVENT_WRITE if sock is self.remote_socket else 0
+        reading, writing = (self.upstream, self.downstream) if sock is self.local_socket \
+            else (self.downstream, self.upstream)
+        return (selectors.EVENT_READ if reading.wants_read else 0) | \
+            (selectors.EVENT_WRITE if writing.wants_write else 0)
+
+    def handle(self, sock: socket.socket, events: int) -> bool:
+        """
+        :return: False if the connection is broken
+        """
+        if self.connecting:
+            return self._finish_connect()
+        reading, writing = (self.upstream, self.downstream) if sock is self.local_socket \
+            else (self.downstream, self.upstream)
+        if events & selectors.EVENT_WRITE and not writing.flush():
+            return False
+        if events & selectors.EVENT_READ and not reading.receive():
+            return False
+        return True
+
+    def _finish_connect(self) -> bool:
+        error = self.remote_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            LOGGER.error(f"Could not create connection to remote for {self.address}: {os.strerror(error)}")
+            return False
+        self.connecting = False
+        self.upstream.last_data = self.downstream.last_data = time.monotonic()
+        LOGGER.info(f"Established connection to remote for {self.address}")
+        return True
+
+    def timed_out(self, now: float) -> bool:
+        if self.connecting:
+            if now >= self.connect_deadline:
+                LOGGER.error(f"Could not create connection to remote for {self.address}: timed out")
+                return True
+            return False
         if Config.MAX_REMOTE_TCP_TIMEOUT_SECS > -1 and \
-                self._iterations_without_new_remote_data >= Config.MAX_REMOTE_TCP_TIMEOUT_SECS / READ_TIMEOUT_PER_BUFFER:
-            LOGGER.debug("Stopping proxy due to timeout of remote data.")
-            self.isStop = True
-
+                now - self.downstream.last_data >= Config.MAX_REMOTE_TCP_TIMEOUT_SECS:
+            LOGGER.debug("Closing connection due to timeout of remote data.")
+            return True
         if Config.MAX_LOCAL_TCP_TIMEOUT_SECS > -1 and \
-                self._iterations_without_new_local_data >= Config.MAX_LOCAL_TCP_TIMEOUT_SECS / READ_TIMEOUT_PER_BUFFER:
-            LOGGER.debug("Stopping proxy due to timeout of local data.")
-            self.isStop = True
+                now - self.upstream.last_data >= Config.MAX_LOCAL_TCP_TIMEOUT_SECS:
+            LOGGER.debug("Closing connection due to timeout of local data.")
+            return True
+        return False
+
+    def close(self):
+        self.local_socket.close()
+        self.remote_socket.close()
 
 
 class TcpProxy:
+    """
+    Event-driven TCP proxy: a selector waits on all sockets and forwards the data of either side as soon as it is
+    readable. Every system under test that connects gets its own connection to the remote broker. Both directions are
+    closed independently (half-close), a connection ends when both sides have closed or a TCP timeout is reached.
+    """
     _local_host: str
     _local_port: int
     _remote_host: str
     _remote_port: int
 
-    _internal_server_socket = None
-    _local_socket = None
-    _remote_socket = None
-
     def __init__(self, local_host: str,
                  local_port: int,
                  remote_host: str,
-                 remote_port: int):
+                 remote_port: int,
+                 autostart: bool = True):
         self._local_host = local_host
         self._local_port = local_port
         self._remote_host = remote_host
         self._remote_port = remote_port
-        self.start()
+        # The internal socket to which the system under test connects listens as soon as the proxy is created, even if
+        # the server loop is started later in another thread
+        self._internal_server_socket = socket.create_server((local_host, local_port))
+        self._internal_server_socket.setblocking(False)
+        self._connections: dict[socket.socket, ProxyConnection] = {}
+        self._selector = selectors.DefaultSelector()
+        self._closed = False
+        if autostart:
+            self.start()
 
     def __del__(self):
-        LOGGER.debug(f"Closing all sockets")
-
-        # Close potentially remaining sockets
-        if self._remote_socket is not None:
-            self._remote_socket.close()
+        self.close()
 
-        if self._local_socket is not None:
-            self._local_socket.close()
-
-        if self._internal_server_socket is not None:
-            self._internal_server_socket.close()
+    def close(self):
+        """
+        Stops the proxy, e.g. from another thread after the monitored process has finished
+        """
+        self._closed = True
 
     def start(self):
         self._server_loop(self._local_host, self._local_port)
 
     def _server_loop(self, local_host: str, local_port: int):
-        # Set up the internal socket to which the system under test connects
-        self._internal_server_socket = socket.create_server((local_host, local_port))
+        self._selector.register(self._internal_server_socket, selectors.EVENT_READ)
         LOGGER.info(f"Waiting for connection on {local_host}:{local_port}")
-        self._local_socket, addr = self._internal_server_socket.accept()
-        LOGGER.info(f"Received connection from {addr[0]}:{addr[1]}")
-
-        if not self._remote_socket:
-            # Define the remote socket used for forwarding requests
-            self._remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-            # Establish a connection to the remote host
-            try:
-                self._remote_socket.connect((self._remote_host, self._remote_port))
-            except:
-                LOGGER.exception(f"Could not create connection to remote at {self._remote_host}:{self._remote_port}")
-                return
+        try:
+            while not self._closed:
+                for key, events in self._selector.select(SELECT_TIMEOUT_SECS):
+                    if key.fileobj is self._internal_server_socket:
+                        self._accept()
+                    elif key.fileobj in self._connections:
+                        self._handle(key.fileobj, events)
+
+                now = time.monotonic()
+                # Every connection is registered with both of its sockets
+                for connection in set(self._connections.values()):
+                    if connection.timed_out(now):
+                        self._close_connection(connection)
+        finally:
+            LOGGER.debug("Closing all sockets")
+            for connection in set(self._connections.values()):
+                self._close_connection(connection)
+            self._selector.close()
+            self._internal_server_socket.close()
 
-            LOGGER.info(f"Established connection to remote at {self._remote_host}:{self._remote_port}")
+    def _accept(self):
+        try:
+            local_socket, addr = self._internal_server_socket.accept()
+        except BlockingIOError:
+            return
+        address = f"{addr[0]}:{addr[1]}"
+        LOGGER.info(f"Received connection from {address}")
 
+        # Establish a connection to the remote host for the new client without blocking the other connections
+        try:
+            family, socket_type, proto, _, remote_address = socket.getaddrinfo(
+                self._remote_host, self._remote_port, type=socket.SOCK_STREAM)[0]
+            remote_socket = socket.socket(family, socket_type, proto)
+        except OSError:
+            LOGGER.exception(f"Could not create connection to remote at {self._remote_host}:{self._remote_port}")
+            local_socket.close()
+            return
+        remote_socket.setblocking(False)
+        error = remote_socket.connect_ex(remote_address)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            LOGGER.error(f"Could not create connection to remote at {self._remote_host}:{self._remote_port}: "
+                         f"{os.strerror(error)}")
+            remote_socket.close()
+            local_socket.close()
+            return
+
+        local_socket.setblocking(False)
+        connection = ProxyConnection(local_socket, remote_socket, address, connecting=error != 0)
+        self._connections[local_socket] = connection
+        self._connections[remote_socket] = connection
+        self._update_events(connection, local_socket)
+        self._update_events(connection, remote_socket)
         LOGGER.info("Monitoring TCP connection...")
-        self._proxy_handler(self._local_socket)
-
-    def _proxy_handler(self, local_socket):
-        status = TcpBufferStatus()
-        # Continually read from local and remote and forward to the other socket
-        while not status.isStop:
-            local_buffer = TcpProxy._receive_from_socket(local_socket)
-            TcpProxy._send_data(local_buffer, SocketType.LOCAL, self._remote_socket)
 
-            # Receive the response and send it to the client
-            remote_buffer = TcpProxy._receive_from_socket(self._remote_socket)
-            TcpProxy._send_data(remote_buffer, SocketType.REMOTE, local_socket)
-
-            status.record(local_buffer, remote_buffer)
-
-    @classmethod
-    def _send_data(cls, buffer, socket_type, target_socket: socket):
-        if len(buffer):
-            match socket_type:
-                case SocketType.LOCAL:
-                    modified_buffer = TcpProxy.default_request_interceptor(buffer, socket_type)
-                case SocketType.REMOTE:
-                    modified_buffer = TcpProxy.default_response_interceptor(buffer, socket_type)
-                case _:
-                    # Should never be reached
-                    raise ValueError(f"Invalid socket type {type}")
-
-            try:
-                target_socket.sendall(modified_buffer)
-            except Exception as e:
-                LOGGER.debug(f"Could not send data to target socket: {e.__class__}")
-                exit()
-
-    @classmethod
-    def _receive_from_socket(cls, connection):
-        buffer = b""
-
-        # Wait for a maximum of X seconds to receive new data on the buffer
-        connection.settimeout(READ_TIMEOUT_PER_BUFFER)
+    def _handle(self, sock: socket.socket, events: int):
+        connection = self._connections[sock]
+        if not connection.handle(sock, events) or connection.is_finished:
+            self._close_connection(connection)
+            return
+        for connection_socket in (connection.local_socket, connection.remote_socket):
+            self._update_events(connection, connection_socket)
+
+    def _update_events(self, connection: ProxyConnection, sock: socket.socket):
+        events = connection.events(sock)
+        registered = sock in self._selector.get_map()
+        if events and registered:
+            self._selector.modify(sock, events)
+        elif events:
+            self._selector.register(sock, events)
+        elif registered:
+            # e.g. a half-closed side without data to send to it
+            self._selector.unregister(sock)
+
+    def _unregister(self, sock: socket.socket):
         try:
-            while True:
-                # Blocking read data in blocks of X bytes
-                data = connection.recv(4096)
-
-                if not data:
-                    break
-
-                buffer += data
-        except socket.timeout:
-            pass
-        except ConnectionResetError:
+            self._selector.unregister(sock)
+        except KeyError:
             pass
 
-        return buffer
+    def _close_connection(self, connection: ProxyConnection):
+        LOGGER.info(f"Closing connection from {connection.address}")
+        for sock in (connection.local_socket, connection.remote_socket):
+            self._unregister(sock)
+            self._connections.pop(sock, None)
+        connection.close()
 
     @classmethod
     def default_request_interceptor(cls, buffer, socket_type):
@@ -164,8 +329,3 @@ class TcpProxy:
     def default_response_interceptor(cls, buffer, socket_type):
         TCP_FROM_REMOTE_LOGGER.debug(f"{buffer}")
         return buffer
-
-
-class SocketType(Enum):
-    LOCAL = "local",
-    REMOTE = "remote"